@@ -0,0 +1,124 @@
+"""Insert rate, lookup latency, memory and snapshot cost of the fraud engine's linking index.
+
+Feeds ``--transactions`` synthetic transactions through ``LinkIndex.observe``.
+Each names a user, one of that user's one or two devices, and an IP from a
+pool shared by ``--users-per-ip`` users on average; a ``--ring-share`` of
+transactions reuse a device from a small set of ring devices instead. Each
+transaction makes two links (user-device, then the IP), so 10M transactions
+are 20M edges.
+
+Reported:
+  insert        transactions and edges per second through ``observe``
+  lookup        p50/p99/p999 of ``lookup`` on random known users, one call per sample
+  memory        bytes per entity held by the hash dict, its ints and the array columns
+  snapshot      ``snapshot`` + ``write_snapshot`` and ``LinkIndex.load`` times, file size
+
+    python benchmarks/fraud_linking_bench.py [--transactions 1000000] [--lookups 200000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "fraud_engine"))
+
+from linking import USER, LinkIndex, write_snapshot  # noqa: E402
+
+
+def _transactions(count: int, users: int, args: argparse.Namespace):
+    rng = random.Random(args.seed)
+    ips = max(1, users // args.users_per_ip)
+    ring_devices = [f"ring-device-{i}" for i in range(32)]
+    for _ in range(count):
+        user = rng.randrange(users)
+        if rng.random() < args.ring_share:
+            device = rng.choice(ring_devices)
+        else:
+            device = f"device-{user}-{rng.randrange(2)}"
+        # Mostly the user's home address, sometimes any other one.
+        ip = rng.randrange(ips) if rng.random() < args.roaming else user // args.users_per_ip
+        yield f"user-{user}", device, f"10.{ip >> 16 & 255}.{ip >> 8 & 255}.{ip & 255}"
+
+
+def _memory(index: LinkIndex) -> int:
+    """Bytes held by the hash dict, its key and value ints, and the columns."""
+    total = sys.getsizeof(index._index)
+    total += sum(sys.getsizeof(key) + sys.getsizeof(node) for key, node in index._index.items())
+    return total + sum(column.buffer_info()[1] * column.itemsize for column in index._columns())
+
+
+def _percentile(samples: list[int], fraction: float) -> float:
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))] / 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--transactions", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=0, help="distinct users (default: transactions / 4)")
+    parser.add_argument("--users-per-ip", type=int, default=8)
+    parser.add_argument("--ring-share", type=float, default=0.001)
+    parser.add_argument("--roaming", type=float, default=0.01)
+    parser.add_argument("--lookups", type=int, default=200_000)
+    parser.add_argument("--max-cluster", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    users = args.users or max(1, args.transactions // 4)
+
+    # Materialised first so generating the strings is not timed.
+    transactions = list(_transactions(args.transactions, users, args))
+
+    index = LinkIndex(args.max_cluster)
+    observe = index.observe
+    started = time.perf_counter()
+    for user_id, device_id, user_ip in transactions:
+        observe(user_id, device_id, user_ip)
+    elapsed = time.perf_counter() - started
+    entities = len(index)
+    print(
+        f"insert    {args.transactions / elapsed:12,.0f} transactions/s  {2 * args.transactions / elapsed:12,.0f} edges/s"
+        f"  ({entities:,} entities, {index.skipped_merges:,} merges skipped)"
+    )
+    memory = _memory(index)
+    print(f"memory    {memory / entities:12.1f} bytes/entity  ({memory / 2**20:,.1f} MiB)")
+
+    rng = random.Random(args.seed + 1)
+    lookup = index.lookup
+    samples = []
+    largest = 0
+    for _ in range(args.lookups):
+        user_id = f"user-{rng.randrange(users)}"
+        start = time.perf_counter_ns()
+        features = lookup(USER, user_id)
+        samples.append(time.perf_counter_ns() - start)
+        if features is not None:
+            largest = max(largest, features.size)
+    samples.sort()
+    print(
+        f"lookup    p50 {_percentile(samples, 0.5):7.2f} us  p99 {_percentile(samples, 0.99):7.2f} us"
+        f"  p999 {_percentile(samples, 0.999):7.2f} us  (largest cluster seen: {largest:,})"
+    )
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "links.snap")
+        started = time.perf_counter()
+        columns = index.snapshot()
+        copied = time.perf_counter() - started
+        write_snapshot(columns, path)
+        written = time.perf_counter() - started
+        started = time.perf_counter()
+        loaded = LinkIndex.load(path, args.max_cluster)
+        load_seconds = time.perf_counter() - started
+        assert len(loaded) == entities
+        print(
+            f"snapshot  copy {copied * 1000:8.1f} ms  write {written * 1000:8.1f} ms  load {load_seconds * 1000:8.1f} ms"
+            f"  ({os.path.getsize(path) / 2**20:,.1f} MiB)"
+        )
+
+
+if __name__ == "__main__":
+    main()
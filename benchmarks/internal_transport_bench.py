@@ -0,0 +1,151 @@
+"""Per-call overhead and connection count of HTTP/1.1 vs h2c internal calls under load.
+
+Starts the fraud engine through ``shared.serve`` once per mode and runs
+``--concurrency`` concurrent "payments" against it. Each payment makes
+``--calls`` sequential POST /score calls, like the order fetch, fraud check
+and status update of a real payment. The client is ``shared.transport.internal_client``,
+the one the orchestrator uses.
+
+Modes:
+  http1            uvicorn, HTTP/1.1 keep-alive pool (the default deployment)
+  http1-hypercorn  hypercorn, HTTP/1.1: same server as http2, isolates the protocol
+  http2            hypercorn, cleartext HTTP/2 with prior knowledge
+
+Connections are sampled from the client pool every 10 ms; the peak is reported.
+
+    python benchmarks/internal_transport_bench.py [--concurrency 1000] [--rounds 3]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "services"))
+
+from shared import transport  # noqa: E402
+
+MODES = {
+    "http1": ("http1", "uvicorn"),
+    "http1-hypercorn": ("http1", "hypercorn"),
+    "http2": ("http2", "hypercorn"),
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_server(server: str, port: int) -> subprocess.Popen:
+    env = os.environ | {
+        "PYTHONPATH": os.path.join(ROOT, "services"),
+        "LOG_LEVEL": "WARNING",
+        "TRACE_EXPORTER": "none",
+    }
+    server_transport = "http2" if server == "hypercorn" else "http1"
+    process = subprocess.Popen(
+        [sys.executable, "-m", "shared.serve", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--transport", server_transport],
+        cwd=os.path.join(ROOT, "services", "fraud_engine"),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1.0).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.kill()
+    raise TimeoutError(f"{server} did not start")
+
+
+async def _drive(url: str, client_transport: str, concurrency: int, calls: int, rounds: int) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    peak = 0
+    async with transport.internal_client(client_transport, timeout=60.0) as client:
+        pool = client._transport._pool  # httpcore pool; private, read-only here
+
+        async def sample() -> None:
+            nonlocal peak
+            while True:
+                peak = max(peak, len(pool.connections))
+                await asyncio.sleep(0.01)
+
+        async def payment(index: int) -> None:
+            nonlocal errors
+            for _ in range(calls):
+                start = time.perf_counter()
+                try:
+                    response = await client.post(url, json={"amount": 1000 + index, "device_id": f"user-{index}"})
+                    response.raise_for_status()
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+        # Warm-up opens the connections so the first round is not all handshakes.
+        await asyncio.gather(*(payment(i) for i in range(min(concurrency, 50))))
+        latencies.clear()
+        sampler = asyncio.create_task(sample())
+        started = time.perf_counter()
+        for _ in range(rounds):
+            await asyncio.gather(*(payment(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        sampler.cancel()
+
+    latencies.sort()
+    count = len(latencies)
+    return {
+        "calls": count,
+        "errors": errors,
+        "calls_per_s": count / elapsed,
+        "mean_ms": sum(latencies) / count * 1000 if count else 0.0,
+        "p50_ms": latencies[count // 2] * 1000 if count else 0.0,
+        "p99_ms": latencies[min(count - 1, int(count * 0.99))] * 1000 if count else 0.0,
+        "peak_connections": peak,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    parser.add_argument("--concurrency", type=int, default=1000)
+    parser.add_argument("--calls", type=int, default=3, help="sequential internal calls per payment")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'mode':16s} {'calls/s':>9s} {'mean ms':>8s} {'p50 ms':>7s} {'p99 ms':>8s} {'conns':>6s} {'errors':>6s}")
+    for mode in args.modes:
+        client_transport, server = MODES[mode]
+        port = _free_port()
+        process = _start_server(server, port)
+        try:
+            row = asyncio.run(
+                _drive(f"http://127.0.0.1:{port}/score", client_transport, args.concurrency, args.calls, args.rounds)
+            )
+        finally:
+            process.send_signal(signal.SIGTERM)
+            process.wait(timeout=30)
+        print(
+            f"{mode:16s} {row['calls_per_s']:9.0f} {row['mean_ms']:8.2f} {row['p50_ms']:7.2f} {row['p99_ms']:8.2f} "
+            f"{row['peak_connections']:6d} {row['errors']:6d}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Request overhead of the logging setups, driven in-process through ASGI.
+
+The handler logs like the payment path (several INFO lines with arguments,
+one of them a PAN-bearing message that must be redacted) and is called via
+``httpx.ASGITransport`` so middleware and routing costs are included.
+
+Modes:
+  off     root level WARNING, nothing emitted
+  basic   the old ``logging.basicConfig`` text handler, synchronous f-strings
+  queue   ``shared.log.configure_logging`` (JSON, lazy args, writer thread)
+
+Output goes to a temporary file so writes are real syscalls. ``--sink-latency-us``
+adds a sleep per write to model a stdout pipe that is slow to drain (container
+log driver under load): ``basic`` then stalls the event loop, ``queue`` does not.
+
+    python benchmarks/logging_overhead_bench.py [--requests 5000] [--sink-latency-us 50]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services"))
+
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+
+from shared import log  # noqa: E402
+
+logger = logging.getLogger("bench")
+MODE = {"name": "off"}
+
+
+class SlowSink:
+    def __init__(self, path: str, latency: float) -> None:
+        self._handle = open(path, "a", encoding="utf-8")
+        self._latency = latency
+
+    def write(self, data: str) -> int:
+        if self._latency:
+            time.sleep(self._latency)
+        return self._handle.write(data)
+
+    def flush(self) -> None:
+        self._handle.flush()
+
+    def close(self) -> None:
+        self._handle.close()
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/payments")
+    async def pay(payload: dict) -> dict:
+        order_id, user_id, amount = payload["order_id"], payload["user_id"], payload["amount"]
+        if MODE["name"] == "basic":
+            logger.info(f"[PAYMENT] Orchestrating payment for order {order_id}, user {user_id}")
+            logger.info(f"[PAYMENT] Order details: amount={amount}, currency=VND")
+            logger.info(f"[PAYMENT] Sending charge to PSP for order {order_id}")
+            logger.info(f"[PAYMENT] PSP charge succeeded for card 4111111111111111: pi_{order_id}")
+            logger.info(f"[PAYMENT] Payment intent saved to database for order {order_id}")
+            logger.debug(f"[PAYMENT] Receipt payload {payload}")
+        else:
+            logger.info("[PAYMENT] Orchestrating payment for order %s, user %s", order_id, user_id)
+            logger.info("[PAYMENT] Order details: amount=%s, currency=%s", amount, "VND")
+            logger.info("[PAYMENT] Sending charge to PSP for order %s", order_id)
+            logger.info("[PAYMENT] PSP charge succeeded for card %s: pi_%s", "4111111111111111", order_id)
+            logger.info("[PAYMENT] Payment intent saved to database for order %s", order_id)
+            logger.debug("[PAYMENT] Receipt payload %s", payload)
+        return {"status": "SUCCESS"}
+
+    return app
+
+
+def configure(mode: str, path: str, latency: float) -> None:
+    log.shutdown_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    MODE["name"] = mode
+    if mode == "off":
+        root.setLevel(logging.WARNING)
+    elif mode == "basic":
+        handler = logging.StreamHandler(SlowSink(path, latency))
+        handler.setFormatter(logging.Formatter(log.TEXT_FORMAT))
+        root.addHandler(handler)
+        root.setLevel(logging.INFO)
+    else:
+        stdout, sys.stdout = sys.stdout, SlowSink(path, latency)
+        try:
+            log.configure_logging("bench", level="INFO")
+        finally:
+            sys.stdout = stdout
+
+
+async def run(app: FastAPI, requests: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        body = {"order_id": "6f1c2d0e-8a4b-4c55-9d7e-1f2a3b4c5d6e", "user_id": "customer1", "amount": 200000}
+        for _ in range(200):
+            await client.post("/payments", json=body)
+        start = time.perf_counter()
+        for _ in range(requests):
+            await client.post("/payments", json=body)
+        return (time.perf_counter() - start) / requests
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--modes", nargs="+", default=["off", "basic", "queue"])
+    parser.add_argument("--sink-latency-us", type=float, default=0.0)
+    args = parser.parse_args()
+
+    app = build_app()
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in args.modes:
+            configure(mode, os.path.join(tmp, f"{mode}.log"), args.sink_latency_us / 1e6)
+            results[mode] = asyncio.run(run(app, args.requests))
+        log.shutdown_logging()
+        redacted = "4111111111111111" not in open(os.path.join(tmp, "queue.log")).read() if "queue" in results else None
+
+    base = results.get("off")
+    for mode, seconds in results.items():
+        extra = f"  ({(seconds - base) * 1e6:+.1f} us vs off)" if base is not None and mode != "off" else ""
+        print(f"{mode:6s} {seconds * 1e6:8.1f} us/request{extra}")
+    if redacted is not None:
+        print(f"PAN redacted in queue output: {redacted}")
+
+
+if __name__ == "__main__":
+    main()
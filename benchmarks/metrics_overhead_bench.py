@@ -0,0 +1,66 @@
+"""Per-observation cost of the shared Prometheus instruments.
+
+Measures an empty ``with`` block against the same block wrapped in
+``stage_timer`` / ``hsm_op_timer``, and the histogram ``.labels(...).observe``
+lookup the timers avoid. The budget is a few microseconds per observation.
+
+    python benchmarks/metrics_overhead_bench.py [--number 200000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services"))
+
+from shared import metrics  # noqa: E402
+
+_NULL = contextlib.nullcontext()
+
+
+def baseline() -> None:
+    with _NULL:
+        pass
+
+
+def stage() -> None:
+    with metrics.stage_timer("psp"):
+        pass
+
+
+def hsm_op() -> None:
+    with metrics.hsm_op_timer("sign"):
+        pass
+
+
+def labels_lookup() -> None:
+    metrics.PAYMENT_STAGE_SECONDS.labels("psp").observe(0.001)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=200_000)
+    parser.add_argument("--budget-us", type=float, default=3.0, help="fail if a timer exceeds this overhead")
+    args = parser.parse_args()
+
+    results = {}
+    for name, func in (("baseline", baseline), ("stage_timer", stage), ("hsm_op_timer", hsm_op),
+                       ("labels().observe", labels_lookup)):
+        results[name] = min(timeit.repeat(func, number=args.number, repeat=5)) / args.number * 1e6
+
+    for name, cost in results.items():
+        extra = "" if name == "baseline" else f"  (+{cost - results['baseline']:.3f} us)"
+        print(f"{name:18s} {cost:8.3f} us/op{extra}")
+
+    worst = max(results["stage_timer"], results["hsm_op_timer"]) - results["baseline"]
+    if worst > args.budget_us:
+        print(f"timer overhead {worst:.3f} us exceeds budget {args.budget_us} us")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
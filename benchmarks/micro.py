@@ -0,0 +1,374 @@
+"""Micro-benchmarks for the hot per-payment functions, with JSON baselines and a regression gate.
+
+    python benchmarks/micro.py run [--only receipt] [--output benchmarks/baselines/current.json]
+    python benchmarks/micro.py compare benchmarks/baselines/baseline.json benchmarks/baselines/current.json [--threshold 10]
+    python benchmarks/micro.py run --compare benchmarks/baselines/baseline.json
+
+``run`` times every case whose dependencies are present and writes the
+results as JSON. Each case is calibrated to run for at least ``--min-time``
+seconds per repeat, and the best of ``--repeat`` repeats is kept as ns/op.
+Cases that need something unavailable are recorded as skipped with the reason
+and do not fail the run:
+
+  hsm.*                     a SoftHSM token with the service keys (SOFTHSM_MODULE, run inside the orchestrator image)
+  orchestrator.*            the orchestrator's dependencies (pkcs11, stripe)
+  reconciliation.store_receipt
+                            BENCH_DB_WRITES=1 and a migrated Postgres at DATABASE_URL; every call
+                            commits one SUCCESS receipt (signature "bench") and its rollup, so point
+                            it at a scratch database
+
+``compare`` exits with status 1 if any case present in both files is slower
+than the baseline by more than ``--threshold`` percent.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import fnmatch
+import importlib
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import timeit
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SERVICES = os.path.join(ROOT, "services")
+sys.path.insert(0, SERVICES)
+# Per-call log lines and span exports would dominate the fast cases.
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("TRACE_EXPORTER", "none")
+
+# Flat module names every service defines for itself.
+_SERVICE_MODULES = ("main", "schemas", "models", "database")
+
+Bench = Callable[[], Any]
+CASES: dict[str, Callable[[], Bench]] = {}
+
+
+class Skip(Exception):
+    """Raised by a case's setup when its dependencies are not available here."""
+
+
+def case(name: str) -> Callable[[Callable[[], Bench]], Callable[[], Bench]]:
+    def register(setup: Callable[[], Bench]) -> Callable[[], Bench]:
+        CASES[name] = setup
+        return setup
+
+    return register
+
+
+def service_import(service: str, module: str) -> Any:
+    """Import ``module`` from one service directory without clashing with another service's modules."""
+    for name in _SERVICE_MODULES:
+        sys.modules.pop(name, None)
+    path = os.path.join(SERVICES, service)
+    sys.path.insert(0, path)
+    try:
+        return importlib.import_module(module)
+    except ImportError as exc:
+        raise Skip(f"{service}: {exc}") from exc
+    finally:
+        sys.path.remove(path)
+
+
+def run_async(factory: Callable[[], Awaitable[Any]]) -> Bench:
+    """Adapt a coroutine function; the timed loop runs inside one event loop."""
+    loop = asyncio.new_event_loop()
+
+    def call() -> Any:
+        return loop.run_until_complete(factory())
+
+    call.loop = loop  # type: ignore[attr-defined]
+    call.factory = factory  # type: ignore[attr-defined]
+    return call
+
+
+RECEIPT_FIELDS = {
+    "order_id": uuid.UUID("6f1c2d0e-8a4b-4c55-9d7e-1f2a3b4c5d6e"),
+    "amount": 200000,
+    "currency": "VND",
+    "timestamp": datetime(2024, 5, 1, 10, 0, 0, 123456, tzinfo=timezone.utc),
+    "kid": "payment-signing-key",
+}
+PAN = "4111111111111111"
+
+
+@case("token.parse_fingerprint")
+def _token_fingerprint() -> Bench:
+    # The replay guard's token hash: parse_token computes it during the single decode.
+    token_format = service_import("payment_orchestrator", "token_format")
+    signed = token_format.encode_signed(1, int(time.time()), os.urandom(16), os.urandom(16), token_format.FLAG_BCD)
+    token = token_format.encode_text(token_format.encode_binary(signed, os.urandom(token_format.TAG_SIZE)))
+    return lambda: token_format.parse_token(token).fingerprint
+
+
+@case("orchestrator.mask_pan")
+def _mask_pan() -> Bench:
+    main = service_import("payment_orchestrator", "main")
+    return lambda: main.mask_pan(PAN)
+
+
+@case("orchestrator.card_brand")
+def _card_brand() -> Bench:
+    main = service_import("payment_orchestrator", "main")
+    return lambda: main.card_brand("5500000000000004")
+
+
+@case("receipt.serialise_and_encode")
+def _receipt() -> Bench:
+    schemas = service_import("payment_orchestrator", "schemas")
+    from shared import receipts
+
+    envelope = schemas.ReceiptEnvelope(status="SUCCESS", **RECEIPT_FIELDS)
+    extra = {"psp_reference": "pi_mock_0123456789abcdef", "last4": "1111"}
+    return lambda: receipts.encode(envelope.to_serialisable() | extra)
+
+
+@case("order.read_model")
+def _order_read() -> Bench:
+    main = service_import("order", "main")
+    schemas = sys.modules["schemas"]
+    now = datetime.now(timezone.utc)
+    items = [{"sku": f"SKU-{index}", "quantity": 2, "price": 50000} for index in range(3)]
+    order_id = uuid.uuid4()
+
+    def build() -> Any:
+        return schemas.OrderRead(
+            id=order_id,
+            user_id="customer1",
+            amount=300000,
+            currency="VND",
+            status="CREATED",
+            items=main._load_items(items),
+            payment_token=None,
+            notes=None,
+            created_at=now,
+            updated_at=now,
+        )
+
+    return build
+
+
+@case("fraud.score_asgi")
+def _fraud_score() -> Bench:
+    import httpx
+
+    main = service_import("fraud_engine", "main")
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://fraud")
+    body = {"amount": 200000, "device_id": "customer1"}
+
+    async def score() -> Any:
+        response = await client.post("/score", json=body)
+        response.raise_for_status()
+        return response
+
+    return run_async(score)
+
+
+@case("fraud.link_observe")
+def _fraud_link_observe() -> Bench:
+    linking = service_import("fraud_engine", "linking")
+    index = linking.LinkIndex()
+    for i in range(50_000):
+        index.observe(f"user-{i}", f"device-{i}", f"10.0.{i >> 8 & 255}.{i & 255}")
+    transactions = itertools.cycle(
+        [(f"user-{i}", f"device-{i}", f"10.0.{i >> 8 & 255}.{i & 255}") for i in range(0, 50_000, 7)]
+    )
+
+    def observe() -> Any:
+        return index.observe(*next(transactions))
+
+    return observe
+
+
+def _hsm() -> Any:
+    hsm_service = service_import("payment_orchestrator", "hsm_service")
+    try:
+        hsm_service.sign_message(b"probe")
+        hsm_service.decrypt_token(hsm_service.encrypt_token(PAN.encode("ascii")))
+    except Exception as exc:  # noqa: BLE001 - any HSM failure means "not here"
+        raise Skip(f"HSM unavailable: {exc}") from exc
+    return hsm_service
+
+
+@case("hsm.encrypt_token")
+def _hsm_encrypt() -> Bench:
+    hsm_service = _hsm()
+    return lambda: hsm_service.encrypt_token(PAN.encode("ascii"))
+
+
+@case("hsm.decrypt_token")
+def _hsm_decrypt() -> Bench:
+    hsm_service = _hsm()
+    token = hsm_service.encrypt_token(PAN.encode("ascii"))
+    return lambda: hsm_service.decrypt_token(token)
+
+
+@case("hsm.sign_message")
+def _hsm_sign() -> Bench:
+    hsm_service = _hsm()
+    schemas = service_import("payment_orchestrator", "schemas")
+    from shared import receipts
+
+    message = receipts.encode(schemas.ReceiptEnvelope(status="SUCCESS", **RECEIPT_FIELDS).to_serialisable())
+    return lambda: hsm_service.sign_message(message)
+
+
+@case("reconciliation.store_receipt")
+def _store_receipt() -> Bench:
+    # Opt-in: the receipts are real rows and count towards the daily rollups.
+    if os.getenv("BENCH_DB_WRITES", "").lower() not in {"1", "true", "yes"}:
+        raise Skip("writes to reconciliation_receipts; set BENCH_DB_WRITES=1 against a scratch database")
+    main = service_import("reconciliation", "main")
+    from sqlalchemy import text
+
+    try:
+        with main.engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        main.verify_schema()
+    except Exception as exc:  # noqa: BLE001 - no database, or not migrated
+        raise Skip(f"Postgres unavailable: {exc}") from exc
+    from shared import receipts
+
+    def store() -> None:
+        # A fresh order id per call: the duplicate path would measure an IntegrityError instead.
+        receipt = {
+            "order_id": str(uuid.uuid4()),
+            "amount": 200000,
+            "currency": "VND",
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "status": "SUCCESS",
+            "kid": "payment-signing-key",
+        }
+        receipt_bytes = receipts.encode(receipt)
+        main.store_receipt({"receipt": receipt, "signature": "bench"}, receipt_bytes)
+
+    return store
+
+
+def measure(bench: Bench, min_time: float, repeat: int) -> dict[str, float]:
+    factory = getattr(bench, "factory", None)
+    if factory is not None:
+        loop = bench.loop  # type: ignore[attr-defined]
+
+        async def batch(number: int) -> float:
+            start = time.perf_counter()
+            for _ in range(number):
+                await factory()
+            return time.perf_counter() - start
+
+        def timed(number: int) -> float:
+            return loop.run_until_complete(batch(number))
+    else:
+        timer = timeit.Timer(bench)
+        timed = timer.timeit
+
+    timed(1)  # warm-up: lazy imports, first connection, JIT-ish caches
+    number = 1
+    while True:
+        elapsed = timed(number)
+        if elapsed >= min_time:
+            break
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9) * 1.2))
+    samples = sorted([elapsed] + [timed(number) for _ in range(repeat - 1)])
+    per_op = [sample / number * 1e9 for sample in samples]
+    return {
+        "ns_per_op": per_op[0],
+        "median_ns": per_op[len(per_op) // 2],
+        "max_ns": per_op[-1],
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def run(args: argparse.Namespace) -> dict:
+    results: dict[str, dict] = {}
+    skipped: dict[str, str] = {}
+    for name, setup in CASES.items():
+        if args.only and not any(fnmatch.fnmatch(name, f"*{pattern}*") for pattern in args.only):
+            continue
+        try:
+            bench = setup()
+        except Skip as exc:
+            skipped[name] = str(exc).splitlines()[0]
+            print(f"{name:32s} skipped: {skipped[name]}")
+            continue
+        results[name] = measure(bench, args.min_time, args.repeat)
+        row = results[name]
+        print(f"{name:32s} {row['ns_per_op']:12,.0f} ns/op  (median {row['median_ns']:,.0f}, n={row['number']})")
+    return {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()} {platform.node()}",
+        "results": results,
+        "skipped": skipped,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> bool:
+    """Print the per-case change; returns False if any case regressed beyond ``threshold`` percent."""
+    ok = True
+    print(f"{'case':32s} {'baseline ns':>14s} {'current ns':>14s} {'change':>8s}")
+    for name, base in baseline["results"].items():
+        now = current["results"].get(name)
+        if now is None:
+            print(f"{name:32s} {base['ns_per_op']:14,.0f} {'-':>14s} {'missing':>8s}")
+            continue
+        change = (now["ns_per_op"] - base["ns_per_op"]) / base["ns_per_op"] * 100
+        regressed = change > threshold
+        ok &= not regressed
+        print(
+            f"{name:32s} {base['ns_per_op']:14,.0f} {now['ns_per_op']:14,.0f} {change:+7.1f}%"
+            + ("  REGRESSION" if regressed else "")
+        )
+    for name in current["results"].keys() - baseline["results"].keys():
+        print(f"{name:32s} {'-':>14s} {current['results'][name]['ns_per_op']:14,.0f} {'new':>8s}")
+    return ok
+
+
+def _load(path: str) -> dict:
+    with open(path, encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="time the cases and write a JSON result file")
+    run_parser.add_argument("--only", nargs="+", help="substring patterns of case names to run")
+    run_parser.add_argument("--min-time", type=float, default=0.2, help="seconds per repeat")
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--output", default=os.path.join(ROOT, "benchmarks", "baselines", "current.json"))
+    run_parser.add_argument("--compare", metavar="BASELINE", help="compare against this file after the run")
+    run_parser.add_argument("--threshold", type=float, default=10.0, help="allowed slowdown in percent")
+    compare_parser = commands.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=10.0, help="allowed slowdown in percent")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        result = run(args)
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(result, handle, indent=2, sort_keys=True)
+            handle.write("\n")
+        print(f"wrote {args.output}")
+        if not args.compare:
+            return
+        baseline, current = _load(args.compare), result
+    else:
+        baseline, current = _load(args.baseline), _load(args.current)
+    if not compare(baseline, current, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
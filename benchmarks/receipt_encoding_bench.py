@@ -0,0 +1,101 @@
+"""Per-payment receipt serialization cost: three json.dumps calls vs one canonical encode.
+
+Producer side (orchestrator, after the PSP charge):
+  legacy     json.dumps(sort_keys) to sign, json.dumps(payload) for the queue,
+             json.dumps(receipt) again when SQLAlchemy binds the JSONB column
+  canonical  shared.receipts.encode once; the queue body is spliced around
+             those bytes and the column receives them as RawJSON
+
+Consumer side (reconciliation worker, per message):
+  legacy     json.loads(body), json.dumps(sort_keys) to rebuild the signed
+             bytes, json.dumps(receipt) to bind the JSON column
+  canonical  slice the signed bytes out of the body, json.loads them once
+
+Signing and I/O are excluded; only the serialization work is timed.
+
+    python benchmarks/receipt_encoding_bench.py [--number 200000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services"))
+
+from shared import receipts  # noqa: E402
+from shared.db import RawJSON, json_serializer  # noqa: E402
+
+RECEIPT = {
+    "order_id": "6f1c2d0e-8a4b-4c55-9d7e-1f2a3b4c5d6e",
+    "amount": 200000,
+    "currency": "VND",
+    "timestamp": "2024-05-01T10:00:00.123456+00:00",
+    "status": "SUCCESS",
+    "kid": "payment-signing-key",
+    "provider": "mock",
+    "psp_reference": "pi_3PBx2mKZ9q8Xy7Wv1a2b3c4d",
+    "last4": "1111",
+}
+SIGNATURE = base64.b64encode(os.urandom(64)).decode("ascii")
+
+
+def legacy_produce() -> tuple[bytes, bytes, str]:
+    message = json.dumps(RECEIPT, sort_keys=True).encode("utf-8")
+    body = json.dumps({"receipt": RECEIPT, "signature": SIGNATURE}).encode("utf-8")
+    stored = json.dumps(RECEIPT)
+    return message, body, stored
+
+
+def canonical_produce() -> tuple[bytes, bytes, str]:
+    message = receipts.encode(RECEIPT)
+    body = receipts.message_body(message, SIGNATURE)
+    stored = json_serializer(RawJSON(message.decode("utf-8")))
+    return message, body, stored
+
+
+def legacy_consume(body: bytes) -> tuple[dict, bytes, str]:
+    payload = json.loads(body.decode("utf-8"))
+    receipt = payload["receipt"]
+    message = json.dumps(receipt, sort_keys=True).encode("utf-8")
+    return receipt, message, json.dumps(receipt)
+
+
+def canonical_consume(body: bytes) -> tuple[dict, bytes, str]:
+    message, _signature = receipts.split_message(body)
+    receipt = json.loads(message)
+    return receipt, message, json_serializer(RawJSON(message.decode("utf-8")))
+
+
+def _per_call(func, number: int) -> float:
+    return min(timeit.repeat(func, number=number, repeat=5)) / number
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=200_000)
+    args = parser.parse_args()
+
+    legacy_message, legacy_body, _ = legacy_produce()
+    message, body, stored = canonical_produce()
+    assert canonical_consume(body)[1] == message and stored == message.decode("utf-8")
+    assert canonical_consume(body)[0] == RECEIPT == legacy_consume(legacy_body)[0]
+
+    rows = [
+        ("produce", "legacy", _per_call(legacy_produce, args.number)),
+        ("produce", "canonical", _per_call(canonical_produce, args.number)),
+        ("consume", "legacy", _per_call(lambda: legacy_consume(legacy_body), args.number)),
+        ("consume", "canonical", _per_call(lambda: canonical_consume(body), args.number)),
+    ]
+    for side, path, seconds in rows:
+        print(f"{side:8s} {path:10s} {seconds * 1e6:7.2f} us")
+    print(f"queue body: legacy {len(legacy_body)} B, canonical {len(body)} B")
+    print(f"signed bytes: legacy {len(legacy_message)} B, canonical {len(message)} B")
+
+
+if __name__ == "__main__":
+    main()
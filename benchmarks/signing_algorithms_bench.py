@@ -0,0 +1,126 @@
+"""Sign/verify throughput and payload size of the receipt signing algorithms.
+
+Signs a representative receipt with RS256 (RSA-2048), ES256 (P-256) and EdDSA
+(Ed25519) and verifies it through ``shared.signing.verify_signature``, the
+code the reconciliation worker runs. By default the keys are software keys
+from ``cryptography``; SoftHSM uses the same OpenSSL primitives, so the
+relative cost carries over. ``--hsm-versions`` also signs through
+``hsm_service.sign_message`` with key versions that already exist on the
+token (run inside the orchestrator container).
+
+Sizes are the raw signature, its base64 form, and the queue message body
+``{"receipt": ..., "signature": ...}`` that is also stored per receipt.
+
+    python benchmarks/signing_algorithms_bench.py [--seconds 2] [--hsm-versions 1 2 3]
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import Callable
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services"))
+
+from cryptography.hazmat.primitives import hashes  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, padding, rsa  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric.utils import Prehashed, decode_dss_signature  # noqa: E402
+
+from shared import signing  # noqa: E402
+
+RECEIPT = {
+    "order_id": "6f1c2d0e-8a4b-4c55-9d7e-1f2a3b4c5d6e",
+    "amount": 200000,
+    "currency": "VND",
+    "timestamp": "2024-05-01T10:00:00.123456+00:00",
+    "status": "SUCCESS",
+    "kid": "payment-signing-key",
+    "provider": "mock",
+    "psp_reference": "pi_3PBx2mKZ9q8Xy7Wv1a2b3c4d",
+    "last4": "1111",
+}
+
+
+def _software_signers() -> dict[str, tuple[Callable[[bytes], bytes], signing.PublicKey]]:
+    rsa_key = rsa.generate_private_key(65537, 2048)
+    ec_key = ec.generate_private_key(ec.SECP256R1())
+    ed_key = ed25519.Ed25519PrivateKey.generate()
+
+    def sign_es256(data: bytes) -> bytes:
+        # Same shape as the HSM path: hash locally, raw r || s out.
+        digest = hashlib.sha256(data).digest()
+        r, s = decode_dss_signature(ec_key.sign(digest, ec.ECDSA(Prehashed(hashes.SHA256()))))
+        return r.to_bytes(32, "big") + s.to_bytes(32, "big")
+
+    return {
+        signing.RS256: (lambda data: rsa_key.sign(data, padding.PKCS1v15(), hashes.SHA256()), rsa_key.public_key()),
+        signing.ES256: (sign_es256, ec_key.public_key()),
+        signing.EDDSA: (ed_key.sign, ed_key.public_key()),
+    }
+
+
+def _rate(func: Callable[[], object], seconds: float) -> float:
+    func()
+    count, start = 0, time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        for _ in range(10):
+            func()
+        count += 10
+    return count / (time.perf_counter() - start)
+
+
+def _sizes(signature: bytes) -> tuple[int, int, int]:
+    signature_b64 = base64.b64encode(signature).decode("ascii")
+    body = json.dumps({"receipt": RECEIPT, "signature": signature_b64}).encode("utf-8")
+    return len(signature), len(signature_b64), len(body)
+
+
+def _hsm_rows(versions: list[int], message: str, seconds: float) -> list[tuple]:
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "payment_orchestrator"))
+    import hsm_service
+
+    jwks = {jwk["kid"]: jwk for jwk in hsm_service.list_signing_keys()["keys"]}
+    rows = []
+    for version in versions:
+        kid = hsm_service.signing_kid(version)
+        if kid not in jwks:
+            print(f"skipping version {version}: {kid} is not on the token", file=sys.stderr)
+            continue
+        signature = hsm_service.sign_message(message, version)
+        sign_rate = _rate(lambda: hsm_service.sign_message(message, version), seconds)
+        rows.append((f"hsm:{jwks[kid]['alg']}", sign_rate, None, *_sizes(signature)))
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=2.0, help="measurement time per operation")
+    parser.add_argument("--hsm-versions", type=int, nargs="*", default=[])
+    args = parser.parse_args()
+
+    message = json.dumps(RECEIPT, sort_keys=True)
+    data = message.encode("utf-8")
+    rows = []
+    for name, (sign, public_key) in _software_signers().items():
+        signature = sign(data)
+        assert signing.verify_signature(public_key, data, signature), name
+        sign_rate = _rate(lambda: sign(data), args.seconds)
+        verify_rate = _rate(lambda: signing.verify_signature(public_key, data, signature), args.seconds)
+        rows.append((name, sign_rate, verify_rate, *_sizes(signature)))
+    if args.hsm_versions:
+        rows.extend(_hsm_rows(args.hsm_versions, message, args.seconds))
+
+    print(f"{'algorithm':12s} {'sign/s':>10s} {'verify/s':>10s} {'sig B':>6s} {'b64 B':>6s} {'message B':>10s}")
+    for name, sign_rate, verify_rate, raw, b64, body in rows:
+        verify = f"{verify_rate:10.0f}" if verify_rate is not None else f"{'-':>10s}"
+        print(f"{name:12s} {sign_rate:10.0f} {verify} {raw:6d} {b64:6d} {body:10d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Import time of a service's app module, checked against a budget.
+
+    python benchmarks/startup_bench.py [--budget-ms 1000] [--top 15]
+    python benchmarks/startup_bench.py --app-dir services/fraud_engine --module main
+
+Runs ``python -X importtime -c "import main"`` in the service directory
+``--repeat`` times in fresh interpreters and keeps the fastest run. It prints
+the wall-clock time of the interpreter, the cumulative import time of the
+module and the ``--top`` packages by self time (summed over their
+submodules), so a new eager import of a heavy SDK shows up by name. Exits
+with status 1 when the import time exceeds ``--budget-ms``.
+
+Import time is what every gunicorn worker and every new replica pays before
+it can answer ``/health``; connecting to the database, the broker and warming
+the HSM happen after that and are reported by ``/ready``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# "import time:       self |  cumulative | <indent>package"
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def parse_importtime(stderr: str, module: str) -> tuple[int, dict[str, int]]:
+    """Cumulative microseconds of ``import module``, and its self time per top-level package.
+
+    ``-X importtime`` prints a module after everything it imported, so the lines
+    since the previous top-level entry belong to ``module``'s import.
+    """
+    total = 0
+    packages: dict[str, int] = {}
+    pending: list[tuple[int, str]] = []
+    for line in stderr.splitlines():
+        match = _LINE.match(line)
+        if match is None:
+            continue
+        pending.append((int(match.group(1)), match.group(4)))
+        if match.group(3):
+            continue
+        if match.group(4) == module:
+            total += int(match.group(2))
+            for self_us, name in pending:
+                package = name.split(".", 1)[0]
+                packages[package] = packages.get(package, 0) + self_us
+        pending = []
+    return total, packages
+
+
+def measure(app_dir: str, module: str) -> tuple[float, int, dict[str, int]]:
+    env = os.environ | {
+        "PYTHONPATH": os.pathsep.join(filter(None, [os.path.join(ROOT, "services"), os.environ.get("PYTHONPATH")])),
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+        "TRACE_EXPORTER": os.environ.get("TRACE_EXPORTER", "none"),
+    }
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=app_dir,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        errors = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        raise RuntimeError(f"import {module} failed:\n" + "\n".join(errors[-20:]))
+    return (wall, *parse_importtime(result.stderr, module))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app-dir", default=os.path.join(ROOT, "services", "payment_orchestrator"))
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=1000.0)
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    options = parser.parse_args()
+
+    try:
+        runs = [measure(options.app_dir, options.module) for _ in range(options.repeat)]
+    except RuntimeError as exc:
+        print(exc, file=sys.stderr)
+        sys.exit(2)
+    wall, total_us, packages = min(runs, key=lambda run: run[1])
+    import_ms = total_us / 1000
+    top = sorted(packages.items(), key=lambda item: item[1], reverse=True)[: options.top]
+    over_budget = import_ms > options.budget_ms
+
+    if options.json:
+        print(json.dumps({
+            "module": options.module,
+            "app_dir": os.path.relpath(options.app_dir, ROOT),
+            "wall_ms": round(wall * 1000, 1),
+            "import_ms": round(import_ms, 1),
+            "budget_ms": options.budget_ms,
+            "top": {name: round(us / 1000, 1) for name, us in top},
+        }, indent=2))
+    else:
+        print(f"{options.module} in {os.path.relpath(options.app_dir, ROOT)}, best of {options.repeat}")
+        print(f"  interpreter wall time {wall * 1000:8.1f} ms")
+        print(f"  import time           {import_ms:8.1f} ms (budget {options.budget_ms:.0f} ms)")
+        for name, us in top:
+            print(f"    {us / 1000:8.1f} ms  {name}")
+    if over_budget:
+        print(f"import time {import_ms:.0f} ms exceeds the {options.budget_ms:.0f} ms budget", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Parse + hash micro-benchmark for payment token formats.
+
+Compares the original v1 path (split, base64 decode, slice copies, then a
+second pass hashing the text token) against the v2 single-decode parser.
+No HSM is needed; ciphertexts and tags are random bytes of the real sizes.
+
+    python benchmarks/token_format_bench.py [--number 200000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import hashlib
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "payment_orchestrator"))
+
+import token_format  # noqa: E402
+
+
+def legacy_parse_and_hash(token: str) -> tuple[bytes, bytes, str]:
+    if not token.startswith("hsm:v1:"):
+        raise ValueError("unsupported token format")
+    payload = base64.urlsafe_b64decode(token.split(":", 2)[2])
+    iv, ciphertext = payload[:16], payload[16:]
+    return iv, ciphertext, hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=200_000)
+    args = parser.parse_args()
+
+    # 16-digit PAN: v1 encrypts 16 ASCII bytes (2 blocks), v2 BCD-packs to 8 (1 block).
+    v1 = token_format.encode_v1(os.urandom(16), os.urandom(32))
+    v2_signed = token_format.encode_signed(1, int(time.time()), os.urandom(16), os.urandom(16), token_format.FLAG_BCD)
+    v2_binary = token_format.encode_binary(v2_signed, os.urandom(token_format.TAG_SIZE))
+    v2_text = token_format.encode_text(v2_binary)
+
+    cases = {
+        "v1 legacy split+decode+hash": lambda: legacy_parse_and_hash(v1),
+        "v1 via parse_token": lambda: token_format.parse_token(v1),
+        "v2 text parse_token": lambda: token_format.parse_token(v2_text),
+        "v2 binary parse_token": lambda: token_format.parse_token(v2_binary),
+    }
+    print(f"token sizes: v1={len(v1)} chars, v2 text={len(v2_text)} chars, v2 binary={len(v2_binary)} bytes")
+    for name, func in cases.items():
+        best = min(timeit.repeat(func, number=args.number, repeat=5))
+        print(f"{name:32s} {best / args.number * 1e9:8.0f} ns/op  {args.number / best:12,.0f} ops/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""Webhook dispatcher throughput, and isolation of a fast endpoint from a slow one.
+
+Starts a stub receiver under hypercorn that checks each ``Webhook-Signature``
+and answers after an injected delay. The real ``dispatcher.Dispatcher``
+delivers ``--events`` events per endpoint from an in-memory store, over the
+shared client the service uses.
+
+Scenarios:
+  fast        one endpoint answering after ``--fast-ms``
+  fast+slow   the same endpoint next to one answering after ``--slow-ms``
+  fast+flaky  the same endpoint next to one answering 503 half the time
+
+All endpoints are on the stub's one origin, so the slow endpoint also checks
+that endpoints sharing a host do not share a connection. Next to it, the
+fast endpoint should keep its throughput. The flaky endpoint is as busy as
+the fast one, so on a single core the two split the client's CPU.
+
+    python benchmarks/webhook_dispatch_bench.py [--events 2000] [--concurrency 16] [--transport http2]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+
+import httpx
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "services"))
+sys.path.insert(0, os.path.join(ROOT, "services", "webhooks"))
+
+import dispatcher  # noqa: E402
+
+SECRET = "whsec_bench"
+BODY = b'{"data":{"receipt":{"amount":200000,"currency":"VND","status":"SUCCESS"},"signature":"c2lnbmF0dXJl"},' \
+       b'"id":"00000000-0000-0000-0000-000000000000","type":"payment.succeeded"}'
+
+
+async def stub_app(scope: dict, receive, send) -> None:  # noqa: ANN001 - raw ASGI
+    """``POST /<delay ms>/<failure ratio>``: sleep, then 200, or 503 with the given probability."""
+    if scope["type"] != "http":
+        return
+    body = b""
+    more = True
+    while more:
+        message = await receive()
+        body += message.get("body", b"")
+        more = message.get("more_body", False)
+    headers = dict(scope["headers"])
+    signature = headers.get(dispatcher.SIGNATURE_HEADER.lower().encode(), b"").decode()
+    delay_ms, failure_ratio = scope["path"].strip("/").split("/")
+    await asyncio.sleep(float(delay_ms) / 1000)
+    if not dispatcher.verify(SECRET, signature, body):
+        status = 401
+    elif random.random() < float(failure_ratio):
+        status = 503
+    else:
+        status = 200
+    await send({"type": "http.response.start", "status": status, "headers": [(b"content-length", b"0")]})
+    await send({"type": "http.response.body", "body": b""})
+
+
+class MemoryStore:
+    """``DeliveryStore`` over per-endpoint deques; retries come due after their backoff."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._due: dict[str, deque[tuple[float, dispatcher.Delivery]]] = {}
+        self._endpoint_of: dict[uuid.UUID, str] = {}
+        self.delivered_at: dict[str, list[float]] = {}
+        self.retries: dict[str, int] = {}
+        self.failures: dict[str, int] = {}
+
+    def add(self, endpoint: str, count: int) -> None:
+        with self._lock:
+            queue = self._due.setdefault(endpoint, deque())
+            for _ in range(count):
+                delivery = dispatcher.Delivery(uuid.uuid4(), uuid.uuid4(), BODY, 0)
+                self._endpoint_of[delivery.id] = endpoint
+                queue.append((0.0, delivery))
+            self.delivered_at.setdefault(endpoint, [])
+            self.retries.setdefault(endpoint, 0)
+            self.failures.setdefault(endpoint, 0)
+
+    def claim(self, endpoint: str, limit: int, lease_seconds: float) -> list[dispatcher.Delivery]:
+        now = time.monotonic()
+        claimed = []
+        with self._lock:
+            queue = self._due.get(endpoint, deque())
+            for _ in range(len(queue)):
+                if len(claimed) == limit:
+                    break
+                due_at, delivery = queue.popleft()
+                if due_at <= now:
+                    claimed.append(delivery)
+                else:
+                    queue.append((due_at, delivery))
+        return claimed
+
+    def delivered(self, delivery_id: uuid.UUID, attempts: int, status_code: int) -> None:
+        with self._lock:
+            self.delivered_at[self._endpoint_of[delivery_id]].append(time.monotonic())
+
+    def retry(self, delivery_id: uuid.UUID, attempts: int, delay: float, status_code: int | None, error: str) -> None:
+        endpoint = self._endpoint_of[delivery_id]
+        with self._lock:
+            self.retries[endpoint] += 1
+            delivery = dispatcher.Delivery(delivery_id, delivery_id, BODY, attempts)
+            self._due[endpoint].append((time.monotonic() + delay, delivery))
+
+    def failed(self, delivery_id: uuid.UUID, attempts: int, status_code: int | None, error: str) -> None:
+        with self._lock:
+            self.failures[self._endpoint_of[delivery_id]] += 1
+
+    def finished(self, endpoint: str) -> int:
+        with self._lock:
+            return len(self.delivered_at[endpoint]) + self.failures[endpoint]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_stub(port: int) -> subprocess.Popen:
+    env = os.environ | {"PYTHONPATH": os.pathsep.join([os.path.join(ROOT, "services"), os.path.join(ROOT, "benchmarks")])}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "shared.serve", "webhook_dispatch_bench:stub_app", "--host", "127.0.0.1",
+         "--port", str(port), "--transport", "http2"],
+        cwd=os.path.join(ROOT, "benchmarks"),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.post(f"http://127.0.0.1:{port}/0/0", timeout=1.0)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.kill()
+    raise TimeoutError("stub receiver did not start")
+
+
+async def _run(base_url: str, scenario: str, args: argparse.Namespace) -> dict:
+    endpoints = [dispatcher.Endpoint("fast", f"{base_url}/{args.fast_ms}/0", SECRET, args.concurrency)]
+    if scenario == "fast+slow":
+        endpoints.append(dispatcher.Endpoint("slow", f"{base_url}/{args.slow_ms}/0", SECRET, args.concurrency))
+    elif scenario == "fast+flaky":
+        endpoints.append(dispatcher.Endpoint("flaky", f"{base_url}/{args.fast_ms}/0.5", SECRET, args.concurrency))
+    store = MemoryStore()
+    for endpoint in endpoints:
+        store.add(endpoint.name, args.events)
+
+    # Short backoff so the flaky endpoint's retries happen within the run.
+    runner = dispatcher.Dispatcher(
+        endpoints, store, http1=args.transport == "http1", max_attempts=4, backoff_base=0.05, poll_seconds=0.05
+    )
+    started = time.monotonic()
+    task = asyncio.create_task(runner.run())
+    while store.finished("fast") < args.events:
+        await asyncio.sleep(0.01)
+    fast_elapsed = time.monotonic() - started
+    others = {endpoint.name: store.finished(endpoint.name) for endpoint in endpoints[1:]}
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+    return {
+        "fast_per_s": len(store.delivered_at["fast"]) / fast_elapsed,
+        "fast_seconds": fast_elapsed,
+        "fast_failed": store.failures["fast"],
+        "others": others,
+        "retries": sum(store.retries.values()),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", default=["fast", "fast+slow", "fast+flaky"])
+    parser.add_argument("--events", type=int, default=2000, help="events per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16, help="cap per endpoint")
+    parser.add_argument("--fast-ms", type=int, default=5)
+    parser.add_argument("--slow-ms", type=int, default=2000)
+    parser.add_argument("--transport", choices=("http1", "http2"), default="http2")
+    args = parser.parse_args()
+
+    port = _free_port()
+    process = _start_stub(port)
+    print(f"{'scenario':12s} {'fast/s':>8s} {'fast s':>7s} {'fast failed':>11s} {'retries':>8s}  other endpoint done")
+    try:
+        for scenario in args.scenarios:
+            row = asyncio.run(_run(f"http://127.0.0.1:{port}", scenario, args))
+            others = ", ".join(f"{name} {done}/{args.events}" for name, done in row["others"].items()) or "-"
+            print(
+                f"{scenario:12s} {row['fast_per_s']:8.0f} {row['fast_seconds']:7.2f} {row['fast_failed']:11d} "
+                f"{row['retries']:8d}  {others}"
+            )
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Startup time and throughput of the orchestrator under 1..N gunicorn workers.
+
+For each worker count, launches ``gunicorn main:app -c gunicorn.conf.py`` with
+``WEB_CONCURRENCY`` set. It records the time until ``--ready-path`` answers,
+then drives ``--path`` closed-loop from several client processes. Run it where
+the app's dependencies are reachable, e.g. inside the orchestrator container
+with the stack up:
+
+    python benchmarks/worker_scaling_bench.py --workers 1 2 4 \\
+        --path /sign --body '{"message": "bench"}'
+
+Any service directory with a ``gunicorn.conf.py`` (or ``--app-dir`` plus
+``--config``) can be measured the same way.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ready(url: str, timeout: float) -> float:
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return time.perf_counter() - started
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.05)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+
+async def _client(url: str, method: str, body: dict | None, concurrency: int, duration: float) -> list[float]:
+    latencies: list[float] = []
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30.0) as client:
+
+        async def loop() -> None:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                response = await client.request(method, url, json=body, headers={"x-user-id": "bench"})
+                if response.status_code < 400:
+                    latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(loop() for _ in range(concurrency)))
+    return latencies
+
+
+def _client_process(args: tuple) -> list[float]:
+    return asyncio.run(_client(*args))
+
+
+def measure(options: argparse.Namespace, workers: int) -> dict:
+    port = _free_port()
+    env = os.environ | {
+        "WEB_CONCURRENCY": str(workers),
+        "GUNICORN_BIND": f"127.0.0.1:{port}",
+        "PYTHONPATH": os.pathsep.join(filter(None, [os.path.join(ROOT, "services"), os.environ.get("PYTHONPATH")])),
+    }
+    base = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", options.app, "-c", options.config],
+        cwd=options.app_dir,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        startup = _wait_ready(base + options.ready_path, options.ready_timeout)
+        # Every worker must have imported the app before load starts.
+        time.sleep(options.settle)
+        per_client = max(1, options.concurrency // options.clients)
+        job = (base + options.path, options.method, options.body, per_client, options.duration)
+        with multiprocessing.get_context("spawn").Pool(options.clients) as pool:
+            results = pool.map(_client_process, [job] * options.clients)
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=30)
+
+    latencies = sorted(l for batch in results for l in batch)
+    count = len(latencies)
+    return {
+        "workers": workers,
+        "startup_s": round(startup, 3),
+        "requests": count,
+        "rps": round(count / options.duration, 1),
+        "p50_ms": round(latencies[count // 2] * 1000, 2) if count else None,
+        "p99_ms": round(latencies[min(count - 1, int(count * 0.99))] * 1000, 2) if count else None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--app-dir", default=os.path.join(ROOT, "services", "payment_orchestrator"))
+    parser.add_argument("--app", default="main:app")
+    parser.add_argument("--config", default="gunicorn.conf.py")
+    parser.add_argument("--ready-path", default="/health")
+    parser.add_argument("--ready-timeout", type=float, default=60.0)
+    parser.add_argument("--settle", type=float, default=2.0)
+    parser.add_argument("--path", default="/health")
+    parser.add_argument("--method", default=None, help="defaults to POST when --body is given")
+    parser.add_argument("--body", type=json.loads, default=None)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--clients", type=int, default=4, help="load-generator processes")
+    parser.add_argument("--duration", type=float, default=10.0)
+    options = parser.parse_args()
+    options.method = options.method or ("POST" if options.body is not None else "GET")
+
+    rows = [measure(options, workers) for workers in options.workers]
+    baseline = rows[0]["rps"] or 1.0
+    for row in rows:
+        row["speedup"] = round(row["rps"] / baseline, 2)
+        print(
+            f"workers={row['workers']:<3d} startup={row['startup_s']:6.2f}s  {row['rps']:9.1f} req/s  "
+            f"x{row['speedup']:<5} p50={row['p50_ms']} ms  p99={row['p99_ms']} ms"
+        )
+    print(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Compare two load-test reports and flag latency, throughput or error regressions.
+
+    python loadtest/compare.py baseline.json candidate.json --threshold 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+
+LATENCY_KEYS = ("p50_ms", "p95_ms", "p99_ms")
+
+
+def _pct_change(old: float | None, new: float | None) -> float | None:
+    if old in (None, 0) or new is None:
+        return None
+    return (new - old) / old * 100
+
+
+def compare(baseline: dict, candidate: dict, threshold: float) -> tuple[list[str], list[str]]:
+    lines: list[str] = []
+    regressions: list[str] = []
+
+    old_tp = baseline["summary"]["throughput_rps"]
+    new_tp = candidate["summary"]["throughput_rps"]
+    change = _pct_change(old_tp, new_tp)
+    lines.append(f"{'throughput_rps':28s} {old_tp!s:>10} -> {new_tp!s:>10}  {_fmt(change)}")
+    if change is not None and -change > threshold:
+        regressions.append(f"throughput dropped {-change:.1f}%")
+
+    for stage, old in baseline["stages"].items():
+        new = candidate["stages"].get(stage)
+        if new is None:
+            continue
+        for key in LATENCY_KEYS:
+            change = _pct_change(old[key], new[key])
+            lines.append(f"{stage + '.' + key:28s} {old[key]!s:>10} -> {new[key]!s:>10}  {_fmt(change)}")
+            if change is not None and change > threshold:
+                regressions.append(f"{stage} {key} +{change:.1f}%")
+        # Error rates are compared in absolute percentage points.
+        delta = (new["error_rate"] - old["error_rate"]) * 100
+        lines.append(f"{stage + '.error_rate':28s} {old['error_rate']!s:>10} -> {new['error_rate']!s:>10}  {delta:+.2f}pp")
+        if delta > threshold / 10:
+            regressions.append(f"{stage} error rate +{delta:.2f}pp")
+    return lines, regressions
+
+
+def _fmt(change: float | None) -> str:
+    return "n/a" if change is None else f"{change:+.1f}%"
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Compare two loadtest/run.py reports.")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed regression in percent")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline, encoding="utf-8") as handle:
+        baseline = json.load(handle)
+    with open(args.candidate, encoding="utf-8") as handle:
+        candidate = json.load(handle)
+
+    lines, regressions = compare(baseline, candidate, args.threshold)
+    print(f"baseline {baseline['meta'].get('git_commit')} vs candidate {candidate['meta'].get('git_commit')}")
+    print("\n".join(lines))
+    if regressions:
+        print("\nREGRESSIONS:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
+    print("\nno regressions above threshold")
+
+
+if __name__ == "__main__":
+    main()
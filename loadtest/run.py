@@ -0,0 +1,261 @@
+"""Open-loop load generator for the tokenize -> create order -> pay flow.
+
+Flows start on a fixed arrival schedule (constant or Poisson) regardless of
+how many are still in flight, so a slow stack shows up as queueing latency
+instead of a silently lower request rate. End-to-end latency is measured from
+each flow's scheduled start to avoid coordinated omission.
+
+    python loadtest/run.py --rps 50 --duration 60 --output results.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Awaitable
+
+import httpx
+
+STAGES = ("tokenize", "create_order", "payment", "end_to_end")
+
+
+@dataclass
+class StageStats:
+    latencies: list[float] = field(default_factory=list)
+    errors: Counter = field(default_factory=Counter)
+
+    def record(self, seconds: float) -> None:
+        self.latencies.append(seconds)
+
+    def fail(self, kind: str) -> None:
+        self.errors[kind] += 1
+
+    def summary(self) -> dict:
+        ordered = sorted(self.latencies)
+        attempts = len(ordered) + sum(self.errors.values())
+        result = {
+            "count": len(ordered),
+            "errors": sum(self.errors.values()),
+            "error_rate": round(sum(self.errors.values()) / attempts, 6) if attempts else 0.0,
+            "errors_by_kind": dict(self.errors),
+        }
+        for label, q in (("p50_ms", 0.50), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+            result[label] = round(_percentile(ordered, q) * 1000, 3) if ordered else None
+        result["max_ms"] = round(ordered[-1] * 1000, 3) if ordered else None
+        result["mean_ms"] = round(sum(ordered) / len(ordered) * 1000, 3) if ordered else None
+        return result
+
+
+def _percentile(ordered: list[float], q: float) -> float:
+    # Nearest-rank percentile; exact for the sample, no interpolation.
+    index = max(0, min(len(ordered) - 1, int(q * len(ordered) + 0.999999) - 1))
+    return ordered[index]
+
+
+class StageFailed(Exception):
+    def __init__(self, kind: str) -> None:
+        super().__init__(kind)
+        self.kind = kind
+
+
+@dataclass
+class LoadConfig:
+    order_url: str
+    payment_url: str
+    rps: float
+    duration: float
+    arrival: str
+    users: int
+    amount: int
+    max_in_flight: int
+    timeout: float
+    bearer: str | None
+
+
+class LoadRun:
+    def __init__(self, config: LoadConfig) -> None:
+        self.config = config
+        self.stats = {stage: StageStats() for stage in STAGES}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.dropped = 0
+
+    def _headers(self, user_id: str) -> dict[str, str]:
+        headers = {"x-user-id": user_id}
+        if self.config.bearer:
+            headers["Authorization"] = f"Bearer {self.config.bearer}"
+        return headers
+
+    async def _stage(self, name: str, request: Awaitable[httpx.Response], expect: int = 200) -> dict:
+        start = time.perf_counter()
+        try:
+            response = await request
+        except httpx.TimeoutException:
+            self.stats[name].fail("timeout")
+            raise StageFailed("timeout")
+        except httpx.HTTPError as exc:
+            self.stats[name].fail(type(exc).__name__)
+            raise StageFailed(type(exc).__name__)
+        elapsed = time.perf_counter() - start
+        if response.status_code != expect:
+            self.stats[name].fail(f"http_{response.status_code}")
+            raise StageFailed(f"http_{response.status_code}")
+        self.stats[name].record(elapsed)
+        return response.json()
+
+    async def _flow(self, client: httpx.AsyncClient, index: int, scheduled: float) -> None:
+        config = self.config
+        headers = self._headers(f"loadtest-user-{index % config.users}")
+        try:
+            token = await self._stage(
+                "tokenize",
+                client.post(
+                    f"{config.payment_url}/payment/tokenize",
+                    headers=headers,
+                    json={"pan": "4111111111111111", "exp_month": 12, "exp_year": 2030, "cvc": "123"},
+                ),
+            )
+            order = await self._stage(
+                "create_order",
+                client.post(
+                    f"{config.order_url}/orders",
+                    headers=headers,
+                    json={"amount": config.amount, "currency": "VND", "items": []},
+                ),
+                expect=201,
+            )
+            await self._stage(
+                "payment",
+                client.post(
+                    f"{config.payment_url}/payments",
+                    headers=headers,
+                    json={"order_id": order["id"], "payment_token": token["token"]},
+                ),
+            )
+        except StageFailed as exc:
+            self.stats["end_to_end"].fail(exc.kind)
+        else:
+            self.stats["end_to_end"].record(time.perf_counter() - scheduled)
+        finally:
+            self.in_flight -= 1
+
+    def _arrivals(self) -> list[float]:
+        config = self.config
+        offsets: list[float] = []
+        if config.arrival == "poisson":
+            t = random.expovariate(config.rps)
+            while t < config.duration:
+                offsets.append(t)
+                t += random.expovariate(config.rps)
+        else:
+            offsets = [i / config.rps for i in range(int(config.rps * config.duration))]
+        return offsets
+
+    async def run(self) -> dict:
+        config = self.config
+        limits = httpx.Limits(max_connections=config.max_in_flight, max_keepalive_connections=config.max_in_flight)
+        async with httpx.AsyncClient(timeout=httpx.Timeout(config.timeout), limits=limits) as client:
+            tasks: set[asyncio.Task] = set()
+            started = time.perf_counter()
+            for index, offset in enumerate(self._arrivals()):
+                scheduled = started + offset
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if self.in_flight >= config.max_in_flight:
+                    # Client-side saturation: record it rather than slowing the schedule.
+                    self.dropped += 1
+                    self.stats["end_to_end"].fail("dropped")
+                    continue
+                self.in_flight += 1
+                self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+                task = asyncio.create_task(self._flow(client, index, scheduled))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - started
+        return self.report(elapsed)
+
+    def report(self, elapsed: float) -> dict:
+        e2e = self.stats["end_to_end"]
+        attempted = len(e2e.latencies) + sum(e2e.errors.values())
+        return {
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "git_commit": _git_commit(),
+                "config": vars(self.config) | {"bearer": bool(self.config.bearer)},
+            },
+            "summary": {
+                "offered_rps": round(attempted / self.config.duration, 3) if self.config.duration else None,
+                "throughput_rps": round(len(e2e.latencies) / elapsed, 3) if elapsed else None,
+                "elapsed_s": round(elapsed, 3),
+                "flows": attempted,
+                "succeeded": len(e2e.latencies),
+                "dropped": self.dropped,
+                "peak_in_flight": self.peak_in_flight,
+                "error_rate": e2e.summary()["error_rate"],
+            },
+            "stages": {name: stats.summary() for name, stats in self.stats.items()},
+        }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Open-loop load test for the payment flow.")
+    parser.add_argument("--order-url", default=os.getenv("LOADTEST_ORDER_URL", "http://localhost:8001"))
+    parser.add_argument("--payment-url", default=os.getenv("LOADTEST_PAYMENT_URL", "http://localhost:8002"))
+    parser.add_argument("--rps", type=float, default=20.0, help="target flow arrival rate")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of arrivals")
+    parser.add_argument("--arrival", choices=("constant", "poisson"), default="constant")
+    parser.add_argument("--users", type=int, default=100, help="distinct x-user-id values")
+    parser.add_argument("--amount", type=int, default=200_000)
+    parser.add_argument("--max-in-flight", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--bearer", default=os.getenv("LOADTEST_BEARER"), help="JWT when targeting Envoy")
+    parser.add_argument("--output", help="write the JSON report here as well as stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = _parse_args(argv)
+    config = LoadConfig(
+        order_url=args.order_url.rstrip("/"),
+        payment_url=args.payment_url.rstrip("/"),
+        rps=args.rps,
+        duration=args.duration,
+        arrival=args.arrival,
+        users=args.users,
+        amount=args.amount,
+        max_in_flight=args.max_in_flight,
+        timeout=args.timeout,
+        bearer=args.bearer,
+    )
+    report = asyncio.run(LoadRun(config).run())
+    rendered = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(rendered + "\n")
+    print(rendered)
+    if report["summary"]["succeeded"] == 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,20 @@
 from fastapi import FastAPI
 from pydantic import BaseModel
 
+from shared.log import configure_logging
+from shared.metrics import instrument_app
+from shared.tracing import trace_app
+
+configure_logging("api_gateway")
+
 
 class HealthResponse(BaseModel):
     status: str = "ok"
 
 
 app = FastAPI()
+instrument_app(app, "api_gateway")
+trace_app(app, "api_gateway")
 
 
 @app.get("/health", response_model=HealthResponse)
@@ -1,16 +1,30 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+import os
 
 from fastapi import FastAPI
 from pydantic import BaseModel, PositiveInt
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="[%(asctime)s] [%(name)s] [%(levelname)s] %(message)s"
-)
+from linking import ClusterFeatures, LinkIndex, write_snapshot
+from shared.log import HEALTH_SAMPLE, configure_logging
+from shared.metrics import FRAUD_LINK_ENTITIES, FRAUD_LINK_SKIPPED_MERGES, instrument_app
+from shared.tracing import trace_app
+
+configure_logging("fraud_engine")
 logger = logging.getLogger(__name__)
 
+# Empty keeps the linking index in memory only.
+LINK_SNAPSHOT_PATH = os.getenv("FRAUD_LINK_SNAPSHOT_PATH", "")
+LINK_SNAPSHOT_INTERVAL = float(os.getenv("FRAUD_LINK_SNAPSHOT_INTERVAL", "300"))
+LINK_MAX_CLUSTER = int(os.getenv("FRAUD_LINK_MAX_CLUSTER", "10000"))
+# A cluster linked to this many blocked transactions, from at least two distinct users, is treated as a ring.
+RING_BLOCK_FLAGGED = int(os.getenv("FRAUD_RING_BLOCK_FLAGGED", "3"))
+
+links = LinkIndex(LINK_MAX_CLUSTER)
+_snapshot_task: asyncio.Task | None = None
+
 
 class HealthResponse(BaseModel):
     status: str = "ok"
@@ -20,34 +34,114 @@ class FraudScoreRequest(BaseModel):
     amount: PositiveInt
     user_ip: str | None = None
     device_id: str | None = None
+    user_id: str | None = None
+
+
+class ClusterResponse(BaseModel):
+    size: int
+    users: int
+    devices: int
+    ips: int
+    flagged: int
+    flagged_users: int
 
 
 class FraudScoreResponse(BaseModel):
     score: int
     action: str
+    cluster: ClusterResponse | None = None
 
 
 app = FastAPI(title="Fraud Engine")
+instrument_app(app, "fraud_engine")
+trace_app(app, "fraud_engine")
+
+
+def _load_links() -> None:
+    global links
+    if LINK_SNAPSHOT_PATH and os.path.exists(LINK_SNAPSHOT_PATH):
+        try:
+            links = LinkIndex.load(LINK_SNAPSHOT_PATH, LINK_MAX_CLUSTER)
+        except (OSError, ValueError) as exc:
+            logger.error("[LINKING] Could not load snapshot %s, starting empty: %s", LINK_SNAPSHOT_PATH, exc)
+        else:
+            logger.info("[LINKING] Loaded %s entities from %s", len(links), LINK_SNAPSHOT_PATH)
+    FRAUD_LINK_ENTITIES.set_function(lambda: len(links))
+
+
+async def _save_links() -> None:
+    # Copying the columns is the only part that runs on the event loop.
+    count = await asyncio.to_thread(write_snapshot, links.snapshot(), LINK_SNAPSHOT_PATH)
+    logger.info("[LINKING] Saved %s entities to %s", count, LINK_SNAPSHOT_PATH)
+
+
+async def _snapshot_periodically() -> None:
+    while True:
+        await asyncio.sleep(LINK_SNAPSHOT_INTERVAL)
+        try:
+            await _save_links()
+        except OSError as exc:
+            logger.error("[LINKING] Snapshot to %s failed: %s", LINK_SNAPSHOT_PATH, exc)
 
 
 @app.on_event("startup")
 async def on_startup() -> None:
+    global _snapshot_task
+    _load_links()
+    if LINK_SNAPSHOT_PATH:
+        _snapshot_task = asyncio.create_task(_snapshot_periodically())
     logger.info("[STARTUP] Fraud Engine initialized")
 
 
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    if _snapshot_task is not None:
+        _snapshot_task.cancel()
+        await _save_links()
+
+
 @app.get("/health", response_model=HealthResponse)
 async def health() -> HealthResponse:
-    logger.info("[HEALTH] Health check requested")
+    logger.info("[HEALTH] Health check requested", extra=HEALTH_SAMPLE)
     return HealthResponse()
 
 
+def _is_ring(cluster: ClusterFeatures) -> bool:
+    # One user's blocks on a shared NAT or office IP must not condemn everyone seen there.
+    return cluster.flagged_users >= 2 and cluster.flagged >= RING_BLOCK_FLAGGED
+
+
+def _link_score(cluster: ClusterFeatures | None) -> int:
+    if cluster is None:
+        return 10
+    # Shared devices/IPs and earlier blocks raise the score without blocking on their own.
+    return 10 + min(50, 2 * (cluster.users - 1) + 10 * cluster.flagged)
+
+
 @app.post("/score", response_model=FraudScoreResponse)
 async def score(payload: FraudScoreRequest) -> FraudScoreResponse:
-    logger.info(f"[FRAUD_SCORE] Evaluating transaction: amount={payload.amount}, device_id={payload.device_id}")
-    
+    logger.info("[FRAUD_SCORE] Evaluating transaction: amount=%s, device_id=%s", payload.amount, payload.device_id)
+
+    skipped = links.skipped_merges
+    root = links.observe(payload.user_id, payload.device_id, payload.user_ip)
+    if links.skipped_merges != skipped:
+        FRAUD_LINK_SKIPPED_MERGES.inc(links.skipped_merges - skipped)
+    cluster = links.features(root) if root is not None else None
+    cluster_response = ClusterResponse(**vars(cluster)) if cluster is not None else None
+
     if payload.amount > 10_000_000:
-        logger.warning(f"[FRAUD_SCORE] BLOCK: Amount {payload.amount} exceeds threshold")
-        return FraudScoreResponse(score=95, action="BLOCK")
-    
-    logger.info(f"[FRAUD_SCORE] ALLOW: Amount {payload.amount} within acceptable range")
-    return FraudScoreResponse(score=10, action="ALLOW")
+        logger.warning("[FRAUD_SCORE] BLOCK: Amount %s exceeds threshold", payload.amount)
+        if root is not None:
+            links.flag(root, payload.user_id)
+        return FraudScoreResponse(score=95, action="BLOCK", cluster=cluster_response)
+
+    if cluster is not None and _is_ring(cluster):
+        logger.warning(
+            "[FRAUD_SCORE] BLOCK: Linked to %s blocked transactions from %s users",
+            cluster.flagged, cluster.flagged_users,
+        )
+        return FraudScoreResponse(score=90, action="BLOCK", cluster=cluster_response)
+
+    logger.info("[FRAUD_SCORE] ALLOW: Amount %s within acceptable range", payload.amount)
+    return FraudScoreResponse(score=_link_score(cluster), action="ALLOW", cluster=cluster_response)
+
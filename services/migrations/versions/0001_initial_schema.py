@@ -0,0 +1,137 @@
+"""Initial schema for orders, payments, replay guard and reconciliation.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timezone
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+from shared.partitions import month_start, partition_name
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+ORDER_STATUS = postgresql.ENUM("PENDING", "CREATED", "COMPLETED", "FAILED", name="orderstatus", create_type=False)
+PAYMENT_STATUS = postgresql.ENUM("PENDING", "SUCCESS", "FAILED", name="paymentstatus", create_type=False)
+
+# Append-only tables are range partitioned by month on created_at.
+PARTITIONED_TABLES = ("used_payment_tokens", "reconciliation_receipts")
+
+
+def _create_month_partitions(table: str, months: int = 2) -> None:
+    # UTC bounds, as PartitionManager creates them; local-time bounds on a server
+    # west of UTC would overlap the partitions it attaches later.
+    now = datetime.now(timezone.utc)
+    for offset in range(months):
+        start, end = month_start(now, offset), month_start(now, offset + 1)
+        op.execute(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(table, start)} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+    op.execute(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT")
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    ORDER_STATUS.create(bind, checkfirst=True)
+    PAYMENT_STATUS.create(bind, checkfirst=True)
+
+    op.create_table(
+        "orders",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("user_id", sa.String(128), nullable=False),
+        sa.Column("amount", sa.Integer(), nullable=False),
+        sa.Column("currency", sa.String(16), nullable=False),
+        sa.Column("status", ORDER_STATUS, nullable=False),
+        sa.Column("payment_token", sa.String(512), nullable=True),
+        sa.Column("items", postgresql.JSONB(), nullable=True),
+        sa.Column("notes", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.CheckConstraint("amount >= 0", name="ck_orders_amount_positive"),
+    )
+    # get_order / update_order_status filter on (id, user_id); listing by user sorts by recency.
+    op.create_index("ix_orders_user_id_created_at", "orders", ["user_id", "created_at"])
+
+    op.create_table(
+        "payment_intents",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("order_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("amount", sa.Integer(), nullable=False),
+        sa.Column("currency", sa.String(16), nullable=False),
+        sa.Column("status", PAYMENT_STATUS, nullable=False),
+        sa.Column("signed_receipt", sa.Text(), nullable=True),
+        sa.Column("receipt_payload", postgresql.JSONB(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index("ix_payment_intents_order_id", "payment_intents", ["order_id"])
+
+    # Partitioned tables need the partition key in every unique constraint, so the
+    # replay guard on token_hash is enforced with an advisory lock by the orchestrator.
+    op.execute(
+        """
+        CREATE TABLE used_payment_tokens (
+            id uuid NOT NULL,
+            token_hash varchar(128) NOT NULL,
+            order_id uuid NOT NULL,
+            created_at timestamptz NOT NULL DEFAULT now(),
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+        """
+    )
+    op.create_index("ix_used_payment_tokens_token_hash", "used_payment_tokens", ["token_hash", "created_at"])
+
+    # created_at carries the receipt timestamp, so a redelivered receipt lands on the
+    # same (signature, created_at) key and is rejected as a duplicate.
+    op.execute(
+        """
+        CREATE TABLE reconciliation_receipts (
+            id uuid NOT NULL,
+            order_id varchar(64),
+            psp_reference varchar(64),
+            signature text NOT NULL,
+            receipt json NOT NULL,
+            status varchar(32),
+            created_at timestamptz NOT NULL DEFAULT now(),
+            processed_at timestamptz,
+            PRIMARY KEY (id, created_at),
+            CONSTRAINT uq_reconciliation_signature UNIQUE (signature, created_at)
+        ) PARTITION BY RANGE (created_at)
+        """
+    )
+    op.create_index("ix_reconciliation_receipts_order_id", "reconciliation_receipts", ["order_id"])
+    op.create_index("ix_reconciliation_receipts_psp_reference", "reconciliation_receipts", ["psp_reference"])
+
+    for table in PARTITIONED_TABLES:
+        _create_month_partitions(table)
+
+    op.create_table(
+        "reconciliation_reports",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("period_start", sa.DateTime(timezone=True)),
+        sa.Column("period_end", sa.DateTime(timezone=True)),
+        sa.Column("generated_at", sa.DateTime(timezone=True)),
+        sa.Column("coverage_days", sa.Integer(), nullable=True),
+        sa.Column("summary", sa.JSON(), nullable=True),
+        sa.Column("export_uri", sa.Text(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("reconciliation_reports")
+    for table in PARTITIONED_TABLES:
+        op.execute(f"DROP TABLE IF EXISTS {table} CASCADE")
+    op.drop_table("payment_intents")
+    op.drop_table("orders")
+    PAYMENT_STATUS.drop(op.get_bind(), checkfirst=True)
+    ORDER_STATUS.drop(op.get_bind(), checkfirst=True)
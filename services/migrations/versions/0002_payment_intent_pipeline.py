@@ -0,0 +1,42 @@
+"""Pipeline columns on payment_intents for asynchronous (202 Accepted) payments.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("payment_intents", sa.Column("user_id", sa.String(128), nullable=True))
+    # Last completed pipeline stage; a resumed intent continues after it.
+    op.add_column("payment_intents", sa.Column("stage", sa.String(32), nullable=True))
+    # The HSM-encrypted token, kept only until the PSP charge succeeds.
+    op.add_column("payment_intents", sa.Column("payment_token", sa.String(512), nullable=True))
+    op.add_column("payment_intents", sa.Column("psp_reference", sa.String(64), nullable=True))
+    op.add_column("payment_intents", sa.Column("last4", sa.String(4), nullable=True))
+    op.add_column("payment_intents", sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"))
+    op.add_column("payment_intents", sa.Column("lease_expires_at", sa.DateTime(timezone=True), nullable=True))
+    op.add_column("payment_intents", sa.Column("error", sa.Text(), nullable=True))
+    # Work queue scan: only unfinished intents are indexed, so the index stays small.
+    op.create_index(
+        "ix_payment_intents_pending",
+        "payment_intents",
+        ["lease_expires_at", "created_at"],
+        postgresql_where=sa.text("status = 'PENDING'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_payment_intents_pending", table_name="payment_intents")
+    for column in ("error", "lease_expires_at", "attempts", "last4", "psp_reference", "payment_token", "stage", "user_id"):
+        op.drop_column("payment_intents", column)
@@ -0,0 +1,28 @@
+"""Keyset index for listing a user's payment intents.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+
+from __future__ import annotations
+
+from alembic import op
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # GET /payments?since= walks (created_at, id) within one user.
+    op.create_index(
+        "ix_payment_intents_user_id_created_at",
+        "payment_intents",
+        ["user_id", "created_at", "id"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_payment_intents_user_id_created_at", table_name="payment_intents")
@@ -0,0 +1,37 @@
+"""Hourly and daily reconciliation rollups by status, currency and provider.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+ROLLUP_TABLES = ("reconciliation_rollup_hourly", "reconciliation_rollup_daily")
+
+
+def upgrade() -> None:
+    # Filled as receipts are stored; existing receipts need `python rollups.py rebuild`.
+    for table in ROLLUP_TABLES:
+        op.create_table(
+            table,
+            sa.Column("bucket_start", sa.DateTime(timezone=True), primary_key=True),
+            sa.Column("status", sa.String(32), primary_key=True),
+            sa.Column("currency", sa.String(16), primary_key=True),
+            sa.Column("provider", sa.String(32), primary_key=True),
+            sa.Column("receipt_count", sa.BigInteger(), nullable=False, server_default="0"),
+            sa.Column("amount_total", sa.BigInteger(), nullable=False, server_default="0"),
+        )
+
+
+def downgrade() -> None:
+    for table in ROLLUP_TABLES:
+        op.drop_table(table)
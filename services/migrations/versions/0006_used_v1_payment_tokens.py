@@ -0,0 +1,56 @@
+"""Permanent replay guard for payment tokens without an issue time.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19
+"""
+
+from __future__ import annotations
+
+import os
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+# Same default as shared.partitions.ARCHIVE_SCHEMA.
+ARCHIVE_SCHEMA = os.getenv("PARTITION_ARCHIVE_SCHEMA", "partition_archive")
+
+
+def upgrade() -> None:
+    # v1 tokens never expire, so their used rows cannot age out with the
+    # used_payment_tokens partitions; this table is not partitioned.
+    op.create_table(
+        "used_v1_payment_tokens",
+        sa.Column("token_hash", sa.String(128), primary_key=True),
+        sa.Column("order_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+
+    # Every row written so far may belong to a v1 token. Archived partitions are
+    # included; partitions already dropped with PARTITION_EXPIRE_MODE=drop are gone.
+    sources = ["used_payment_tokens"]
+    archived = op.get_bind().execute(
+        sa.text(
+            "SELECT tablename FROM pg_tables WHERE schemaname = :schema "
+            "AND tablename LIKE 'used\\_payment\\_tokens\\_p%' ORDER BY tablename"
+        ),
+        {"schema": ARCHIVE_SCHEMA},
+    ).scalars()
+    sources.extend(f"{ARCHIVE_SCHEMA}.{name}" for name in archived)
+    for source in sources:
+        op.execute(
+            "INSERT INTO used_v1_payment_tokens (token_hash, order_id, created_at) "
+            f"SELECT DISTINCT ON (token_hash) token_hash, order_id, created_at FROM {source} "
+            "ORDER BY token_hash, created_at "
+            "ON CONFLICT (token_hash) DO NOTHING"
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("used_v1_payment_tokens")
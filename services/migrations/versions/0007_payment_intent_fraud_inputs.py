@@ -0,0 +1,28 @@
+"""Client IP and device id on payment_intents for the asynchronous fraud check.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19
+"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # The pipeline screens an intent after the request is gone; these are what
+    # the fraud engine links the user with.
+    op.add_column("payment_intents", sa.Column("client_ip", sa.String(64), nullable=True))
+    op.add_column("payment_intents", sa.Column("device_id", sa.String(128), nullable=True))
+
+
+def downgrade() -> None:
+    for column in ("device_id", "client_ip"):
+        op.drop_column("payment_intents", column)
@@ -4,18 +4,31 @@ from typing import Annotated
 from fastapi import Depends, FastAPI, Header, HTTPException, status
 from sqlalchemy import select, update
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.ext.asyncio import AsyncSession
 
 import schemas
-from database import get_session, init_db
+from database import get_sessions, router, verify_schema
 from models import Order, OrderStatus
+from shared.log import configure_logging
+from shared.metrics import instrument_app
+from shared.sharding import SessionSet
+from shared.tracing import trace_app
+
+configure_logging("order")
 
 app = FastAPI(title="Order Service")
+instrument_app(app, "order")
+trace_app(app, "order")
 
 
 @app.on_event("startup")
 async def on_startup() -> None:
-    await init_db()
+    await verify_schema()
+    router.start()
+
+
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    await router.aclose()
 
 
 async def require_user(
@@ -42,8 +55,9 @@ def _load_items(payload: dict | list | None) -> list[schemas.OrderItem] | None:
 async def create_order(
     order: schemas.OrderCreate,
     user_id: Annotated[str, Depends(require_user)],
-    session: Annotated[AsyncSession, Depends(get_session)],
+    sessions: Annotated[SessionSet, Depends(get_sessions)],
 ) -> schemas.OrderRead:
+    session = sessions.primary(user_id)
     db_order = Order(
         user_id=user_id,
         amount=order.amount,
@@ -78,12 +92,14 @@ async def create_order(
 async def get_order(
     order_id: uuid.UUID,
     user_id: Annotated[str, Depends(require_user)],
-    session: Annotated[AsyncSession, Depends(get_session)],
+    sessions: Annotated[SessionSet, Depends(get_sessions)],
 ) -> schemas.OrderRead:
-    result = await session.execute(
-        select(Order).where(Order.id == order_id, Order.user_id == user_id)
-    )
-    db_order = result.scalar_one_or_none()
+    query = select(Order).where(Order.id == order_id, Order.user_id == user_id)
+    session = sessions.read(user_id)
+    db_order = (await session.execute(query)).scalar_one_or_none()
+    if db_order is None and session is not sessions.primary(user_id):
+        # The orchestrator reads an order right after it is created, possibly before a replica has it.
+        db_order = (await sessions.primary(user_id).execute(query)).scalar_one_or_none()
     if db_order is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="order not found")
     return schemas.OrderRead(
@@ -105,8 +121,9 @@ async def update_order_status(
     order_id: uuid.UUID,
     payload: schemas.OrderUpdateStatus,
     user_id: Annotated[str, Depends(require_user)],
-    session: Annotated[AsyncSession, Depends(get_session)],
+    sessions: Annotated[SessionSet, Depends(get_sessions)],
 ) -> schemas.OrderRead:
+    session = sessions.primary(user_id)
     stmt = (
         update(Order)
         .where(Order.id == order_id, Order.user_id == user_id)
@@ -2,7 +2,7 @@ import enum
 import uuid
 from datetime import datetime
 
-from sqlalchemy import CheckConstraint, DateTime, Enum as SQLEnum, Integer, String, Text, func
+from sqlalchemy import CheckConstraint, DateTime, Enum as SQLEnum, Index, Integer, String, Text, func
 from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import Mapped, mapped_column
 
@@ -16,11 +16,22 @@ class OrderStatus(str, enum.Enum):
     FAILED = "FAILED"
 
 
+# Status events may arrive late or out of order; an order only moves to a higher rank.
+# FAILED ranks below COMPLETED so a later successful payment still completes the order,
+# while a failed retry cannot undo a completed one.
+STATUS_RANK = {
+    OrderStatus.PENDING: 0,
+    OrderStatus.CREATED: 1,
+    OrderStatus.FAILED: 2,
+    OrderStatus.COMPLETED: 3,
+}
+
+
 class Order(Base):
     __tablename__ = "orders"
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id: Mapped[str] = mapped_column(String(128), nullable=False, index=True)
+    user_id: Mapped[str] = mapped_column(String(128), nullable=False)
     amount: Mapped[int] = mapped_column(Integer, nullable=False)
     currency: Mapped[str] = mapped_column(String(16), nullable=False, default="VND")
     status: Mapped[OrderStatus] = mapped_column(SQLEnum(OrderStatus), nullable=False, default=OrderStatus.PENDING)
@@ -34,4 +45,5 @@ class Order(Base):
 
     __table_args__ = (
         CheckConstraint("amount >= 0", name="ck_orders_amount_positive"),
+        Index("ix_orders_user_id_created_at", "user_id", "created_at"),
     )
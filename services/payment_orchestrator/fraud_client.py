@@ -0,0 +1,176 @@
+"""Client-side fraud decisions: engine call with a latency budget, TTL cache and local fallback.
+
+``FraudDecider.decide`` answers from the cache when the same inputs were
+scored recently. Otherwise it calls the fraud engine and waits at most
+``FRAUD_LATENCY_BUDGET_MS``. If the engine is slower than that, or fails,
+the payment proceeds on the decision of the local rules. A timed-out engine
+call is left running in the background, up to a limit; when it returns, its
+decision is cached and compared with the fallback.
+
+Every engine decision is also scored by the local rules (shadow scoring), so
+``fraud_shadow_comparisons_total`` shows whether the fallback still agrees
+with the engine before it is needed.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import bisect
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Callable
+
+import httpx
+
+import schemas
+from shared.metrics import FRAUD_DECISIONS, FRAUD_FALLBACKS, FRAUD_SHADOW_COMPARISONS
+
+logger = logging.getLogger(__name__)
+
+FRAUD_ENGINE_URL = os.getenv("FRAUD_ENGINE_URL", "http://fraud_engine:8000")
+LATENCY_BUDGET_MS = float(os.getenv("FRAUD_LATENCY_BUDGET_MS", "150"))
+CACHE_TTL_SECONDS = float(os.getenv("FRAUD_CACHE_TTL_SECONDS", "30"))
+CACHE_SIZE = int(os.getenv("FRAUD_CACHE_SIZE", "10000"))
+MAX_LATE_CALLS = int(os.getenv("FRAUD_MAX_LATE_CALLS", "64"))
+# "min_amount:score:ACTION" steps; mirrors the engine's rule (BLOCK above 10,000,000).
+FALLBACK_RULES = os.getenv("FRAUD_FALLBACK_RULES", "0:10:ALLOW,10000001:95:BLOCK")
+
+_CacheKey = tuple[int, str | None, str | None, str | None]
+
+_ENGINE = FRAUD_DECISIONS.labels("engine")
+_CACHE = FRAUD_DECISIONS.labels("cache")
+_FALLBACK = FRAUD_DECISIONS.labels("fallback")
+_AGREE = FRAUD_SHADOW_COMPARISONS.labels("agree")
+_DISAGREE = FRAUD_SHADOW_COMPARISONS.labels("disagree")
+
+
+def compile_rules(spec: str) -> Callable[[int], schemas.FraudDecision]:
+    """Turn ``min_amount:score:ACTION`` steps into a bisect lookup on the amount."""
+    steps = []
+    for part in filter(None, (item.strip() for item in spec.split(","))):
+        try:
+            minimum, score, action = part.split(":")
+            steps.append((int(minimum), schemas.FraudDecision(score=int(score), action=action)))
+        except ValueError as exc:
+            raise ValueError(f"invalid fraud rule {part!r}; expected min_amount:score:ACTION") from exc
+    if not steps:
+        raise ValueError("FRAUD_FALLBACK_RULES defines no rules")
+    steps.sort(key=lambda step: step[0])
+    thresholds = [minimum for minimum, _ in steps]
+    decisions = [decision for _, decision in steps]
+    lowest = decisions[0]
+
+    def score(amount: int) -> schemas.FraudDecision:
+        index = bisect.bisect_right(thresholds, amount) - 1
+        return decisions[index] if index >= 0 else lowest
+
+    return score
+
+
+class FraudDecider:
+    def __init__(
+        self,
+        http: Callable[[], httpx.AsyncClient],
+        base_url: str = FRAUD_ENGINE_URL,
+        budget_ms: float = LATENCY_BUDGET_MS,
+        cache_ttl: float = CACHE_TTL_SECONDS,
+        cache_size: int = CACHE_SIZE,
+        rules: str = FALLBACK_RULES,
+        max_late_calls: int = MAX_LATE_CALLS,
+    ) -> None:
+        self._http = http
+        self.url = f"{base_url}/score"
+        self.budget = budget_ms / 1000
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.local = compile_rules(rules)
+        self.max_late_calls = max_late_calls
+        # Only touched from the event loop thread.
+        self._cache: OrderedDict[_CacheKey, tuple[float, schemas.FraudDecision]] = OrderedDict()
+        self._late: set[asyncio.Task] = set()
+
+    def _cached(self, key: _CacheKey) -> schemas.FraudDecision | None:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return entry[1]
+
+    def _remember(self, key: _CacheKey, decision: schemas.FraudDecision) -> None:
+        if self.cache_ttl <= 0:
+            return
+        self._cache[key] = (time.monotonic() + self.cache_ttl, decision)
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _shadow(self, key: _CacheKey, decision: schemas.FraudDecision) -> None:
+        local = self.local(key[0])
+        if local.action == decision.action:
+            _AGREE.inc()
+        else:
+            _DISAGREE.inc()
+            logger.info(
+                "[FRAUD] Local rules disagree with engine: amount=%s engine=%s local=%s",
+                key[0], decision.action, local.action,
+            )
+
+    async def _score(self, key: _CacheKey) -> schemas.FraudDecision:
+        amount, user_ip, device_id, user_id = key
+        response = await self._http().post(
+            self.url,
+            json={"amount": amount, "user_ip": user_ip, "device_id": device_id, "user_id": user_id},
+        )
+        response.raise_for_status()
+        return schemas.FraudDecision(**response.json())
+
+    def _on_late_result(self, key: _CacheKey, task: asyncio.Task) -> None:
+        self._late.discard(task)
+        if task.cancelled() or task.exception() is not None:
+            return
+        decision = task.result()
+        self._remember(key, decision)
+        self._shadow(key, decision)
+
+    async def decide(
+        self, amount: int, user_ip: str | None = None, device_id: str | None = None, user_id: str | None = None
+    ) -> schemas.FraudDecision:
+        key = (amount, user_ip, device_id, user_id)
+        decision = self._cached(key)
+        if decision is not None:
+            _CACHE.inc()
+            return decision
+
+        task = asyncio.ensure_future(self._score(key))
+        try:
+            # shield: a call that misses the budget may still finish and warm the cache.
+            decision = await asyncio.wait_for(asyncio.shield(task), self.budget)
+        except asyncio.TimeoutError:
+            reason = "timeout"
+            if len(self._late) < self.max_late_calls:
+                self._late.add(task)
+                task.add_done_callback(lambda done: self._on_late_result(key, done))
+            else:
+                task.cancel()
+        except (httpx.HTTPError, ValueError) as exc:
+            reason = "error"
+            logger.warning("[FRAUD] Engine call failed, using local rules: %s", exc)
+        else:
+            _ENGINE.inc()
+            self._remember(key, decision)
+            self._shadow(key, decision)
+            return decision
+
+        FRAUD_FALLBACKS.labels(reason).inc()
+        _FALLBACK.inc()
+        return self.local(amount)
+
+    async def aclose(self) -> None:
+        for task in list(self._late):
+            task.cancel()
+        self._late.clear()
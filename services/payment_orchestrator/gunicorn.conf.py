@@ -0,0 +1,45 @@
+"""Gunicorn settings for running the orchestrator with several uvicorn workers.
+
+    gunicorn main:app -c gunicorn.conf.py          # WEB_CONCURRENCY workers
+
+Each worker imports the app itself (``preload_app`` is off by default), so
+PKCS#11, the DB pool, RabbitMQ connections and background threads are created
+per process. If preloading is enabled, fork hooks in ``hsm_service``,
+``shared.log`` and ``shared.tracing`` discard the inherited PKCS#11 state and
+restart the log writer and span exporter threads in the child.
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("GUNICORN_PRELOAD", "false").lower() in {"1", "true", "yes"}
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+accesslog = None
+
+
+def on_starting(server) -> None:  # noqa: ANN001 - gunicorn hook signature
+    # Prometheus multiprocess mode keeps one file set per worker pid under this
+    # directory. Files left by a previous run (the container's /tmp survives a
+    # restart) would be merged in as stale counters and gauges, so start empty.
+    metrics_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir, exist_ok=True)
+
+
+def post_fork(server, worker) -> None:  # noqa: ANN001
+    server.log.info("Worker %s forked; HSM and DB state will initialise on first use", worker.pid)
+
+
+def child_exit(server, worker) -> None:  # noqa: ANN001
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,110 +1,290 @@
-"""Utilities for interacting with SoftHSM via PKCS#11."""
+"""Utilities for interacting with SoftHSM via PKCS#11.
+
+PKCS#11 state is per process and not fork-safe, so nothing is loaded at import.
+The library, token and sessions are created on first use, and a fork hook
+discards inherited state so each worker process initialises its own.
+"""
 
 from __future__ import annotations
 
+import asyncio
 import atexit
-import base64
+import contextvars
+import hashlib
+import hmac
 import os
+import queue
 import threading
-from contextlib import contextmanager
-from typing import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from time import perf_counter, time
+from typing import Any, Callable, Iterator, TypeVar
 
 import pkcs11
 from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
 from pkcs11 import Attribute, Key, KeyType, Mechanism, ObjectClass
-from pkcs11.exceptions import NoSuchKey, PKCS11Error
+from pkcs11.exceptions import EncryptedDataInvalid, EncryptedDataLenRange, NoSuchKey, PKCS11Error
+
+import token_format
+from shared import signing
+from shared.metrics import HSM_EXECUTOR_PENDING, HSM_LOCK_WAIT_SECONDS, HSM_REJECTED, hsm_op_timer
 
 DEFAULT_LIBRARY = "/usr/lib/softhsm/libsofthsm2.so"
 SIGNING_KEY_LABEL = os.getenv("HSM_SIGNING_KEY_LABEL", "payment-signing-key")
+SIGNING_KEY_VERSION = int(os.getenv("HSM_SIGNING_KEY_VERSION", "1"))
+# Only applies when a key version is generated; existing keys keep their type.
+SIGNING_ALGORITHM = signing.algorithm_name(os.getenv("HSM_SIGNING_ALGORITHM", signing.RS256))
 ENCRYPTION_KEY_LABEL = os.getenv("HSM_ENCRYPTION_KEY_LABEL", "payment-encryption-key")
+ENCRYPTION_KEY_ID = int(os.getenv("HSM_ENCRYPTION_KEY_ID", str(token_format.DEFAULT_KEY_ID)))
+TOKEN_MAC_KEY_LABEL = os.getenv("HSM_TOKEN_MAC_KEY_LABEL", "payment-token-mac-key")
+TOKEN_FORMAT = os.getenv("PAYMENT_TOKEN_FORMAT", "v2").lower()
 TOKEN_LABEL = os.getenv("SOFTHSM_TOKEN_LABEL", os.getenv("HSM_LABEL", "payment-hsm"))
 USER_PIN = os.getenv("SOFTHSM_USER_PIN", os.getenv("HSM_PIN", "5678"))
+SESSION_POOL_SIZE = int(os.getenv("HSM_SESSION_POOL_SIZE", "4"))
+MAX_QUEUE_DEPTH = int(os.getenv("HSM_MAX_QUEUE_DEPTH", "64"))
+RETRY_AFTER_SECONDS = int(os.getenv("HSM_RETRY_AFTER_SECONDS", "1"))
 
-_LIB = pkcs11.lib(os.getenv("SOFTHSM_MODULE", DEFAULT_LIBRARY))
-_TOKEN = _LIB.get_token(token_label=TOKEN_LABEL)
-_SESSION_LOCK = threading.Lock()
-_SESSION: pkcs11.Session | None = None
+_LIB: pkcs11.lib | None = None
+_TOKEN: pkcs11.Token | None = None
+# Set in a forked child whose parent had already loaded the library.
+_INHERITED_LIB = False
+_INIT_LOCK = threading.Lock()
 
 
-def _open_session() -> pkcs11.Session:
-    return _TOKEN.open(user_pin=USER_PIN)
+def _new_pool() -> queue.LifoQueue[pkcs11.Session | None]:
+    # Slots start empty and are opened on first use; a session is used by one thread at a time.
+    pool: queue.LifoQueue[pkcs11.Session | None] = queue.LifoQueue()
+    for _ in range(SESSION_POOL_SIZE):
+        pool.put(None)
+    return pool
 
 
-def _close_session() -> None:
-    global _SESSION
-    session, _SESSION = _SESSION, None
-    if session is not None:
-        try:
-            session.close()
-        except PKCS11Error:
-            pass
+_POOL = _new_pool()
+# Key objects are bound to the session that looked them up.
+_KEY_HANDLES: dict[pkcs11.Session, dict[tuple[ObjectClass, str], Key]] = {}
 
 
-def _get_session() -> pkcs11.Session:
-    global _SESSION
-    if _SESSION is None:
-        _SESSION = _open_session()
-    return _SESSION
+def _token() -> pkcs11.Token:
+    global _LIB, _TOKEN, _INHERITED_LIB
+    if _TOKEN is None:
+        with _INIT_LOCK:
+            if _TOKEN is None:
+                if _LIB is None:
+                    _LIB = pkcs11.lib(os.getenv("SOFTHSM_MODULE", DEFAULT_LIBRARY))
+                elif _INHERITED_LIB:
+                    # C_Finalize/C_Initialize: the copy of the parent's state is unusable.
+                    _LIB.reinitialize()
+                    _INHERITED_LIB = False
+                _TOKEN = _LIB.get_token(token_label=TOKEN_LABEL)
+    return _TOKEN
 
 
-atexit.register(_close_session)
+def is_initialized() -> bool:
+    return _TOKEN is not None
 
 
-@contextmanager
-def session_scope() -> Iterator[pkcs11.Session]:
-    """Provide a shared SoftHSM session with serialized access."""
-    with _SESSION_LOCK:
-        session = _get_session()
+def _reset_after_fork() -> None:
+    """Drop PKCS#11 state copied from the parent; it is rebuilt on first use.
+
+    Inherited sessions are abandoned rather than closed: their handles belong to
+    the parent's Cryptoki instance.
+    """
+    global _TOKEN, _POOL, _INHERITED_LIB, _INIT_LOCK
+    _INHERITED_LIB = _LIB is not None
+    _TOKEN = None
+    _POOL = _new_pool()
+    _KEY_HANDLES.clear()
+    _INIT_LOCK = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _open_session() -> pkcs11.Session:
+    return _token().open(user_pin=USER_PIN)
+
+
+def _discard_session(session: pkcs11.Session) -> None:
+    _KEY_HANDLES.pop(session, None)
+    try:
+        session.close()
+    except PKCS11Error:
+        pass
+
+
+def _close_sessions() -> None:
+    for _ in range(SESSION_POOL_SIZE):
         try:
-            yield session
-        except PKCS11Error:
-            # force session reinitialisation on next use
-            _close_session()
-            raise
+            session = _POOL.get_nowait()
+        except queue.Empty:
+            break
+        if session is not None:
+            _discard_session(session)
+
+
+atexit.register(_close_sessions)
 
 
-def _ensure_signing_key(session: pkcs11.Session) -> None:
+@contextmanager
+def session_scope() -> Iterator[pkcs11.Session]:
+    """Borrow a session from the pool, blocking while all are in use."""
+    waited_from = perf_counter()
+    pool = _POOL
+    session = pool.get()
+    HSM_LOCK_WAIT_SECONDS.observe(perf_counter() - waited_from)
     try:
-        session.get_key(
-            object_class=ObjectClass.PRIVATE_KEY,
-            key_type=KeyType.RSA,
-            label=SIGNING_KEY_LABEL,
-        )
+        if session is None:
+            session = _open_session()
+        yield session
+    except PKCS11Error:
+        # force session reinitialisation on next use
+        if session is not None:
+            _discard_session(session)
+            session = None
+        raise
+    finally:
+        pool.put(session)
+
+
+def signing_key_label(version: int) -> str:
+    # Version 1 is the original unversioned key; later versions carry a suffix.
+    if version == 1:
+        return SIGNING_KEY_LABEL
+    return f"{SIGNING_KEY_LABEL}-{version}"
+
+
+def signing_kid(version: int = SIGNING_KEY_VERSION) -> str:
+    """Key id placed in signed receipts; the HSM label doubles as the kid."""
+    return signing_key_label(version)
+
+
+def _signing_key_version(label: str) -> int | None:
+    if label == SIGNING_KEY_LABEL:
+        return 1
+    prefix = f"{SIGNING_KEY_LABEL}-"
+    if label.startswith(prefix) and label[len(prefix):].isdigit():
+        return int(label[len(prefix):])
+    return None
+
+
+# DER-encoded curve OIDs for CKA_EC_PARAMS: prime256v1 and id-Ed25519.
+_P256_PARAMS = bytes.fromhex("06082a8648ce3d030107")
+_ED25519_PARAMS = bytes.fromhex("06032b6570")
+_SIGNING_KEY_TYPES = {
+    signing.RS256: KeyType.RSA,
+    signing.ES256: KeyType.EC,
+    signing.EDDSA: KeyType.EC_EDWARDS,
+}
+
+
+def _ensure_signing_key(
+    session: pkcs11.Session,
+    version: int = SIGNING_KEY_VERSION,
+    algorithm: str = SIGNING_ALGORITHM,
+) -> None:
+    label = signing_key_label(version)
+    key_type = _SIGNING_KEY_TYPES[algorithm]
+    try:
+        existing = session.get_key(object_class=ObjectClass.PRIVATE_KEY, label=label)
     except NoSuchKey:
-        public_template = {
-            Attribute.LABEL: SIGNING_KEY_LABEL,
-            Attribute.TOKEN: True,
-            Attribute.PUBLIC_EXPONENT: (1 << 16) + 1,
-            Attribute.VERIFY: True,
-        }
-        private_template = {
-            Attribute.LABEL: SIGNING_KEY_LABEL,
-            Attribute.TOKEN: True,
-            Attribute.SIGN: True,
-            Attribute.EXTRACTABLE: False,
-        }
+        pass
+    else:
+        if existing.key_type != key_type:
+            raise ValueError(
+                f"signing key {label} is {existing.key_type.name}, not {algorithm}; "
+                "bump HSM_SIGNING_KEY_VERSION to switch algorithms"
+            )
+        return
+
+    public_template = {
+        Attribute.LABEL: label,
+        Attribute.TOKEN: True,
+        Attribute.VERIFY: True,
+    }
+    private_template = {
+        Attribute.LABEL: label,
+        Attribute.TOKEN: True,
+        Attribute.SIGN: True,
+        Attribute.EXTRACTABLE: False,
+    }
+    if key_type is KeyType.RSA:
         session.generate_keypair(
             KeyType.RSA,
             2048,
-            public_template=public_template,
+            public_template=public_template | {Attribute.PUBLIC_EXPONENT: (1 << 16) + 1},
             private_template=private_template,
         )
+        return
+    # EC key generation takes the curve as domain parameters rather than a key length.
+    if key_type is KeyType.EC:
+        params = session.create_domain_parameters(KeyType.EC, {Attribute.EC_PARAMS: _P256_PARAMS}, local=True)
+        mechanism = Mechanism.EC_KEY_PAIR_GEN
+    else:
+        params = session.create_domain_parameters(
+            KeyType.EC_EDWARDS, {Attribute.EC_PARAMS: _ED25519_PARAMS}, local=True
+        )
+        mechanism = Mechanism.EC_EDWARDS_KEY_PAIR_GEN
+    params.generate_keypair(
+        store=True,
+        label=label,
+        mechanism=mechanism,
+        public_template=public_template,
+        private_template=private_template,
+    )
+
+
+def encryption_key_label(key_id: int) -> str:
+    # Key id 1 is the original unversioned key; later versions carry a suffix.
+    if key_id == token_format.DEFAULT_KEY_ID:
+        return ENCRYPTION_KEY_LABEL
+    return f"{ENCRYPTION_KEY_LABEL}-{key_id}"
+
+
+def token_mac_key_label(key_id: int) -> str:
+    # Versioned with the encryption key: a v2 token's key id selects both.
+    if key_id == token_format.DEFAULT_KEY_ID:
+        return TOKEN_MAC_KEY_LABEL
+    return f"{TOKEN_MAC_KEY_LABEL}-{key_id}"
+
+
+def _ensure_token_mac_key(session: pkcs11.Session) -> None:
+    label = token_mac_key_label(ENCRYPTION_KEY_ID)
+    try:
+        session.get_key(
+            object_class=ObjectClass.SECRET_KEY,
+            key_type=KeyType.GENERIC_SECRET,
+            label=label,
+        )
+    except NoSuchKey:
+        session.generate_key(
+            KeyType.GENERIC_SECRET,
+            256,
+            template={
+                Attribute.LABEL: label,
+                Attribute.TOKEN: True,
+                Attribute.SIGN: True,
+                Attribute.VERIFY: True,
+                Attribute.SENSITIVE: True,
+                Attribute.EXTRACTABLE: False,
+            },
+        )
 
 
 def _ensure_encryption_key(session: pkcs11.Session) -> None:
+    label = encryption_key_label(ENCRYPTION_KEY_ID)
     try:
         session.get_key(
             object_class=ObjectClass.SECRET_KEY,
             key_type=KeyType.AES,
-            label=ENCRYPTION_KEY_LABEL,
+            label=label,
         )
     except NoSuchKey:
         session.generate_key(
             KeyType.AES,
             256,
             template={
-                Attribute.LABEL: ENCRYPTION_KEY_LABEL,
+                Attribute.LABEL: label,
                 Attribute.TOKEN: True,
                 Attribute.ENCRYPT: True,
                 Attribute.DECRYPT: True,
@@ -116,76 +296,246 @@ def _ensure_encryption_key(session: pkcs11.Session) -> None:
 
 def initialize_keys_if_not_exist() -> None:
     """Ensure signing and encryption keys exist within the token."""
-    with session_scope() as session:
+    with session_scope() as session, hsm_op_timer("provision"):
         _ensure_signing_key(session)
         _ensure_encryption_key(session)
+        _ensure_token_mac_key(session)
 
 
-def _get_signing_private_key(session: pkcs11.Session) -> Key:
-    return session.get_key(
-        object_class=ObjectClass.PRIVATE_KEY,
-        key_type=KeyType.RSA,
-        label=SIGNING_KEY_LABEL,
-    )
+def _get_key(session: pkcs11.Session, object_class: ObjectClass, key_type: KeyType | None, label: str) -> Key:
+    handles = _KEY_HANDLES.setdefault(session, {})
+    key = handles.get((object_class, label))
+    if key is None:
+        key = handles[(object_class, label)] = session.get_key(
+            object_class=object_class,
+            key_type=key_type,
+            label=label,
+        )
+    return key
 
 
-def _get_signing_public_key(session: pkcs11.Session) -> Key:
-    return session.get_key(
-        object_class=ObjectClass.PUBLIC_KEY,
-        key_type=KeyType.RSA,
-        label=SIGNING_KEY_LABEL,
-    )
+def _get_signing_private_key(session: pkcs11.Session, version: int = SIGNING_KEY_VERSION) -> Key:
+    # The key type is whatever the version was generated as, so it is not filtered on.
+    return _get_key(session, ObjectClass.PRIVATE_KEY, None, signing_key_label(version))
 
 
-def _get_encryption_key(session: pkcs11.Session) -> Key:
-    return session.get_key(
-        object_class=ObjectClass.SECRET_KEY,
-        key_type=KeyType.AES,
-        label=ENCRYPTION_KEY_LABEL,
-    )
+def _get_signing_public_key(session: pkcs11.Session, version: int = SIGNING_KEY_VERSION) -> Key:
+    return _get_key(session, ObjectClass.PUBLIC_KEY, None, signing_key_label(version))
+
+
+def _get_encryption_key(session: pkcs11.Session, key_id: int = ENCRYPTION_KEY_ID) -> Key:
+    return _get_key(session, ObjectClass.SECRET_KEY, KeyType.AES, encryption_key_label(key_id))
 
 
-def sign_message(message: str) -> bytes:
-    data = message.encode("utf-8")
-    with session_scope() as session:
-        key = _get_signing_private_key(session)
-        signature = key.sign(data, mechanism=Mechanism.SHA256_RSA_PKCS)
-        return bytes(signature)
+def _get_token_mac_key(session: pkcs11.Session, key_id: int = ENCRYPTION_KEY_ID) -> Key:
+    return _get_key(session, ObjectClass.SECRET_KEY, KeyType.GENERIC_SECRET, token_mac_key_label(key_id))
 
 
-def get_public_key_der() -> bytes:
-    with session_scope() as session:
-        key = _get_signing_public_key(session)
+def _token_tag(key: Key, signed: bytes) -> bytes:
+    return bytes(key.sign(signed, mechanism=Mechanism.SHA256_HMAC))[: token_format.TAG_SIZE]
+
+
+def warm_up() -> None:
+    """Open every pooled session and look up the active keys.
+
+    Run once per worker before it takes traffic, so the first requests do not
+    pay for C_Initialize, C_OpenSession/C_Login and the key searches. All slots
+    are held at once; borrowing them one by one would reuse the same session.
+    """
+    with ExitStack() as stack, hsm_op_timer("warm_up"):
+        for _ in range(SESSION_POOL_SIZE):
+            session = stack.enter_context(session_scope())
+            _get_signing_private_key(session)
+            _get_encryption_key(session)
+            if TOKEN_FORMAT == "v2":
+                _get_token_mac_key(session)
+
+
+def _ec_point(key: Key, size: int) -> bytes:
+    # CKA_EC_POINT is normally a DER OCTET STRING around the point; some tokens return it bare.
+    raw = bytes(key[Attribute.EC_POINT])
+    return raw[2:] if len(raw) == size + 2 else raw
+
+
+def _public_key(key: Key) -> signing.PublicKey:
+    if key.key_type is KeyType.RSA:
         modulus = int.from_bytes(key[Attribute.MODULUS], "big")
         exponent = int.from_bytes(key[Attribute.PUBLIC_EXPONENT], "big")
-    public_numbers = rsa.RSAPublicNumbers(exponent, modulus)
-    public_key = public_numbers.public_key()
+        return rsa.RSAPublicNumbers(exponent, modulus).public_key()
+    if key.key_type is KeyType.EC:
+        return ec.EllipticCurvePublicKey.from_encoded_point(ec.SECP256R1(), _ec_point(key, 65))
+    return ed25519.Ed25519PublicKey.from_public_bytes(_ec_point(key, 32))
+
+
+def _sign(key: Key, data: bytes) -> bytes:
+    if key.key_type is KeyType.RSA:
+        return bytes(key.sign(data, mechanism=Mechanism.SHA256_RSA_PKCS))
+    if key.key_type is KeyType.EC:
+        # Hash locally and use plain CKM_ECDSA: every token has it, not all have ECDSA_SHA256,
+        # and only 32 bytes cross the PKCS#11 boundary.
+        return bytes(key.sign(hashlib.sha256(data).digest(), mechanism=Mechanism.ECDSA))
+    return bytes(key.sign(data, mechanism=Mechanism.EDDSA))
+
+
+def sign_message(message: str | bytes, version: int = SIGNING_KEY_VERSION) -> bytes:
+    data = message.encode("utf-8") if isinstance(message, str) else message
+    with session_scope() as session, hsm_op_timer("sign"):
+        return _sign(_get_signing_private_key(session, version), data)
+
+
+def get_public_key_der(version: int = SIGNING_KEY_VERSION) -> bytes:
+    with session_scope() as session, hsm_op_timer("public_key"):
+        public_key = _public_key(_get_signing_public_key(session, version))
     return public_key.public_bytes(serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
 
 
+def list_signing_keys() -> dict[str, list[dict[str, str]]]:
+    """JWKS of every signing key version on the token, newest first.
+
+    The configured version is ``active``. Older versions stay on the token as
+    ``retired`` so receipts they signed can still be verified; a version
+    provisioned ahead of a rotation is published as ``next``.
+    """
+    keys = []
+    with session_scope() as session, hsm_op_timer("public_key"):
+        for key in session.get_objects({Attribute.CLASS: ObjectClass.PUBLIC_KEY}):
+            version = _signing_key_version(key.label)
+            if version is None or key.key_type not in _SIGNING_KEY_TYPES.values():
+                continue
+            if version == SIGNING_KEY_VERSION:
+                status = signing.ACTIVE
+            else:
+                status = signing.RETIRED if version < SIGNING_KEY_VERSION else signing.NEXT
+            keys.append((version, signing.public_jwk(key.label, _public_key(key), status)))
+    return {"keys": [jwk for _, jwk in sorted(keys, key=lambda item: item[0], reverse=True)]}
+
+
 def encrypt_token(plaintext: bytes) -> str:
-    with session_scope() as session:
+    packed = token_format.pack_digits(plaintext) if TOKEN_FORMAT == "v2" else None
+    iv = os.urandom(token_format.NONCE_SIZE)
+    with session_scope() as session, hsm_op_timer("encrypt"):
         key = _get_encryption_key(session)
-        iv = os.urandom(16)
-        ciphertext = key.encrypt(
-            plaintext,
-            mechanism=Mechanism.AES_CBC_PAD,
-            mechanism_param=iv,
+        ciphertext = bytes(
+            key.encrypt(
+                packed if packed is not None else plaintext,
+                mechanism=Mechanism.AES_CBC_PAD,
+                mechanism_param=iv,
+            )
         )
-    blob = base64.urlsafe_b64encode(iv + bytes(ciphertext)).decode("ascii")
-    return f"hsm:v1:{blob}"
+        if TOKEN_FORMAT == "v1":
+            return token_format.encode_v1(iv, ciphertext)
+        flags = token_format.FLAG_BCD if packed is not None else 0
+        signed = token_format.encode_signed(ENCRYPTION_KEY_ID, int(time()), iv, ciphertext, flags)
+        tag = _token_tag(_get_token_mac_key(session), signed)
+    return token_format.encode_text(token_format.encode_binary(signed, tag))
+
+
+def decrypt_token(token: str | token_format.ParsedToken) -> bytes:
+    parsed = token if isinstance(token, token_format.ParsedToken) else token_format.parse_token(token)
+    # PKCS#11 needs contiguous bytes; this is the only copy made of the token body.
+    iv, ciphertext = bytes(parsed.nonce), bytes(parsed.ciphertext)
+    try:
+        with session_scope() as session, hsm_op_timer("decrypt"):
+            # Encrypt-then-MAC: a token whose header or body was altered is never decrypted.
+            if parsed.tag is not None:
+                expected = _token_tag(_get_token_mac_key(session, parsed.key_id), bytes(parsed.signed))
+                if not hmac.compare_digest(expected, parsed.tag):
+                    raise ValueError("token authentication failed")
+            key = _get_encryption_key(session, parsed.key_id)
+            plaintext = bytes(
+                key.decrypt(
+                    ciphertext,
+                    mechanism=Mechanism.AES_CBC_PAD,
+                    mechanism_param=iv,
+                )
+            )
+    except NoSuchKey as exc:
+        raise ValueError(f"unknown token key id {parsed.key_id}") from exc
+    except (EncryptedDataInvalid, EncryptedDataLenRange) as exc:
+        raise ValueError("token decryption failed") from exc
+    if parsed.flags & token_format.FLAG_BCD:
+        return token_format.unpack_digits(plaintext)
+    return plaintext
+
+
+_T = TypeVar("_T")
+
+
+class HSMSaturated(RuntimeError):
+    """Raised instead of queueing when the HSM executor backlog is full."""
+
+    def __init__(self, op: str, retry_after: int = RETRY_AFTER_SECONDS) -> None:
+        super().__init__(f"HSM executor saturated ({op})")
+        self.retry_after = retry_after
+
+
+class AsyncHSM:
+    """Runs the blocking PKCS#11 calls on a thread pool sized to the session pool.
+
+    Calls beyond ``workers + max_queue`` outstanding are rejected with
+    :class:`HSMSaturated` so callers can shed load instead of piling up behind
+    the HSM. ``shed=False`` is for work that must finish once started, such as
+    signing the receipt of a payment the PSP has already captured.
+    """
+
+    def __init__(self, workers: int = SESSION_POOL_SIZE, max_queue: int = MAX_QUEUE_DEPTH) -> None:
+        self.workers = workers
+        self.limit = workers + max_queue
+        self.pending = 0
+        self._executor: ThreadPoolExecutor | None = None
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="hsm")
+        return self._executor
+
+    async def _run(self, op: str, shed: bool, func: Callable[..., _T], *args: Any) -> _T:
+        # Only touched from the event loop thread, so no lock is needed.
+        if shed and self.pending >= self.limit:
+            HSM_REJECTED.labels(op).inc()
+            raise HSMSaturated(op)
+        self.pending += 1
+        HSM_EXECUTOR_PENDING.inc()
+        try:
+            # Copy the context so trace spans and stage timers see the caller's state.
+            context = contextvars.copy_context()
+            return await asyncio.get_running_loop().run_in_executor(self._pool(), context.run, func, *args)
+        finally:
+            self.pending -= 1
+            HSM_EXECUTOR_PENDING.dec()
 
+    async def sign(self, message: str | bytes, *, shed: bool = True) -> bytes:
+        return await self._run("sign", shed, sign_message, message)
 
-def decrypt_token(token: str) -> bytes:
-    if not token.startswith("hsm:v1:"):
-        raise ValueError("unsupported token format")
-    payload = base64.urlsafe_b64decode(token.split(":", 2)[2])
-    iv, ciphertext = payload[:16], payload[16:]
-    with session_scope() as session:
-        key = _get_encryption_key(session)
-        plaintext = key.decrypt(
-            ciphertext,
-            mechanism=Mechanism.AES_CBC_PAD,
-            mechanism_param=iv,
-        )
-    return bytes(plaintext)
+    async def encrypt(self, plaintext: bytes, *, shed: bool = True) -> str:
+        return await self._run("encrypt", shed, encrypt_token, plaintext)
+
+    async def decrypt(self, token: str | token_format.ParsedToken, *, shed: bool = True) -> bytes:
+        return await self._run("decrypt", shed, decrypt_token, token)
+
+    async def public_key_der(self, *, shed: bool = True) -> bytes:
+        return await self._run("public_key", shed, get_public_key_der)
+
+    async def warm_up(self) -> None:
+        await self._run("warm_up", False, warm_up)
+
+    async def jwks(self, *, shed: bool = True) -> dict[str, list[dict[str, str]]]:
+        return await self._run("public_key", shed, list_signing_keys)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            executor.shutdown(wait=True)
+
+    def _reset_after_fork(self) -> None:
+        # Worker threads do not survive fork; the child builds its own pool lazily.
+        self._executor = None
+        self.pending = 0
+
+
+hsm = AsyncHSM()
+os.register_at_fork(after_in_child=hsm._reset_after_fork)
+
+
+if __name__ == "__main__":
+    initialize_keys_if_not_exist()
@@ -2,39 +2,77 @@ from __future__ import annotations
 
 import asyncio
 import base64
-import hashlib
-import json
 import logging
 import os
+import time
+import uuid
 from datetime import datetime, timezone
-from typing import Annotated
+from typing import Annotated, AsyncIterator
 
 import httpx
-from fastapi import Depends, FastAPI, Header, HTTPException, status
-from sqlalchemy import select
+from fastapi import Depends, FastAPI, Header, HTTPException, Request, status
+from fastapi.responses import JSONResponse
+from sqlalchemy import func, select, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 
 import messaging
+import receipt_cache
 import schemas
-from database import get_session, init_db
-from hsm_service import decrypt_token, encrypt_token, get_public_key_der, initialize_keys_if_not_exist, sign_message
-from models import PaymentIntent, PaymentStatus, UsedToken
+from database import get_sessions, router, verify_schema
+from fraud_client import FraudDecider
+from hsm_service import HSMSaturated, hsm, initialize_keys_if_not_exist, signing_kid
+from models import PaymentIntent, PaymentStatus, UsedToken, UsedV1Token
+from payment_pipeline import PaymentPipeline, Steps
 from psp_client import PSPMock, build_psp
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="[%(asctime)s] [%(name)s] [%(levelname)s] %(message)s"
-)
+from token_format import MAX_CLOCK_SKEW_SECONDS, TOKEN_TTL_SECONDS, ParsedToken, parse_token
+from shared import receipts
+from shared.admission import Admission, Overloaded, RateLimited
+from shared.db import RawJSON
+from shared.log import HEALTH_SAMPLE, configure_logging
+from shared.metrics import instrument_app, stage_timer
+from shared.partitions import USED_TOKEN_RETENTION_DAYS, replay_window_start
+from shared.sharding import SessionSet
+from shared.tracing import start_span, trace_app
+from shared.transport import INTERNAL_TRANSPORT, internal_client
+
+configure_logging("payment_orchestrator")
 logger = logging.getLogger(__name__)
 
 ORDER_SERVICE_URL = os.getenv("ORDER_SERVICE_URL", "http://order_service:8000")
-FRAUD_ENGINE_URL = os.getenv("FRAUD_ENGINE_URL", "http://fraud_engine:8000")
 PSP_PROVIDER = os.getenv("PSP_PROVIDER", "mock")
+HSM_PROVISION_KEYS = os.getenv("HSM_PROVISION_KEYS", "false").lower() in {"1", "true", "yes"}
+JWKS_CACHE_SECONDS = int(os.getenv("JWKS_CACHE_SECONDS", "300"))
+HSM_WARM_UP_RETRY_SECONDS = float(os.getenv("HSM_WARM_UP_RETRY_SECONDS", "5"))
+# Async mode answers POST /payments with 202; clients opt in per request with "Prefer: respond-async".
+PAYMENTS_ASYNC_DEFAULT = os.getenv("PAYMENTS_ASYNC_DEFAULT", "false").lower() in {"1", "true", "yes"}
+PAYMENT_MAX_WAIT_SECONDS = float(os.getenv("PAYMENT_MAX_WAIT_SECONDS", "30"))
+PAYMENT_WAIT_POLL_SECONDS = float(os.getenv("PAYMENT_WAIT_POLL_SECONDS", "0.5"))
+PAYMENT_PAGE_SIZE = int(os.getenv("PAYMENT_PAGE_SIZE", "50"))
+PAYMENT_MAX_PAGE_SIZE = int(os.getenv("PAYMENT_MAX_PAGE_SIZE", "200"))
+# "events": order status changes go to the order service's consumer through RabbitMQ;
+# "http": the previous synchronous PUT /orders/{id}/status call.
+ORDER_STATUS_MODE = os.getenv("ORDER_STATUS_MODE", "events").lower()
+if ORDER_STATUS_MODE not in {"events", "http"}:
+    raise ValueError(f"ORDER_STATUS_MODE must be events or http, not {ORDER_STATUS_MODE!r}")
+# The replay guard only keeps used tokens for the retention period, so no token may outlive it.
+if TOKEN_TTL_SECONDS > USED_TOKEN_RETENTION_DAYS * 86400:
+    raise ValueError("PAYMENT_TOKEN_TTL_DAYS must not exceed USED_TOKEN_RETENTION_DAYS")
 
 app = FastAPI(title="Payment Orchestrator")
+instrument_app(app, "payment_orchestrator")
+trace_app(app, "payment_orchestrator")
 
 _http_client: httpx.AsyncClient | None = None
 _psp_client: PSPMock | None = None
+_fraud_decider: FraudDecider | None = None
+_pipeline: PaymentPipeline | None = None
+_admission: Admission | None = None
+_order_events: messaging.OrderStatusPublisher | None = None
+# Readiness: set once this worker's HSM sessions and keys are loaded.
+_hsm_warm = False
+_warm_up_task: asyncio.Task | None = None
+# (expires_at, jwks); the key set only changes when keys are provisioned.
+_jwks_cache: tuple[float, dict] | None = None
 
 
 def mask_pan(pan: str) -> str:
@@ -57,30 +95,101 @@ async def require_user(
     return x_user_id
 
 
+def client_ip(request: Request) -> str | None:
+    """The caller's address as Envoy saw it.
+
+    Envoy runs with ``use_remote_address`` and appends the downstream address to
+    X-Forwarded-For, so the last entry is the one a client cannot forge.
+    """
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded:
+        return forwarded.rsplit(",", 1)[-1].strip() or None
+    return request.client.host if request.client else None
+
+
+def _is_overload(exc: BaseException) -> bool:
+    """Client errors and disconnects say nothing about capacity; everything else lowers the limit."""
+    if isinstance(exc, HTTPException):
+        return exc.status_code >= 500
+    return not isinstance(exc, asyncio.CancelledError)
+
+
+async def admitted_user(user_id: Annotated[str, Depends(require_user)]) -> AsyncIterator[str]:
+    """``require_user`` plus admission control, for endpoints that reach the HSM, DB or PSP."""
+    if _admission is None:
+        raise RuntimeError("Admission control not initialised")
+    async with _admission.admit(user_id):
+        yield user_id
+
+
+async def _warm_up_hsm() -> None:
+    """Load the HSM in the background; /health answers meanwhile, /ready does not."""
+    global _hsm_warm
+    while True:
+        started = time.perf_counter()
+        try:
+            await hsm.warm_up()
+        except Exception as exc:
+            logger.warning("[STARTUP] HSM warm-up failed, retrying in %ss: %s", HSM_WARM_UP_RETRY_SECONDS, exc)
+            await asyncio.sleep(HSM_WARM_UP_RETRY_SECONDS)
+            continue
+        _hsm_warm = True
+        logger.info("[STARTUP] HSM warm in %.0f ms, ready for traffic", (time.perf_counter() - started) * 1000)
+        return
+
+
 @app.on_event("startup")
 async def on_startup() -> None:
-    global _http_client, _psp_client
+    global _http_client, _psp_client, _fraud_decider, _pipeline, _admission, _order_events, _warm_up_task
     logger.info("[STARTUP] Initializing Payment Orchestrator...")
     
-    logger.info("[STARTUP] Initializing HSM keys...")
-    initialize_keys_if_not_exist()
-    logger.info("[STARTUP] HSM keys initialized successfully")
+    if HSM_PROVISION_KEYS:
+        logger.info("[STARTUP] Initializing HSM keys...")
+        initialize_keys_if_not_exist()
+        logger.info("[STARTUP] HSM keys initialized successfully")
+
+    revision = await verify_schema()
+    logger.info("[STARTUP] Database schema at revision %s on %s shard(s)", revision, len(router.shards))
+    router.start()
     
-    await init_db()
-    logger.info("[STARTUP] Database initialized")
-    
-    _http_client = httpx.AsyncClient(timeout=httpx.Timeout(10.0))
+    _http_client = internal_client(timeout=httpx.Timeout(10.0), traced=True)
+    logger.info("[STARTUP] Internal transport: %s", INTERNAL_TRANSPORT)
     _psp_client = build_psp()
-    logger.info(f"[STARTUP] PSP provider: {PSP_PROVIDER}")
-    logger.info("[STARTUP] Payment Orchestrator ready")
+    _fraud_decider = FraudDecider(_http)
+    logger.info("[STARTUP] PSP provider: %s", PSP_PROVIDER)
+    if ORDER_STATUS_MODE == "events":
+        _order_events = messaging.OrderStatusPublisher()
+        _order_events.start()
+    logger.info("[STARTUP] Order status updates: %s", ORDER_STATUS_MODE)
+    _pipeline = PaymentPipeline(Steps(_fraud_check, _update_order_status, _psp_charge, PSP_PROVIDER))
+    _pipeline.start()
+    _admission = Admission(is_overload=_is_overload)
+    logger.info(
+        "[STARTUP] Admission control: enabled=%s, rate limiter=%s",
+        _admission.enabled, type(_admission.buckets).__name__,
+    )
+    _warm_up_task = asyncio.create_task(_warm_up_hsm())
+    logger.info("[STARTUP] Payment Orchestrator started")
 
 
 @app.on_event("shutdown")
 async def on_shutdown() -> None:
     global _http_client
+    if _warm_up_task is not None:
+        _warm_up_task.cancel()
+    if _pipeline is not None:
+        await _pipeline.stop()
+    if _fraud_decider is not None:
+        await _fraud_decider.aclose()
+    if _admission is not None:
+        await _admission.aclose()
+    if _order_events is not None:
+        await asyncio.to_thread(_order_events.close)
     if _http_client is not None:
         client, _http_client = _http_client, None
         await client.aclose()
+    await router.aclose()
+    hsm.shutdown()
     logger.info("[SHUTDOWN] Payment Orchestrator shutting down")
 
 
@@ -90,6 +199,18 @@ def _http() -> httpx.AsyncClient:
     return _http_client
 
 
+def _fraud() -> FraudDecider:
+    if _fraud_decider is None:
+        raise RuntimeError("Fraud decider not initialised")
+    return _fraud_decider
+
+
+def _pipe() -> PaymentPipeline:
+    if _pipeline is None:
+        raise RuntimeError("Payment pipeline not initialised")
+    return _pipeline
+
+
 def _psp() -> PSPMock:
     if _psp_client is None:
         raise RuntimeError("PSP client not initialised")
@@ -100,38 +221,100 @@ async def _psp_charge(**kwargs: object) -> dict:
     return await asyncio.to_thread(_psp().charge, **kwargs)
 
 
+@app.exception_handler(HSMSaturated)
+async def hsm_saturated_handler(_request: Request, exc: HSMSaturated) -> JSONResponse:
+    logger.warning("[HSM] Shedding request: %s", exc)
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "HSM busy, retry later"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(RateLimited)
+async def rate_limited_handler(_request: Request, exc: RateLimited) -> JSONResponse:
+    logger.warning("[ADMISSION] Shedding request: %s", exc)
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"detail": "rate limit exceeded, retry later"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(_request: Request, exc: Overloaded) -> JSONResponse:
+    logger.warning("[ADMISSION] Shedding request: %s", exc)
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "service busy, retry later"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
 @app.get("/health", tags=["health"])
 async def health() -> dict[str, str]:
-    logger.info("[HEALTH] Health check requested")
+    logger.info("[HEALTH] Health check requested", extra=HEALTH_SAMPLE)
     return {"status": "ok", "provider": PSP_PROVIDER}
 
 
+@app.get("/ready", tags=["health"])
+async def ready() -> JSONResponse:
+    """Readiness, unlike /health (liveness): 503 until startup has finished and the HSM is warm."""
+    if not _hsm_warm:
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"status": "starting", "hsm": "cold"},
+        )
+    return JSONResponse({"status": "ready", "hsm": "warm"})
+
+
 @app.post("/sign", response_model=schemas.SignResponse)
 async def sign_endpoint(payload: schemas.SignRequest) -> schemas.SignResponse:
-    logger.info(f"[SIGN] Signing message (length: {len(payload.message)})")
-    signature = sign_message(payload.message)
-    logger.info(f"[SIGN] Signature generated (length: {len(signature)} bytes)")
+    logger.info("[SIGN] Signing message (length: %s)", len(payload.message))
+    signature = await hsm.sign(payload.message)
+    logger.info("[SIGN] Signature generated (length: %s bytes)", len(signature))
     return schemas.SignResponse.from_bytes(signature)
 
 
 @app.get("/public-key", response_model=schemas.PublicKeyResponse)
 async def public_key() -> schemas.PublicKeyResponse:
     logger.info("[PUBLIC_KEY] Retrieving public key from HSM")
-    public_key_der = get_public_key_der()
-    logger.info(f"[PUBLIC_KEY] Public key retrieved (DER length: {len(public_key_der)} bytes)")
+    public_key_der = await hsm.public_key_der()
+    logger.info("[PUBLIC_KEY] Public key retrieved (DER length: %s bytes)", len(public_key_der))
     return schemas.PublicKeyResponse(public_key=base64.b64encode(public_key_der).decode("ascii"))
 
 
+@app.get("/.well-known/jwks.json", response_model=schemas.JWKSResponse)
+async def jwks() -> JSONResponse:
+    global _jwks_cache
+    now = time.monotonic()
+    if _jwks_cache is None or _jwks_cache[0] <= now:
+        keys = await hsm.jwks()
+        _jwks_cache = (now + JWKS_CACHE_SECONDS, keys)
+        logger.info("[JWKS] Loaded %s signing keys from HSM", len(keys["keys"]))
+    return JSONResponse(_jwks_cache[1], headers={"Cache-Control": f"public, max-age={JWKS_CACHE_SECONDS}"})
+
+
 @app.get("/payment/health", tags=["health"])
 async def payment_health_alias() -> dict[str, str]:
     return await health()
 
 
+@app.get("/payment/ready", tags=["health"])
+async def payment_ready_alias() -> JSONResponse:
+    return await ready()
+
+
 @app.get("/payment/public-key", response_model=schemas.PublicKeyResponse)
 async def payment_public_key_alias() -> schemas.PublicKeyResponse:
     return await public_key()
 
 
+@app.get("/payment/jwks", response_model=schemas.JWKSResponse)
+async def payment_jwks_alias() -> JSONResponse:
+    return await jwks()
+
+
 @app.post("/payment/sign", response_model=schemas.SignResponse)
 async def payment_sign_alias(payload: schemas.SignRequest) -> schemas.SignResponse:
     return await sign_endpoint(payload)
@@ -140,13 +323,13 @@ async def payment_sign_alias(payload: schemas.SignRequest) -> schemas.SignRespon
 @app.post("/payment/tokenize", response_model=schemas.TokenizeResponse)
 async def tokenize(
     payload: schemas.TokenizeRequest,
-    user_id: Annotated[str, Depends(require_user)],
+    user_id: Annotated[str, Depends(admitted_user)],
 ) -> schemas.TokenizeResponse:
-    logger.info(f"[TOKENIZE] Request from user: {user_id}")
-    logger.info(f"[TOKENIZE] Card brand: {card_brand(payload.pan)}, Last4: {payload.pan[-4:]}")
+    logger.info("[TOKENIZE] Request from user: %s", user_id)
+    logger.info("[TOKENIZE] Card brand: %s, Last4: %s", card_brand(payload.pan), payload.pan[-4:])
     
-    token = encrypt_token(payload.pan.encode("utf-8"))
-    logger.info(f"[TOKENIZE] Token generated: {token[:20]}... (length: {len(token)})")
+    token = await hsm.encrypt(payload.pan.encode("utf-8"))
+    logger.info("[TOKENIZE] Token generated: %s... (length: %s)", token[:20], len(token))
     
     response = schemas.TokenizeResponse(
         token=token,
@@ -157,22 +340,22 @@ async def tokenize(
         mask=mask_pan(payload.pan),
         owner=user_id,
     )
-    logger.info(f"[TOKENIZE] Tokenization successful for user {user_id}")
+    logger.info("[TOKENIZE] Tokenization successful for user %s", user_id)
     return response
 
 
 @app.post("/payment/charge", response_model=schemas.ChargeResponse)
 async def charge(
     payload: schemas.ChargeRequest,
-    user_id: Annotated[str, Depends(require_user)],
+    user_id: Annotated[str, Depends(admitted_user)],
 ) -> schemas.ChargeResponse:
     try:
-        pan = decrypt_token(payload.token).decode("utf-8")
+        pan = (await hsm.decrypt(payload.token)).decode("utf-8")
     except ValueError as exc:
-        logger.error(f"[CHARGE] Token decryption failed: {exc}")
+        logger.error("[CHARGE] Token decryption failed: %s", exc)
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
 
-    logger.info(f"[CHARGE] Processing charge for user {user_id}, amount: {payload.amount} {payload.currency}")
+    logger.info("[CHARGE] Processing charge for user %s, amount: %s %s", user_id, payload.amount, payload.currency)
     result = await _psp_charge(
         pan=pan,
         amount=payload.amount,
@@ -181,7 +364,7 @@ async def charge(
         exp_year=payload.exp_year,
         cvc=payload.cvc,
     )
-    logger.info(f"[CHARGE] PSP response: {result['status']}, ID: {result['id']}")
+    logger.info("[CHARGE] PSP response: %s, ID: %s", result['status'], result['id'])
     return schemas.ChargeResponse(
         id=result["id"],
         status=result["status"],
@@ -195,10 +378,11 @@ async def charge(
 
 
 async def _fetch_order(order_id: str, user_id: str) -> dict:
-    response = await _http().get(
-        f"{ORDER_SERVICE_URL}/orders/{order_id}",
-        headers={"x-user-id": user_id},
-    )
+    with stage_timer("order_fetch"):
+        response = await _http().get(
+            f"{ORDER_SERVICE_URL}/orders/{order_id}",
+            headers={"x-user-id": user_id},
+        )
     if response.status_code == 404:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="order not found")
     response.raise_for_status()
@@ -206,39 +390,271 @@ async def _fetch_order(order_id: str, user_id: str) -> dict:
 
 
 async def _update_order_status(order_id: str, status_value: str, user_id: str) -> None:
-    response = await _http().put(
-        f"{ORDER_SERVICE_URL}/orders/{order_id}/status",
-        headers={"x-user-id": user_id},
-        json={"status": status_value},
-    )
+    """Record an order status change; in events mode, wait for the broker's confirm.
+
+    A failed publish raises here, as a failed PUT does, instead of leaving the
+    order in its old status with nobody noticing.
+    """
+    if _order_events is not None:
+        with stage_timer("order_update"):
+            await asyncio.wrap_future(_order_events.emit(order_id, status_value, user_id))
+        return
+    with stage_timer("order_update"):
+        response = await _http().put(
+            f"{ORDER_SERVICE_URL}/orders/{order_id}/status",
+            headers={"x-user-id": user_id},
+            json={"status": status_value},
+        )
     if response.status_code == 404:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="order not found")
     response.raise_for_status()
 
 
-async def _fraud_check(amount: int, user_id: str) -> schemas.FraudDecision:
-    logger.info(f"[FRAUD] Checking transaction: amount={amount}, user={user_id}")
-    response = await _http().post(
-        f"{FRAUD_ENGINE_URL}/score",
-        json={"amount": amount, "user_ip": None, "device_id": user_id},
+async def _fraud_check(
+    amount: int, user_id: str, user_ip: str | None = None, device_id: str | None = None
+) -> schemas.FraudDecision:
+    logger.info("[FRAUD] Checking transaction: amount=%s, user=%s, ip=%s", amount, user_id, user_ip)
+    with stage_timer("fraud"):
+        decision = await _fraud().decide(amount, user_ip=user_ip, device_id=device_id, user_id=user_id)
+    logger.info("[FRAUD] Decision: action=%s, score=%s", decision.action, decision.score)
+    return decision
+
+
+def _token_lock_key(token_hash: str) -> int:
+    return int.from_bytes(bytes.fromhex(token_hash[:16]), "big", signed=True)
+
+
+async def _token_already_used(sessions: list[AsyncSession], token: ParsedToken) -> bool:
+    # used_payment_tokens is partitioned, so token_hash cannot carry a global unique
+    # index; the transaction-scoped lock serialises concurrent uses of one token.
+    # During a reshard the token may still be recorded only on its previous owner,
+    # so every owner is locked (always in the same order) and checked.
+    if token.issued_at is None:
+        # v1 tokens never expire, so their rows are kept in an unpartitioned table for good.
+        query = select(UsedV1Token.token_hash).where(UsedV1Token.token_hash == token.fingerprint)
+    else:
+        # The row may have been stamped by a replica whose clock is behind the issuer's.
+        issued_at = datetime.fromtimestamp(token.issued_at - MAX_CLOCK_SKEW_SECONDS, timezone.utc)
+        query = select(UsedToken.id).where(
+            UsedToken.token_hash == token.fingerprint,
+            UsedToken.created_at >= replay_window_start(issued_at),
+        )
+    with stage_timer("replay_check"), start_span("replay_check"):
+        for session in sessions:
+            await session.execute(select(func.pg_advisory_xact_lock(_token_lock_key(token.fingerprint))))
+            existing = await session.execute(query)
+            if existing.scalar_one_or_none() is not None:
+                return True
+    return False
+
+
+def _record_token(sessions: list[AsyncSession], token: ParsedToken, order_id: uuid.UUID) -> None:
+    # Recorded on the previous owner too, so processes not yet on the new shard list see it.
+    for session in sessions:
+        session.add(UsedToken(token_hash=token.fingerprint, order_id=order_id))
+        if token.issued_at is None:
+            session.add(UsedV1Token(token_hash=token.fingerprint, order_id=order_id))
+
+
+async def _commit(session: AsyncSession, tokens: list[AsyncSession]) -> None:
+    """Commit the used token's shards and then, when it is another one, the intent's shard.
+
+    The token goes first: if the intent's commit then fails the token stays
+    spent, which fails closed.
+    """
+    for token_session in tokens:
+        if token_session is not session:
+            await token_session.commit()
+    await session.commit()
+
+
+def _wants_async(prefer: str | None) -> bool:
+    if prefer is None:
+        return PAYMENTS_ASYNC_DEFAULT
+    preferences = {item.strip().lower() for item in prefer.split(",")}
+    if "respond-async" in preferences:
+        return True
+    if "wait" in {item.partition("=")[0] for item in preferences}:
+        return False
+    return PAYMENTS_ASYNC_DEFAULT
+
+
+async def _accept_payment(
+    payload: schemas.PaymentRequest, user_id: str, user_ip: str | None, sessions: SessionSet
+) -> JSONResponse:
+    """Validate, store a PENDING intent and hand it to the pipeline workers."""
+    order = await _fetch_order(str(payload.order_id), user_id)
+    amount = order.get("amount")
+    currency = order.get("currency", "VND")
+    if not isinstance(amount, int):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="order missing amount")
+
+    try:
+        token = parse_token(payload.payment_token)
+    except ValueError as exc:
+        logger.error("[PAYMENT] Malformed payment token: %s", exc)
+        await _update_order_status(str(payload.order_id), PaymentStatus.FAILED.value, user_id)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="invalid payment token") from exc
+
+    tokens = sessions.primaries(token.fingerprint)
+    if await _token_already_used(tokens, token):
+        logger.warning("[PAYMENT] Replay attack detected: token already used for order %s", payload.order_id)
+        await _update_order_status(str(payload.order_id), PaymentStatus.FAILED.value, user_id)
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="payment token already used")
+
+    payment_intent = PaymentIntent(
+        order_id=payload.order_id,
+        amount=amount,
+        currency=currency,
+        status=PaymentStatus.PENDING,
+        user_id=user_id,
+        payment_token=payload.payment_token,
+        client_ip=user_ip,
+        device_id=payload.device_id,
+    )
+    session = sessions.primary(user_id)
+    session.add(payment_intent)
+    _record_token(tokens, token, payload.order_id)
+    with stage_timer("db_commit"), start_span("db_commit"):
+        await _commit(session, tokens)
+    _pipe().notify()
+    logger.info("[PAYMENT] Accepted intent %s for order %s", payment_intent.id, payload.order_id)
+
+    accepted = schemas.PaymentAccepted(intent_id=payment_intent.id, status=PaymentStatus.PENDING)
+    return JSONResponse(
+        accepted.model_dump(mode="json"),
+        status_code=status.HTTP_202_ACCEPTED,
+        headers={"Location": f"/payments/intents/{payment_intent.id}", "Preference-Applied": "respond-async"},
     )
-    response.raise_for_status()
-    payload = response.json()
-    logger.info(f"[FRAUD] Decision: action={payload['action']}, score={payload['score']}")
-    return schemas.FraudDecision(**payload)
 
 
-def _hash_token(token: str) -> str:
-    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+@app.get("/payments/intents/{intent_id}", response_model=schemas.PaymentIntentStatus)
+async def payment_intent_status(
+    intent_id: uuid.UUID,
+    user_id: Annotated[str, Depends(require_user)],
+    sessions: Annotated[SessionSet, Depends(get_sessions)],
+    wait: float = 0.0,
+) -> schemas.PaymentIntentStatus:
+    """Current state of an intent; ``wait`` long-polls up to that many seconds while PENDING."""
+    # The primary: a poll must not see an older state than the previous one did.
+    session = sessions.primary(user_id)
+    deadline = time.monotonic() + min(max(wait, 0.0), PAYMENT_MAX_WAIT_SECONDS)
+    while True:
+        intent = await session.get(PaymentIntent, intent_id, populate_existing=True)
+        # Ends the read transaction so the connection goes back to the pool while waiting.
+        await session.commit()
+        if intent is None or intent.user_id != user_id:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="payment intent not found")
+        remaining = deadline - time.monotonic()
+        if intent.status != PaymentStatus.PENDING or remaining <= 0:
+            break
+        # Local workers signal completion; intents run by other processes are seen on the next poll.
+        await _pipe().wait(intent_id, min(remaining, PAYMENT_WAIT_POLL_SECONDS))
+
+    return schemas.PaymentIntentStatus(
+        intent_id=intent.id,
+        order_id=intent.order_id,
+        status=intent.status,
+        stage=intent.stage,
+        signed_receipt=intent.signed_receipt if intent.status == PaymentStatus.SUCCESS else None,
+        receipt=intent.receipt_payload if intent.status == PaymentStatus.SUCCESS else None,
+        error=intent.error if intent.status == PaymentStatus.FAILED else None,
+    )
+
 
+def _encode_cursor(created_at: datetime, intent_id: uuid.UUID) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{intent_id}".encode("ascii")).decode("ascii")
 
-@app.post("/payments", response_model=schemas.PaymentResponse)
+
+def _decode_since(since: str) -> tuple[datetime, uuid.UUID]:
+    """``since`` is a ``next_since`` cursor or an ISO-8601 timestamp."""
+    try:
+        created_at, _, intent_id = base64.urlsafe_b64decode(since.encode("ascii")).decode("ascii").partition("|")
+        return datetime.fromisoformat(created_at), uuid.UUID(intent_id)
+    except ValueError:
+        pass
+    try:
+        timestamp = datetime.fromisoformat(since)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="invalid since") from exc
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    # Nil UUID: every intent created at exactly ``timestamp`` is after the cursor.
+    return timestamp, uuid.UUID(int=0)
+
+
+@app.get("/payments", response_model=schemas.PaymentPage)
+async def list_payments(
+    user_id: Annotated[str, Depends(require_user)],
+    sessions: Annotated[SessionSet, Depends(get_sessions)],
+    since: str | None = None,
+    limit: int = PAYMENT_PAGE_SIZE,
+) -> schemas.PaymentPage:
+    """The caller's payments in creation order, after ``since`` (keyset pagination)."""
+    limit = min(max(limit, 1), PAYMENT_MAX_PAGE_SIZE)
+    query = select(PaymentIntent).where(PaymentIntent.user_id == user_id)
+    if since:
+        # Row comparison so the (user_id, created_at, id) index serves the range scan.
+        query = query.where(tuple_(PaymentIntent.created_at, PaymentIntent.id) > tuple_(*_decode_since(since)))
+    query = query.order_by(PaymentIntent.created_at, PaymentIntent.id).limit(limit)
+    # A page that trails the primary by up to DB_REPLICA_MAX_LAG_SECONDS is fine for history.
+    intents = (await sessions.read(user_id).execute(query)).scalars().all()
+    items = [receipt_cache.to_record(intent) for intent in intents]
+    next_since = _encode_cursor(intents[-1].created_at, intents[-1].id) if len(intents) == limit else None
+    return schemas.PaymentPage(items=items, next_since=next_since)
+
+
+@app.get("/payments/{order_id}", response_model=schemas.PaymentRecord)
+async def get_payment(
+    order_id: uuid.UUID,
+    user_id: Annotated[str, Depends(require_user)],
+    sessions: Annotated[SessionSet, Depends(get_sessions)],
+) -> schemas.PaymentRecord:
+    """Latest payment attempt for an order, with its signed receipt once it succeeded."""
+    cached = receipt_cache.cache.get(order_id)
+    if cached is not None and cached[0] == user_id:
+        return cached[1]
+
+    query = (
+        select(PaymentIntent)
+        .where(PaymentIntent.order_id == order_id)
+        .order_by(PaymentIntent.created_at.desc())
+        .limit(1)
+    )
+    session = sessions.read(user_id)
+    intent = (await session.execute(query)).scalar_one_or_none()
+    if (intent is None or intent.status == PaymentStatus.PENDING) and session is not sessions.primary(user_id):
+        # A lagging replica may not have the attempt yet, or only its PENDING state.
+        intent = (await sessions.primary(user_id).execute(query)).scalar_one_or_none()
+    if intent is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="payment not found")
+    if intent.user_id is None:
+        # Intents written before user_id was recorded: the order service checks ownership.
+        await _fetch_order(str(order_id), user_id)
+    elif intent.user_id != user_id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="payment not found")
+    record = receipt_cache.to_record(intent)
+    receipt_cache.cache.put(record, user_id)
+    return record
+
+
+@app.post(
+    "/payments",
+    response_model=schemas.PaymentResponse,
+    responses={status.HTTP_202_ACCEPTED: {"model": schemas.PaymentAccepted}},
+)
 async def orchestrate_payment(
     payload: schemas.PaymentRequest,
-    user_id: Annotated[str, Depends(require_user)],
-    session: Annotated[AsyncSession, Depends(get_session)],
-) -> schemas.PaymentResponse:
-    logger.info(f"[PAYMENT] Orchestrating payment for order {payload.order_id}, user {user_id}")
+    user_id: Annotated[str, Depends(admitted_user)],
+    sessions: Annotated[SessionSet, Depends(get_sessions)],
+    user_ip: Annotated[str | None, Depends(client_ip)],
+    prefer: Annotated[str | None, Header()] = None,
+) -> schemas.PaymentResponse | JSONResponse:
+    if _wants_async(prefer):
+        logger.info("[PAYMENT] Accepting async payment for order %s, user %s", payload.order_id, user_id)
+        return await _accept_payment(payload, user_id, user_ip, sessions)
+
+    logger.info("[PAYMENT] Orchestrating payment for order %s, user %s", payload.order_id, user_id)
     
     order = await _fetch_order(str(payload.order_id), user_id)
     amount = order.get("amount")
@@ -246,36 +662,46 @@ async def orchestrate_payment(
     if not isinstance(amount, int):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="order missing amount")
 
-    logger.info(f"[PAYMENT] Order details: amount={amount}, currency={currency}")
+    logger.info("[PAYMENT] Order details: amount=%s, currency=%s", amount, currency)
 
-    fraud_decision = await _fraud_check(amount, user_id)
+    fraud_decision = await _fraud_check(amount, user_id, user_ip, payload.device_id)
     if fraud_decision.action.upper() == "BLOCK":
-        logger.warning(f"[PAYMENT] Transaction BLOCKED by fraud engine for order {payload.order_id}")
+        logger.warning("[PAYMENT] Transaction BLOCKED by fraud engine for order %s", payload.order_id)
         await _update_order_status(str(payload.order_id), PaymentStatus.FAILED.value, user_id)
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="transaction blocked by fraud engine")
 
-    token_hash = _hash_token(payload.payment_token)
-    existing = await session.execute(select(UsedToken).where(UsedToken.token_hash == token_hash))
-    if existing.scalar_one_or_none():
-        logger.warning(f"[PAYMENT] Replay attack detected: token already used for order {payload.order_id}")
+    try:
+        token = parse_token(payload.payment_token)
+    except ValueError as exc:
+        logger.error("[PAYMENT] Malformed payment token: %s", exc)
+        await _update_order_status(str(payload.order_id), PaymentStatus.FAILED.value, user_id)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="invalid payment token") from exc
+
+    token_hash = token.fingerprint
+    # Used tokens are sharded by token hash, so a token is only ever spent once across all users.
+    tokens = sessions.primaries(token_hash)
+    if await _token_already_used(tokens, token):
+        logger.warning("[PAYMENT] Replay attack detected: token already used for order %s", payload.order_id)
         await _update_order_status(str(payload.order_id), PaymentStatus.FAILED.value, user_id)
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="payment token already used")
 
     try:
-        pan = decrypt_token(payload.payment_token).decode("utf-8")
+        with stage_timer("decrypt"), start_span("decrypt"):
+            pan = (await hsm.decrypt(token)).decode("utf-8")
     except ValueError as exc:
-        logger.error(f"[PAYMENT] Token decryption failed: {exc}")
+        logger.error("[PAYMENT] Token decryption failed: %s", exc)
         await _update_order_status(str(payload.order_id), PaymentStatus.FAILED.value, user_id)
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="invalid payment token") from exc
 
-    logger.info(f"[PAYMENT] Sending charge to PSP for order {payload.order_id}")
-    result = await _psp_charge(pan=pan, amount=amount, currency=currency)
+    logger.info("[PAYMENT] Sending charge to PSP for order %s", payload.order_id)
+    with stage_timer("psp"), start_span("psp", kind="client", attributes={"psp.provider": PSP_PROVIDER}):
+        result = await _psp_charge(pan=pan, amount=amount, currency=currency)
     if result.get("status") != "succeeded":
-        logger.error(f"[PAYMENT] PSP charge failed for order {payload.order_id}: {result}")
+        logger.error("[PAYMENT] PSP charge failed for order %s: %s", payload.order_id, result)
         await _update_order_status(str(payload.order_id), PaymentStatus.FAILED.value, user_id)
         raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="psp charge failed")
 
-    logger.info(f"[PAYMENT] PSP charge succeeded: {result['id']}")
+    logger.info("[PAYMENT] PSP charge succeeded: %s", result['id'])
 
     receipt = schemas.ReceiptEnvelope(
         order_id=payload.order_id,
@@ -283,31 +709,47 @@ async def orchestrate_payment(
         currency=currency,
         timestamp=datetime.now(timezone.utc),
         status=PaymentStatus.SUCCESS,
+        kid=signing_kid(),
+        provider=PSP_PROVIDER,
     )
     receipt_dict = receipt.to_serialisable() | {"psp_reference": result["id"], "last4": result["last4"]}
+    # Encoded once: these bytes are signed, stored and published unchanged.
+    receipt_bytes = receipts.encode(receipt_dict)
     
-    logger.info(f"[RECEIPT] Signing receipt for order {payload.order_id}")
-    signature_bytes = sign_message(json.dumps(receipt_dict, sort_keys=True))
+    logger.info("[RECEIPT] Signing receipt for order %s", payload.order_id)
+    with stage_timer("sign"), start_span("sign"):
+        # The PSP has captured the charge, so this call must not be shed.
+        signature_bytes = await hsm.sign(receipt_bytes, shed=False)
     signature_b64 = base64.b64encode(signature_bytes).decode("ascii")
-    logger.info(f"[RECEIPT] Receipt signed (signature length: {len(signature_bytes)} bytes)")
+    logger.info("[RECEIPT] Receipt signed (signature length: %s bytes)", len(signature_bytes))
 
+    # Timestamps are set here so the cache entry below needs no refresh query.
+    now = datetime.now(timezone.utc)
     payment_intent = PaymentIntent(
         order_id=payload.order_id,
         amount=amount,
         currency=currency,
         status=PaymentStatus.SUCCESS,
         signed_receipt=signature_b64,
-        receipt_payload=receipt_dict,
+        receipt_payload=RawJSON(receipt_bytes.decode("utf-8")),
+        user_id=user_id,
+        created_at=now,
+        updated_at=now,
     )
-    used_token = UsedToken(token_hash=token_hash, order_id=payload.order_id)
-    session.add_all([payment_intent, used_token])
-    await session.commit()
-    logger.info(f"[PAYMENT] Payment intent saved to database for order {payload.order_id}")
+    session = sessions.primary(user_id)
+    session.add(payment_intent)
+    _record_token(tokens, token, payload.order_id)
+    with stage_timer("db_commit"), start_span("db_commit"):
+        await _commit(session, tokens)
+    logger.info("[PAYMENT] Payment intent saved to database for order %s", payload.order_id)
+    receipt_cache.cache.put(receipt_cache.to_record(payment_intent), user_id)
 
     await _update_order_status(str(payload.order_id), "COMPLETED", user_id)
 
-    logger.info(f"[PAYMENT] Publishing receipt to reconciliation queue for order {payload.order_id}")
-    await asyncio.to_thread(messaging.publish_receipt, {"receipt": receipt_dict, "signature": signature_b64})
+    logger.info("[PAYMENT] Publishing receipt to reconciliation queue for order %s", payload.order_id)
+    with stage_timer("publish"), start_span("publish", kind="producer"):
+        body = receipts.message_body(receipt_bytes, signature_b64)
+        await asyncio.to_thread(messaging.publish_receipt, body)
 
-    logger.info(f"[PAYMENT] Payment orchestration completed successfully for order {payload.order_id}")
+    logger.info("[PAYMENT] Payment orchestration completed successfully for order %s", payload.order_id)
     return schemas.PaymentResponse(status=PaymentStatus.SUCCESS, signed_receipt=signature_b64, receipt=receipt_dict)
@@ -1,12 +1,29 @@
 from __future__ import annotations
 
 import json
+import logging
 import os
+import queue
+import threading
+from concurrent.futures import Future
 from contextlib import contextmanager
 
 import pika
 
+from shared.metrics import ORDER_STATUS_PUBLISH_FAILURES, QUEUE_PUBLISH_SECONDS, Timer
+from shared.tracing import inject
+
+logger = logging.getLogger(__name__)
+
 QUEUE_NAME = os.getenv("RECONCILIATION_QUEUE", "reconciliation_queue")
+ORDER_STATUS_QUEUE = os.getenv("ORDER_STATUS_QUEUE", "order_status_events")
+ORDER_STATUS_MAX_BATCH = int(os.getenv("ORDER_STATUS_MAX_BATCH", "200"))
+# Receipts are also published here for the webhook dispatcher; empty disables it.
+WEBHOOK_QUEUE = os.getenv("WEBHOOK_QUEUE", "")
+_PUBLISH_OBSERVE = QUEUE_PUBLISH_SECONDS.labels(QUEUE_NAME).observe
+_ORDER_STATUS_OBSERVE = QUEUE_PUBLISH_SECONDS.labels(ORDER_STATUS_QUEUE).observe
+# How often the idle publisher thread services the connection (heartbeats).
+_IDLE_POLL_SECONDS = 5.0
 
 
 def _build_connection_parameters() -> pika.ConnectionParameters:
@@ -20,12 +37,123 @@ def _channel() -> pika.adapters.blocking_connection.BlockingChannel:
     try:
         channel = connection.channel()
         channel.queue_declare(queue=QUEUE_NAME, durable=False)
+        if WEBHOOK_QUEUE:
+            channel.queue_declare(queue=WEBHOOK_QUEUE, durable=True)
         yield channel
     finally:
         connection.close()
 
 
-def publish_receipt(payload: dict) -> None:
-    body = json.dumps(payload).encode("utf-8")
-    with _channel() as channel:
-        channel.basic_publish(exchange="", routing_key=QUEUE_NAME, body=body)
+def publish_receipt(body: bytes) -> None:
+    """Publish a body built by ``shared.receipts.message_body``."""
+    # asyncio.to_thread copies the caller's context, so the active span is visible here.
+    headers: dict[str, str] = {}
+    inject(headers)
+    properties = pika.BasicProperties(headers=headers or None)
+    with Timer(_PUBLISH_OBSERVE), _channel() as channel:
+        channel.basic_publish(exchange="", routing_key=QUEUE_NAME, body=body, properties=properties)
+        if WEBHOOK_QUEUE:
+            # Persistent: a merchant callback must survive a broker restart.
+            webhook_properties = pika.BasicProperties(headers=headers or None, delivery_mode=2)
+            channel.basic_publish(exchange="", routing_key=WEBHOOK_QUEUE, body=body, properties=webhook_properties)
+
+
+class OrderStatusPublisher:
+    """Publishes order status events from one thread over a persistent connection.
+
+    ``emit`` only enqueues, so callers do not wait for RabbitMQ. The thread
+    drains whatever has queued up, up to ``max_batch`` events, into one
+    persistent message on a durable queue and waits for the broker's confirm.
+    The returned future resolves at that point, for callers that must know the
+    event is safe before moving on.
+    """
+
+    def __init__(self, queue_name: str = ORDER_STATUS_QUEUE, max_batch: int = ORDER_STATUS_MAX_BATCH) -> None:
+        self.queue_name = queue_name
+        self.max_batch = max_batch
+        self._queue: queue.SimpleQueue[tuple[dict, Future] | None] = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="order-status-publisher", daemon=True)
+        self._connection: pika.BlockingConnection | None = None
+        self._channel = None
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def emit(self, order_id: str, status: str, user_id: str) -> Future:
+        future: Future = Future()
+        self._queue.put(({"order_id": order_id, "user_id": user_id, "status": status}, future))
+        return future
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Publish what is queued, then stop the thread."""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _connect(self) -> None:
+        self._connection = pika.BlockingConnection(_build_connection_parameters())
+        self._channel = self._connection.channel()
+        self._channel.queue_declare(queue=self.queue_name, durable=True)
+        self._channel.confirm_delivery()
+
+    def _disconnect(self) -> None:
+        connection, self._connection, self._channel = self._connection, None, None
+        if connection is not None and connection.is_open:
+            try:
+                connection.close()
+            except pika.exceptions.AMQPError:
+                pass
+
+    def _publish(self, events: list[dict]) -> None:
+        body = json.dumps({"events": events}, separators=(",", ":")).encode("utf-8")
+        properties = pika.BasicProperties(content_type="application/json", delivery_mode=2)
+        # One reconnect covers a connection the broker closed while idle.
+        for attempt in (1, 2):
+            try:
+                if self._channel is None:
+                    self._connect()
+                with Timer(_ORDER_STATUS_OBSERVE):
+                    self._channel.basic_publish(exchange="", routing_key=self.queue_name, body=body, properties=properties)
+                return
+            except pika.exceptions.AMQPError:
+                self._disconnect()
+                if attempt == 2:
+                    raise
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=_IDLE_POLL_SECONDS)
+            except queue.Empty:
+                if self._connection is not None:
+                    try:
+                        self._connection.process_data_events(0)
+                    except pika.exceptions.AMQPError:
+                        self._disconnect()
+                continue
+            batch: list[tuple[dict, Future]] = []
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.max_batch:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            stopping = item is None
+            if not batch:
+                continue
+            try:
+                self._publish([event for event, _ in batch])
+            except Exception as exc:  # noqa: BLE001 - reported through the futures
+                ORDER_STATUS_PUBLISH_FAILURES.inc(len(batch))
+                logger.error(
+                    "[ORDER_EVENTS] Could not publish %s status events (orders %s): %s",
+                    len(batch), ", ".join(event["order_id"] for event, _ in batch), exc,
+                )
+                for _, future in batch:
+                    future.set_exception(exc)
+            else:
+                for _, future in batch:
+                    future.set_result(None)
+        self._disconnect()
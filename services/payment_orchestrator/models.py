@@ -1,8 +1,8 @@
 import enum
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
 
-from sqlalchemy import DateTime, Enum as SQLEnum, Integer, String, Text, func
+from sqlalchemy import DateTime, Enum as SQLEnum, Index, Integer, String, Text, func, text
 from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import Mapped, mapped_column
 
@@ -25,16 +25,54 @@ class PaymentIntent(Base):
     status: Mapped[PaymentStatus] = mapped_column(SQLEnum(PaymentStatus), nullable=False, default=PaymentStatus.PENDING)
     signed_receipt: Mapped[str | None] = mapped_column(Text, nullable=True)
     receipt_payload: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
+    # Pipeline state for asynchronous payments (migration 0002); unused by the synchronous path.
+    user_id: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    stage: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    payment_token: Mapped[str | None] = mapped_column(String(512), nullable=True)
+    psp_reference: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    last4: Mapped[str | None] = mapped_column(String(4), nullable=True)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    lease_expires_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # Fraud-check inputs for asynchronous payments (migration 0007).
+    client_ip: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    device_id: Mapped[str | None] = mapped_column(String(128), nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     updated_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
     )
 
+    __table_args__ = (
+        Index("ix_payment_intents_pending", "lease_expires_at", "created_at", postgresql_where=text("status = 'PENDING'")),
+        Index("ix_payment_intents_user_id_created_at", "user_id", "created_at", "id"),
+    )
+
 
 class UsedToken(Base):
+    """Replay guard; range partitioned by created_at (see migrations/versions/0001)."""
+
     __tablename__ = "used_payment_tokens"
+    __table_args__ = (
+        Index("ix_used_payment_tokens_token_hash", "token_hash", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    token_hash: Mapped[str] = mapped_column(String(128), unique=True, nullable=False)
+    token_hash: Mapped[str] = mapped_column(String(128), nullable=False)
+    order_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        primary_key=True,
+        default=lambda: datetime.now(timezone.utc),
+        server_default=func.now(),
+    )
+
+
+class UsedV1Token(Base):
+    """Replay guard for v1 tokens, which carry no issue time and never expire; not partitioned."""
+
+    __tablename__ = "used_v1_payment_tokens"
+
+    token_hash: Mapped[str] = mapped_column(String(128), primary_key=True)
     order_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,334 @@
+"""Asynchronous payments: a durable work queue of PENDING payment intents.
+
+``POST /payments`` in async mode validates the request, stores a PENDING
+``PaymentIntent`` carrying the payment token and returns 202. Worker tasks in
+every orchestrator process claim intents with ``FOR UPDATE SKIP LOCKED``,
+taking the database shards in turn, and run the remaining stages::
+
+    (accepted) -> screened -> charging -> charged -> signed -> order_updated -> published
+
+Each stage's result is written to the intent row (``stage`` plus the stage's
+output) before the next one starts, so an intent whose worker died resumes
+after its last checkpoint once the lease expires:
+
+- ``charging`` is recorded before the PSP is called, and the charge carries the
+  intent id as its idempotency key, so a retry after a lost response gets the
+  original outcome instead of a second charge. The token is cleared once
+  ``psp_reference`` is stored;
+- the receipt is signed once and the signature is stored with the receipt bytes;
+- the order update and the publish are idempotent on the receiving side
+  (reconciliation drops duplicate receipts).
+
+The claim increments ``attempts``, which doubles as a fencing token: a
+checkpoint only applies while ``attempts`` still matches, so a worker whose
+lease was taken over stops instead of overwriting the new owner's progress.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import logging
+import os
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable
+
+from sqlalchemy import or_, select, update
+
+import messaging
+import receipt_cache
+import schemas
+from database import router
+from hsm_service import hsm, signing_kid
+from models import PaymentIntent, PaymentStatus
+from token_format import parse_token
+from shared import receipts
+from shared.db import RawJSON
+from shared.metrics import PAYMENT_PIPELINE_RUNS, stage_timer
+from shared.sharding import Shard
+from shared.tracing import start_span
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.getenv("PAYMENT_WORKERS", "4"))
+LEASE_SECONDS = float(os.getenv("PAYMENT_LEASE_SECONDS", "60"))
+MAX_ATTEMPTS = int(os.getenv("PAYMENT_MAX_ATTEMPTS", "5"))
+IDLE_POLL_SECONDS = float(os.getenv("PAYMENT_IDLE_POLL_SECONDS", "1"))
+MAX_RETRY_DELAY_SECONDS = float(os.getenv("PAYMENT_MAX_RETRY_DELAY_SECONDS", "60"))
+
+SCREENED = "screened"
+CHARGING = "charging"
+CHARGED = "charged"
+SIGNED = "signed"
+ORDER_UPDATED = "order_updated"
+PUBLISHED = "published"
+
+_SUCCESS = PAYMENT_PIPELINE_RUNS.labels("success")
+_FAILED = PAYMENT_PIPELINE_RUNS.labels("failed")
+_RETRY = PAYMENT_PIPELINE_RUNS.labels("retry")
+_LEASE_LOST = PAYMENT_PIPELINE_RUNS.labels("lease_lost")
+
+
+class LeaseLost(Exception):
+    """Another worker claimed the intent after this worker's lease expired."""
+
+
+class PaymentDeclined(Exception):
+    """A stage ended the payment (fraud block, PSP decline, bad token); not retried."""
+
+
+@dataclass(frozen=True)
+class Steps:
+    """Calls the pipeline shares with the synchronous path in main."""
+
+    fraud_check: Callable[[int, str, str | None, str | None], Awaitable[schemas.FraudDecision]]
+    update_order_status: Callable[[str, str, str], Awaitable[None]]
+    psp_charge: Callable[..., Awaitable[dict]]
+    provider: str
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class PaymentPipeline:
+    def __init__(self, steps: Steps, workers: int = WORKERS) -> None:
+        self.steps = steps
+        self.workers = workers
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        # intent id -> event set when a worker in this process finishes it.
+        self._done: dict[uuid.UUID, asyncio.Event] = {}
+        # intent id -> shard it was claimed from. Checkpoints go to that row even
+        # if resharding has since moved the user to another shard.
+        self._claimed_on: dict[uuid.UUID, Shard] = {}
+        self._next_shard = 0
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker(index)) for index in range(self.workers)]
+        logger.info("[PIPELINE] Started %s payment workers", self.workers)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self) -> None:
+        """Wake idle workers after an intent was accepted in this process."""
+        self._wakeup.set()
+
+    async def wait(self, intent_id: uuid.UUID, timeout: float) -> None:
+        """Wait up to ``timeout`` for a local worker to finish ``intent_id``.
+
+        Intents run by another process are not signalled; callers re-read the
+        row after this returns either way.
+        """
+        event = self._done.setdefault(intent_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        # Dropped either way, so intents finished elsewhere do not accumulate here.
+        self._done.pop(intent_id, None)
+
+    def _finished(self, intent_id: uuid.UUID) -> None:
+        event = self._done.get(intent_id)
+        if event is not None:
+            event.set()
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            try:
+                intent = await self._claim()
+            except Exception:  # noqa: BLE001 - keep the worker alive across DB outages
+                logger.exception("[PIPELINE] Worker %s failed to claim an intent", index)
+                await asyncio.sleep(IDLE_POLL_SECONDS)
+                continue
+            if intent is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), IDLE_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run(intent)
+            finally:
+                self._claimed_on.pop(intent.id, None)
+
+    async def _claim(self) -> PaymentIntent | None:
+        now = _now()
+        candidate = (
+            select(PaymentIntent.id)
+            .where(
+                PaymentIntent.status == PaymentStatus.PENDING,
+                or_(PaymentIntent.lease_expires_at.is_(None), PaymentIntent.lease_expires_at < now),
+            )
+            .order_by(PaymentIntent.created_at)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        statement = (
+            update(PaymentIntent)
+            .where(PaymentIntent.id == candidate)
+            .values(attempts=PaymentIntent.attempts + 1, lease_expires_at=now + timedelta(seconds=LEASE_SECONDS))
+            .returning(PaymentIntent)
+            .execution_options(synchronize_session=False)
+        )
+        # Every shard is a queue of its own; each claim starts at the next one so none is starved.
+        shards = list(router.shards.values())
+        self._next_shard = (self._next_shard + 1) % len(shards)
+        for offset in range(len(shards)):
+            shard = shards[(self._next_shard + offset) % len(shards)]
+            async with shard.sessions() as session:
+                intent = (await session.execute(statement)).scalar_one_or_none()
+                await session.commit()
+            if intent is not None:
+                self._claimed_on[intent.id] = shard
+                return intent
+        return None
+
+    async def _checkpoint(self, intent: PaymentIntent, **values: Any) -> None:
+        values.setdefault("lease_expires_at", _now() + timedelta(seconds=LEASE_SECONDS))
+        statement = (
+            update(PaymentIntent)
+            .where(PaymentIntent.id == intent.id, PaymentIntent.attempts == intent.attempts)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        with stage_timer("db_commit"):
+            async with self._claimed_on[intent.id].sessions() as session:
+                result = await session.execute(statement)
+                await session.commit()
+        if result.rowcount != 1:
+            raise LeaseLost(str(intent.id))
+        for name, value in values.items():
+            setattr(intent, name, value)
+
+    async def _run(self, intent: PaymentIntent) -> None:
+        logger.info(
+            "[PIPELINE] Running intent %s for order %s from stage %s (attempt %s)",
+            intent.id, intent.order_id, intent.stage or "accepted", intent.attempts,
+        )
+        try:
+            while intent.status == PaymentStatus.PENDING:
+                await self._advance(intent)
+        except LeaseLost:
+            _LEASE_LOST.inc()
+            logger.warning("[PIPELINE] Lost the lease on intent %s; another worker owns it", intent.id)
+            return
+        except PaymentDeclined as exc:
+            await self._fail(intent, str(exc))
+        except Exception as exc:  # noqa: BLE001 - every other failure is retried
+            await self._retry(intent, exc)
+            return
+        else:
+            _SUCCESS.inc()
+            logger.info("[PIPELINE] Intent %s for order %s completed", intent.id, intent.order_id)
+        self._finished(intent.id)
+
+    async def _advance(self, intent: PaymentIntent) -> None:
+        order_id = str(intent.order_id)
+        if intent.stage is None:
+            decision = await self.steps.fraud_check(intent.amount, intent.user_id, intent.client_ip, intent.device_id)
+            if decision.action.upper() == "BLOCK":
+                raise PaymentDeclined("transaction blocked by fraud engine")
+            await self._checkpoint(intent, stage=SCREENED)
+        elif intent.stage in (SCREENED, CHARGING):
+            try:
+                # Its age was checked when the intent was accepted; retries must not expire it.
+                token = parse_token(intent.payment_token, now=intent.created_at.timestamp())
+                with stage_timer("decrypt"), start_span("decrypt"):
+                    pan = (await hsm.decrypt(token)).decode("utf-8")
+            except ValueError as exc:
+                raise PaymentDeclined("invalid payment token") from exc
+            if intent.stage == SCREENED:
+                # From here on the card may have been charged, even if the call
+                # below fails, so the intent can no longer be given up.
+                await self._checkpoint(intent, stage=CHARGING)
+            with stage_timer("psp"), start_span("psp", kind="client", attributes={"psp.provider": self.steps.provider}):
+                result = await self.steps.psp_charge(
+                    pan=pan, amount=intent.amount, currency=intent.currency, idempotency_key=str(intent.id),
+                )
+            if result.get("status") != "succeeded":
+                raise PaymentDeclined("psp charge failed")
+            # The token is no longer needed once the charge is recorded.
+            await self._checkpoint(
+                intent, stage=CHARGED, psp_reference=result["id"], last4=result["last4"], payment_token=None,
+            )
+        elif intent.stage == CHARGED:
+            receipt = schemas.ReceiptEnvelope(
+                order_id=intent.order_id,
+                amount=intent.amount,
+                currency=intent.currency,
+                timestamp=_now(),
+                status=PaymentStatus.SUCCESS,
+                kid=signing_kid(),
+                provider=self.steps.provider,
+            )
+            receipt_dict = receipt.to_serialisable() | {"psp_reference": intent.psp_reference, "last4": intent.last4}
+            receipt_bytes = receipts.encode(receipt_dict)
+            with stage_timer("sign"), start_span("sign"):
+                signature = await hsm.sign(receipt_bytes, shed=False)
+            await self._checkpoint(
+                intent,
+                stage=SIGNED,
+                signed_receipt=base64.b64encode(signature).decode("ascii"),
+                receipt_payload=RawJSON(receipt_bytes.decode("utf-8")),
+            )
+        elif intent.stage == SIGNED:
+            await self.steps.update_order_status(order_id, "COMPLETED", intent.user_id)
+            await self._checkpoint(intent, stage=ORDER_UPDATED)
+        elif intent.stage == ORDER_UPDATED:
+            # receipt_payload is RawJSON when signed in this run and a dict when
+            # reloaded from JSONB; the canonical encoding restores the signed bytes.
+            payload = intent.receipt_payload
+            receipt_bytes = payload.encode("utf-8") if isinstance(payload, str) else receipts.encode(payload)
+            with stage_timer("publish"), start_span("publish", kind="producer"):
+                body = receipts.message_body(receipt_bytes, intent.signed_receipt)
+                await asyncio.to_thread(messaging.publish_receipt, body)
+            await self._checkpoint(
+                intent, stage=PUBLISHED, status=PaymentStatus.SUCCESS, error=None, lease_expires_at=None,
+                updated_at=_now(),
+            )
+            receipt_cache.cache.put(receipt_cache.to_record(intent), intent.user_id)
+        else:
+            raise RuntimeError(f"unknown payment stage {intent.stage!r}")
+
+    async def _fail(self, intent: PaymentIntent, reason: str) -> None:
+        _FAILED.inc()
+        logger.warning("[PIPELINE] Intent %s for order %s failed: %s", intent.id, intent.order_id, reason)
+        try:
+            await self._checkpoint(
+                intent, status=PaymentStatus.FAILED, error=reason, payment_token=None, lease_expires_at=None,
+            )
+        except LeaseLost:
+            return
+        try:
+            await self.steps.update_order_status(str(intent.order_id), PaymentStatus.FAILED.value, intent.user_id)
+        except Exception:  # noqa: BLE001 - the intent is already final
+            logger.exception("[PIPELINE] Could not mark order %s FAILED", intent.order_id)
+
+    async def _retry(self, intent: PaymentIntent, exc: Exception) -> None:
+        # Before the PSP is called a payment can still be abandoned. Once it is
+        # ``charging`` the outcome must be learned by repeating the idempotent
+        # charge, and after it the customer has paid, so the remaining stages are
+        # retried until they succeed.
+        if intent.stage in (None, SCREENED) and intent.attempts >= MAX_ATTEMPTS:
+            await self._fail(intent, f"gave up after {intent.attempts} attempts: {exc}")
+            self._finished(intent.id)
+            return
+        _RETRY.inc()
+        delay = min(2.0 ** intent.attempts, MAX_RETRY_DELAY_SECONDS)
+        logger.warning(
+            "[PIPELINE] Intent %s stage %s failed (attempt %s), retrying in %.0fs: %s",
+            intent.id, intent.stage or "accepted", intent.attempts, delay, exc,
+        )
+        try:
+            await self._checkpoint(intent, error=str(exc), lease_expires_at=_now() + timedelta(seconds=delay))
+        except Exception:  # noqa: BLE001 - the lease expires on its own
+            logger.exception("[PIPELINE] Could not reschedule intent %s", intent.id)
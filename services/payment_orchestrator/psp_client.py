@@ -2,15 +2,29 @@ from __future__ import annotations
 
 import os
 import uuid
+from collections import OrderedDict
 
-import stripe
+MOCK_IDEMPOTENCY_KEYS = int(os.getenv("PSP_MOCK_IDEMPOTENCY_KEYS", "10000"))
 
 
 class PSPMock:
-    def charge(self, pan: str, amount: int, currency: str, **_: object) -> dict:
+    """Replays a charge for a repeated idempotency key, like Stripe does.
+
+    Only the most recent ``max_keys`` keys are kept, in this process: a retry
+    that lands on another worker, or after a restart, charges again.
+    """
+
+    def __init__(self, max_keys: int = MOCK_IDEMPOTENCY_KEYS) -> None:
+        self.max_keys = max_keys
+        self._charges: OrderedDict[str, dict] = OrderedDict()
+
+    def charge(self, pan: str, amount: int, currency: str, idempotency_key: str | None = None, **_: object) -> dict:
+        if idempotency_key is not None and idempotency_key in self._charges:
+            self._charges.move_to_end(idempotency_key)
+            return self._charges[idempotency_key]
         intent_id = "pi_mock_" + uuid.uuid4().hex[:16]
         receipt = "rcpt_" + uuid.uuid4().hex[:8]
-        return {
+        result = {
             "id": intent_id,
             "status": "succeeded",
             "amount": amount,
@@ -18,11 +32,20 @@ class PSPMock:
             "last4": pan[-4:],
             "receipt": receipt,
         }
+        if idempotency_key is not None:
+            self._charges[idempotency_key] = result
+            if len(self._charges) > self.max_keys:
+                self._charges.popitem(last=False)
+        return result
 
 
 class PSPStripe:
     def __init__(self, secret_key: str) -> None:
+        # Imported here: the SDK is large and the mock provider never needs it.
+        import stripe
+
         stripe.api_key = secret_key
+        self._stripe = stripe
 
     def charge(
         self,
@@ -32,18 +55,35 @@ class PSPStripe:
         exp_month: int | None = None,
         exp_year: int | None = None,
         cvc: str | None = None,
+        idempotency_key: str | None = None,
         **_: object,
     ) -> dict:
-        payment_method = stripe.PaymentMethod.create(
-            type="card",
-            card={"number": pan, "exp_month": exp_month, "exp_year": exp_year, "cvc": cvc},
-        )
-        intent = stripe.PaymentIntent.create(
-            amount=amount,
-            currency=currency.lower(),
-            payment_method=payment_method.id,
-            confirm=True,
-        )
+        # A retried charge with the same key returns the original objects instead of charging again.
+        try:
+            payment_method = self._stripe.PaymentMethod.create(
+                type="card",
+                card={"number": pan, "exp_month": exp_month, "exp_year": exp_year, "cvc": cvc},
+                idempotency_key=f"{idempotency_key}:pm" if idempotency_key else None,
+            )
+            intent = self._stripe.PaymentIntent.create(
+                amount=amount,
+                currency=currency.lower(),
+                payment_method=payment_method.id,
+                confirm=True,
+                idempotency_key=idempotency_key,
+            )
+        except self._stripe.error.CardError as exc:
+            # A decline is a final outcome (and is replayed for the same key);
+            # other errors leave it unknown and propagate so the caller retries.
+            declined = getattr(exc.error, "payment_intent", None) or {}
+            return {
+                "id": declined.get("id", ""),
+                "status": "declined",
+                "amount": amount,
+                "currency": currency.upper(),
+                "last4": pan[-4:],
+                "receipt": None,
+            }
         charge = intent.charges.data[0] if intent.charges.data else None
         return {
             "id": intent.id,
@@ -0,0 +1,75 @@
+"""In-process cache of recent successful payments, keyed by order id.
+
+Entries are written when a payment succeeds (synchronous path and pipeline),
+so ``GET /payments/{order_id}`` right after a payment, the usual retry or
+support lookup, is answered without a query. Only SUCCESS records are cached:
+a signed receipt never changes, while a PENDING or FAILED order may still be
+paid, possibly by another process whose writes this cache does not see.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+
+import schemas
+from models import PaymentIntent, PaymentStatus
+from shared.metrics import PAYMENT_READ_CACHE
+
+CACHE_SIZE = int(os.getenv("PAYMENT_CACHE_SIZE", "10000"))
+CACHE_TTL_SECONDS = float(os.getenv("PAYMENT_CACHE_TTL_SECONDS", "600"))
+
+_HIT = PAYMENT_READ_CACHE.labels("hit")
+_MISS = PAYMENT_READ_CACHE.labels("miss")
+
+
+def to_record(intent: PaymentIntent) -> schemas.PaymentRecord:
+    succeeded = intent.status == PaymentStatus.SUCCESS
+    receipt = intent.receipt_payload
+    if isinstance(receipt, str):  # RawJSON straight from the write path
+        receipt = json.loads(receipt)
+    return schemas.PaymentRecord(
+        intent_id=intent.id,
+        order_id=intent.order_id,
+        amount=intent.amount,
+        currency=intent.currency,
+        status=intent.status,
+        signed_receipt=intent.signed_receipt if succeeded else None,
+        receipt=receipt if succeeded else None,
+        created_at=intent.created_at,
+        updated_at=intent.updated_at,
+    )
+
+
+class ReceiptCache:
+    """TTL/LRU map of order id -> (owner, record); only touched from the event loop thread."""
+
+    def __init__(self, size: int = CACHE_SIZE, ttl: float = CACHE_TTL_SECONDS) -> None:
+        self.size = size
+        self.ttl = ttl
+        self._entries: OrderedDict[uuid.UUID, tuple[float, str | None, schemas.PaymentRecord]] = OrderedDict()
+
+    def get(self, order_id: uuid.UUID) -> tuple[str | None, schemas.PaymentRecord] | None:
+        entry = self._entries.get(order_id)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[order_id]
+            _MISS.inc()
+            return None
+        self._entries.move_to_end(order_id)
+        _HIT.inc()
+        return entry[1], entry[2]
+
+    def put(self, record: schemas.PaymentRecord, user_id: str | None) -> None:
+        if self.ttl <= 0 or record.status != PaymentStatus.SUCCESS:
+            return
+        self._entries[record.order_id] = (time.monotonic() + self.ttl, user_id, record)
+        self._entries.move_to_end(record.order_id)
+        if len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+
+cache = ReceiptCache()
@@ -61,9 +61,15 @@ class PublicKeyResponse(BaseModel):
     public_key: str
 
 
+class JWKSResponse(BaseModel):
+    keys: list[dict[str, str]]
+
+
 class PaymentRequest(BaseModel):
     order_id: uuid.UUID
     payment_token: str
+    # Linked with the user and client IP by the fraud engine's ring detection.
+    device_id: Optional[constr(min_length=1, max_length=128)] = None
 
 
 class PaymentResponse(BaseModel):
@@ -72,10 +78,44 @@ class PaymentResponse(BaseModel):
     receipt: dict
 
 
+class PaymentAccepted(BaseModel):
+    intent_id: uuid.UUID
+    status: PaymentStatus
+
+
+class PaymentIntentStatus(BaseModel):
+    intent_id: uuid.UUID
+    order_id: uuid.UUID
+    status: PaymentStatus
+    stage: Optional[str] = None
+    signed_receipt: Optional[str] = None
+    receipt: Optional[dict] = None
+    error: Optional[str] = None
+
+
+class PaymentRecord(BaseModel):
+    intent_id: uuid.UUID
+    order_id: uuid.UUID
+    amount: int
+    currency: str
+    status: PaymentStatus
+    signed_receipt: Optional[str] = None
+    receipt: Optional[dict] = None
+    created_at: datetime
+    updated_at: datetime
+
+
+class PaymentPage(BaseModel):
+    items: list[PaymentRecord]
+    # Pass back as ``since`` for the next page; None once the listing is exhausted.
+    next_since: Optional[str] = None
+
+
 class FraudRequest(BaseModel):
     amount: int
     user_ip: Optional[str] = None
     device_id: Optional[str] = None
+    user_id: Optional[str] = None
 
 
 class FraudDecision(BaseModel):
@@ -89,6 +129,7 @@ class ReceiptEnvelope(BaseModel):
     currency: str
     timestamp: datetime
     status: PaymentStatus
+    kid: str
     provider: str = "mock"
 
     def to_serialisable(self) -> dict:
@@ -98,5 +139,6 @@ class ReceiptEnvelope(BaseModel):
             "currency": self.currency,
             "timestamp": self.timestamp.isoformat(),
             "status": self.status.value,
+            "kid": self.kid,
             "provider": self.provider,
         }
@@ -0,0 +1,182 @@
+"""Payment token layouts and a single-pass parser.
+
+v2 binary layout (big-endian)::
+
+    0      1      2        4           8             24                    -10
+    +------+------+--------+-----------+-------------+--------------------+-----+
+    | ver  | flag | key id | issued at | nonce (IV)  | AES-CBC ciphertext | tag |
+    +------+------+--------+-----------+-------------+--------------------+-----+
+
+``issued at`` is Unix seconds. ``tag`` is HMAC-SHA256 over everything before
+it, truncated to ``TAG_SIZE`` bytes (80 bits, the RFC 2104 minimum) and
+computed in the HSM; CBC alone would let the header be rewritten without
+touching the PAN. ``FLAG_BCD`` marks a plaintext of decimal digits packed two
+per byte, which keeps a 16-19 digit PAN inside one cipher block. The text
+form is ``TEXT_PREFIX`` + unpadded urlsafe base64 of the binary layout.
+
+Tokens older than ``PAYMENT_TOKEN_TTL_DAYS`` are rejected by the parser.
+
+v1 tokens (``hsm:v1:`` + urlsafe base64 of IV || ciphertext) are still parsed;
+they carry no issue time and never expire.
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import hashlib
+import os
+import struct
+import time
+
+V1_PREFIX = "hsm:v1:"
+TEXT_PREFIX = "h2."
+VERSION_1 = 1
+VERSION_2 = 2
+FLAG_BCD = 0x01
+NONCE_SIZE = 16
+BLOCK_SIZE = 16
+TAG_SIZE = 10
+DEFAULT_KEY_ID = 1
+TOKEN_TTL_SECONDS = int(os.getenv("PAYMENT_TOKEN_TTL_DAYS", "30")) * 86400
+# Tolerated clock difference between the replica that issued a token and the one parsing it.
+MAX_CLOCK_SKEW_SECONDS = 300
+
+_HEADER = struct.Struct(">BBHI")
+_HEADER_SIZE = _HEADER.size
+_MIN_V2_SIZE = _HEADER_SIZE + NONCE_SIZE + BLOCK_SIZE + TAG_SIZE
+
+
+class ParsedToken:
+    """A decoded token; ``nonce`` and ``ciphertext`` are views, not copies.
+
+    ``fingerprint`` is the replay-guard identity. It is computed over the decoded
+    bytes, so every encoding of one token maps to the same fingerprint.
+    ``issued_at`` is None for v1 tokens, and so are ``signed`` and ``tag``: the
+    bytes the tag covers, and the tag that the HSM must verify before decrypting.
+    """
+
+    __slots__ = ("version", "flags", "key_id", "issued_at", "nonce", "ciphertext", "signed", "tag", "fingerprint")
+
+    def __init__(
+        self,
+        version: int,
+        flags: int,
+        key_id: int,
+        issued_at: int | None,
+        nonce: memoryview,
+        ciphertext: memoryview,
+        signed: memoryview | None,
+        tag: memoryview | None,
+        fingerprint: str,
+    ) -> None:
+        self.version = version
+        self.flags = flags
+        self.key_id = key_id
+        self.issued_at = issued_at
+        self.nonce = nonce
+        self.ciphertext = ciphertext
+        self.signed = signed
+        self.tag = tag
+        self.fingerprint = fingerprint
+
+
+# binascii skips the urlsafe_b64decode wrapper; surplus "=" padding is ignored.
+_URLSAFE_TO_STD = bytes.maketrans(b"-_", b"+/")
+
+
+def _b64decode(data: str) -> bytes:
+    try:
+        return binascii.a2b_base64(data.encode("ascii").translate(_URLSAFE_TO_STD) + b"==")
+    except ValueError as exc:  # binascii.Error and UnicodeEncodeError included
+        raise ValueError("malformed token encoding") from exc
+
+
+def _parse_v1(token: str) -> ParsedToken:
+    raw = memoryview(_b64decode(token[len(V1_PREFIX):]))
+    if len(raw) < NONCE_SIZE + BLOCK_SIZE or (len(raw) - NONCE_SIZE) % BLOCK_SIZE:
+        raise ValueError("malformed v1 token")
+    # v1 fingerprints hash the canonical text form, matching rows stored before v2.
+    fingerprint = hashlib.sha256(encode_v1(raw[:NONCE_SIZE], raw[NONCE_SIZE:]).encode("ascii")).hexdigest()
+    return ParsedToken(
+        VERSION_1, 0, DEFAULT_KEY_ID, None, raw[:NONCE_SIZE], raw[NONCE_SIZE:], None, None, fingerprint
+    )
+
+
+def parse_binary(data: bytes | bytearray | memoryview, now: float | None = None) -> ParsedToken:
+    view = memoryview(data)
+    if len(view) < _MIN_V2_SIZE or (len(view) - _HEADER_SIZE - NONCE_SIZE - TAG_SIZE) % BLOCK_SIZE:
+        raise ValueError("malformed token")
+    version, flags, key_id, issued_at = _HEADER.unpack_from(view)
+    if version != VERSION_2:
+        raise ValueError("unsupported token format")
+    age = (time.time() if now is None else now) - issued_at
+    if age > TOKEN_TTL_SECONDS:
+        raise ValueError("payment token expired")
+    if age < -MAX_CLOCK_SKEW_SECONDS:
+        raise ValueError("payment token issued in the future")
+    body = _HEADER_SIZE + NONCE_SIZE
+    signed = len(view) - TAG_SIZE
+    return ParsedToken(
+        version,
+        flags,
+        key_id,
+        issued_at,
+        view[_HEADER_SIZE:body],
+        view[body:signed],
+        view[:signed],
+        view[signed:],
+        hashlib.sha256(view).hexdigest(),
+    )
+
+
+def parse_token(token: str | bytes | bytearray | memoryview, now: float | None = None) -> ParsedToken:
+    """Decode a token once and check its age; slices are views into the decoded buffer.
+
+    The tag is not checked here: only the HSM holds the key, so ``decrypt_token``
+    verifies it before decrypting.
+    """
+    if not isinstance(token, str):
+        return parse_binary(token, now)
+    if token.startswith(TEXT_PREFIX):
+        return parse_binary(_b64decode(token[len(TEXT_PREFIX):]), now)
+    if token.startswith(V1_PREFIX):
+        return _parse_v1(token)
+    raise ValueError("unsupported token format")
+
+
+def encode_signed(key_id: int, issued_at: int, nonce: bytes, ciphertext: bytes, flags: int = 0) -> bytes:
+    """Header, nonce and ciphertext of a v2 token: the bytes its tag covers."""
+    return b"".join((_HEADER.pack(VERSION_2, flags, key_id, issued_at), nonce, ciphertext))
+
+
+def encode_binary(signed: bytes, tag: bytes) -> bytes:
+    """Append the truncated tag to :func:`encode_signed` output."""
+    return signed + tag[:TAG_SIZE]
+
+
+def encode_text(binary: bytes) -> str:
+    return TEXT_PREFIX + base64.urlsafe_b64encode(binary).rstrip(b"=").decode("ascii")
+
+
+def encode_v1(nonce: bytes | memoryview, ciphertext: bytes | memoryview) -> str:
+    return V1_PREFIX + base64.urlsafe_b64encode(b"".join((nonce, ciphertext))).decode("ascii")
+
+
+def pack_digits(plaintext: bytes) -> bytes | None:
+    """BCD-pack an ASCII digit string, padding odd lengths with 0xF; None if not digits."""
+    if not plaintext.isdigit() or not plaintext.isascii():
+        return None
+    digits = plaintext.decode("ascii")
+    if len(digits) % 2:
+        digits += "f"
+    return bytes.fromhex(digits)
+
+
+def unpack_digits(packed: bytes) -> bytes:
+    digits = packed.hex()
+    if digits.endswith("f"):
+        digits = digits[:-1]
+    if not digits.isdigit():
+        raise ValueError("malformed packed plaintext")
+    return digits.encode("ascii")
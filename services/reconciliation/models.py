@@ -3,7 +3,7 @@ from __future__ import annotations
 import uuid
 from datetime import datetime, timezone
 
-from sqlalchemy import JSON, DateTime, Integer, String, Text, UniqueConstraint
+from sqlalchemy import JSON, BigInteger, DateTime, Integer, String, Text, UniqueConstraint
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import Mapped, mapped_column
 
@@ -11,8 +11,13 @@ from database import Base
 
 
 class ReceiptRecord(Base):
+    """Signed receipt; range partitioned by created_at, the receipt's own timestamp."""
+
     __tablename__ = "reconciliation_receipts"
-    __table_args__ = (UniqueConstraint("signature", name="uq_reconciliation_signature"),)
+    __table_args__ = (
+        UniqueConstraint("signature", "created_at", name="uq_reconciliation_signature"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     order_id: Mapped[str | None] = mapped_column(String(64), index=True)
@@ -21,13 +26,32 @@ class ReceiptRecord(Base):
     receipt: Mapped[dict] = mapped_column(JSON, nullable=False)
     status: Mapped[str | None] = mapped_column(String(32), nullable=True)
     created_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
+        DateTime(timezone=True), primary_key=True, default=lambda: datetime.now(timezone.utc)
     )
     processed_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
     )
 
 
+class _RollupColumns:
+    """Receipt count and amount per UTC time bucket, status, currency and provider."""
+
+    bucket_start: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    status: Mapped[str] = mapped_column(String(32), primary_key=True)
+    currency: Mapped[str] = mapped_column(String(16), primary_key=True)
+    provider: Mapped[str] = mapped_column(String(32), primary_key=True)
+    receipt_count: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    amount_total: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+
+
+class ReceiptRollupHourly(_RollupColumns, Base):
+    __tablename__ = "reconciliation_rollup_hourly"
+
+
+class ReceiptRollupDaily(_RollupColumns, Base):
+    __tablename__ = "reconciliation_rollup_daily"
+
+
 class ReconciliationReport(Base):
     __tablename__ = "reconciliation_reports"
 
@@ -0,0 +1,299 @@
+"""Hourly and daily receipt rollups by status, currency and provider.
+
+    python rollups.py summary --start 2026-10-01 --end 2026-10-19T12:00
+    python rollups.py report  --start 2026-10-01 --end 2026-11-01
+    python rollups.py rebuild --start 2026-10-01 --end 2026-11-01 [--workers 4]
+
+``store_receipt`` adds each new receipt to its hour and day rows in the same
+transaction that inserts it, so a duplicate that is rolled back is never
+counted. Reads combine daily rows for whole UTC days with hourly rows for the
+partial days at either edge, which keeps a month-long summary to a few dozen
+rows however many receipts it covers.
+
+``rebuild`` recomputes the rollups from ``reconciliation_receipts``, one UTC
+day per task. A day's rebuild holds an exclusive advisory lock on that day
+while live writers hold it shared, so a receipt stored during the rebuild is
+either counted by the recompute or added after it, never both. Days before
+the ``RECEIPT_RETENTION_DAYS`` horizon are skipped: their receipt partitions
+may have been detached, and recomputing them would wipe their totals.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta, timezone
+
+from sqlalchemy import Select, func, select, text, union_all
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import ReceiptRollupDaily, ReceiptRollupHourly, ReconciliationReport
+from shared.partitions import RECEIPT_RETENTION_DAYS
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN = "unknown"
+REBUILD_WORKERS = 4
+# Advisory lock keys for a day: this prefix ("roll") plus the day's ordinal.
+_LOCK_PREFIX = 0x726F6C6C00000000
+
+_DIMENSIONS = ("status", "currency", "provider")
+
+
+def _lock_key(day: date) -> int:
+    return _LOCK_PREFIX + day.toordinal()
+
+
+def _dimension(value: object, length: int) -> str:
+    # Mirrors _json_dimension in the rebuild query.
+    return value[:length] if isinstance(value, str) and value else UNKNOWN
+
+
+def _amount(value: object) -> int:
+    # Anything the rebuild query would not cast to bigint counts as zero there too.
+    if isinstance(value, int) and not isinstance(value, bool) and abs(value) < 10**18:
+        return value
+    return 0
+
+
+def _hour(moment: datetime) -> datetime:
+    return moment.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def _day(moment: datetime) -> datetime:
+    return _hour(moment).replace(hour=0)
+
+
+def add_receipt(session: Session, created_at: datetime, status: str | None, receipt: dict) -> None:
+    """Count one stored receipt; call inside the transaction that inserted it."""
+    hour = _hour(created_at)
+    key = {
+        "status": _dimension(status, 32),
+        "currency": _dimension(receipt.get("currency"), 16),
+        "provider": _dimension(receipt.get("provider"), 32),
+    }
+    amount = _amount(receipt.get("amount"))
+    session.execute(select(func.pg_advisory_xact_lock_shared(_lock_key(hour.date()))))
+    for model, bucket in ((ReceiptRollupHourly, hour), (ReceiptRollupDaily, _day(hour))):
+        statement = insert(model).values(bucket_start=bucket, receipt_count=1, amount_total=amount, **key)
+        session.execute(
+            statement.on_conflict_do_update(
+                index_elements=["bucket_start", *_DIMENSIONS],
+                set_={
+                    "receipt_count": model.receipt_count + 1,
+                    "amount_total": model.amount_total + statement.excluded.amount_total,
+                },
+            )
+        )
+
+
+def _edges(start: datetime, end: datetime) -> tuple[datetime, datetime]:
+    """First and last whole UTC day boundaries inside [start, end), both truncated to the hour."""
+    first_day = _day(start)
+    if first_day < _hour(start):
+        first_day += timedelta(days=1)
+    return first_day, max(first_day, _day(end))
+
+
+def _bucket_rows(start: datetime, end: datetime) -> list[Select]:
+    start, end = _hour(start), _hour(end)
+    first_day, last_day = _edges(start, end)
+    parts = []
+    for model, lower, upper in (
+        (ReceiptRollupHourly, start, min(first_day, end)),
+        (ReceiptRollupDaily, first_day, last_day),
+        (ReceiptRollupHourly, max(last_day, start), end),
+    ):
+        if lower < upper:
+            parts.append(
+                select(model.status, model.currency, model.provider, model.receipt_count, model.amount_total).where(
+                    model.bucket_start >= lower, model.bucket_start < upper
+                )
+            )
+    return parts
+
+
+def summarize(session: Session, start: datetime, end: datetime) -> list[dict]:
+    """Receipt count and amount per status, currency and provider for [start, end), to the hour."""
+    parts = _bucket_rows(start, end)
+    if not parts:
+        return []
+    rows = union_all(*parts).subquery()
+    query = (
+        select(
+            rows.c.status,
+            rows.c.currency,
+            rows.c.provider,
+            func.sum(rows.c.receipt_count),
+            func.sum(rows.c.amount_total),
+        )
+        .group_by(rows.c.status, rows.c.currency, rows.c.provider)
+        .order_by(rows.c.status, rows.c.currency, rows.c.provider)
+    )
+    return [
+        {"status": status, "currency": currency, "provider": provider, "receipts": int(count), "amount": int(amount)}
+        for status, currency, provider, count, amount in session.execute(query)
+    ]
+
+
+def series(session: Session, start: datetime, end: datetime, granularity: str = "hour") -> list[dict]:
+    """Per-bucket rows for [start, end), for dashboard charts; ``granularity`` is "hour" or "day"."""
+    model = ReceiptRollupHourly if granularity == "hour" else ReceiptRollupDaily
+    lower, upper = (_hour(start), _hour(end)) if granularity == "hour" else (_day(start), _day(end))
+    query = (
+        select(model)
+        .where(model.bucket_start >= lower, model.bucket_start < upper)
+        .order_by(model.bucket_start, model.status, model.currency, model.provider)
+    )
+    return [
+        {
+            "bucket_start": row.bucket_start.isoformat(),
+            "status": row.status,
+            "currency": row.currency,
+            "provider": row.provider,
+            "receipts": row.receipt_count,
+            "amount": row.amount_total,
+        }
+        for row in session.execute(query).scalars()
+    ]
+
+
+def build_report(session: Session, start: datetime, end: datetime) -> ReconciliationReport:
+    """A ``ReconciliationReport`` for [start, end) summarised from the rollups; not committed."""
+    groups = summarize(session, start, end)
+    by_status: dict[str, int] = {}
+    for group in groups:
+        by_status[group["status"]] = by_status.get(group["status"], 0) + group["receipts"]
+    report = ReconciliationReport(
+        period_start=_hour(start),
+        period_end=_hour(end),
+        coverage_days=len(_days(start, end)),
+        summary={"receipts": sum(by_status.values()), "by_status": by_status, "groups": groups},
+    )
+    session.add(report)
+    return report
+
+
+def _days(start: datetime, end: datetime) -> list[date]:
+    day, last = _day(start).date(), _hour(end)
+    days = []
+    while datetime.combine(day, time(), timezone.utc) < last:
+        days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def _json_dimension(key: str, length: int) -> str:
+    return (
+        f"CASE WHEN json_typeof(receipt->'{key}') = 'string' AND receipt->>'{key}' <> ''"
+        f" THEN left(receipt->>'{key}', {length}) ELSE '{UNKNOWN}' END"
+    )
+
+
+_REBUILD_HOURLY = text(
+    "INSERT INTO reconciliation_rollup_hourly"
+    " (bucket_start, status, currency, provider, receipt_count, amount_total)"
+    " SELECT date_trunc('hour', created_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',"
+    f" COALESCE(NULLIF(left(status, 32), ''), '{UNKNOWN}') AS status,"
+    f" {_json_dimension('currency', 16)} AS currency,"
+    f" {_json_dimension('provider', 32)} AS provider,"
+    " count(*),"
+    " COALESCE(sum(CASE WHEN json_typeof(receipt->'amount') = 'number' AND receipt->>'amount' ~ '^-?[0-9]{1,18}$'"
+    " THEN (receipt->>'amount')::bigint ELSE 0 END), 0)"
+    " FROM reconciliation_receipts"
+    " WHERE created_at >= :lower AND created_at < :upper"
+    " GROUP BY 1, 2, 3, 4"
+)
+
+_REBUILD_DAILY = text(
+    "INSERT INTO reconciliation_rollup_daily"
+    " (bucket_start, status, currency, provider, receipt_count, amount_total)"
+    " SELECT :lower, status, currency, provider, sum(receipt_count), sum(amount_total)"
+    " FROM reconciliation_rollup_hourly"
+    " WHERE bucket_start >= :lower AND bucket_start < :upper"
+    " GROUP BY status, currency, provider"
+)
+
+
+def first_retained_day(now: datetime | None = None) -> date:
+    """Earliest UTC day whose receipts are certainly still attached.
+
+    Partition maintenance detaches a month once it ends before the retention
+    cutoff. The day after the cutoff's day keeps a margin for maintenance that
+    runs while a rebuild is in progress.
+    """
+    cutoff = (now or datetime.now(timezone.utc)) - timedelta(days=RECEIPT_RETENTION_DAYS)
+    return cutoff.date() + timedelta(days=1)
+
+
+def rebuild_day(day: date) -> int:
+    """Recompute one UTC day's rollups from the raw receipts; returns its receipt count."""
+    if day < first_retained_day():
+        raise ValueError(f"{day} is past RECEIPT_RETENTION_DAYS; its receipts may be gone and its rollups are kept")
+    lower = datetime.combine(day, time(), timezone.utc)
+    bounds = {"lower": lower, "upper": lower + timedelta(days=1)}
+    with SessionLocal() as session, session.begin():
+        session.execute(select(func.pg_advisory_xact_lock(_lock_key(day))))
+        for model in (ReceiptRollupHourly, ReceiptRollupDaily):
+            session.execute(
+                model.__table__.delete().where(
+                    model.bucket_start >= bounds["lower"], model.bucket_start < bounds["upper"]
+                )
+            )
+        session.execute(_REBUILD_HOURLY, bounds)
+        session.execute(_REBUILD_DAILY, bounds)
+        count = session.execute(
+            select(func.coalesce(func.sum(ReceiptRollupDaily.receipt_count), 0)).where(
+                ReceiptRollupDaily.bucket_start == lower
+            )
+        ).scalar_one()
+    return int(count)
+
+
+def rebuild(start: datetime, end: datetime, workers: int = REBUILD_WORKERS) -> dict[str, int]:
+    """Rebuild every retained UTC day that [start, end) touches, ``workers`` days at a time."""
+    retained = first_retained_day()
+    days = [day for day in _days(start, end) if day >= retained]
+    skipped = len(_days(start, end)) - len(days)
+    if skipped:
+        logger.warning("[ROLLUPS] Skipping %s days before %s: past RECEIPT_RETENTION_DAYS, rollups kept as they are", skipped, retained)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        counts = list(pool.map(rebuild_day, days))
+    return {day.isoformat(): count for day, count in zip(days, counts)}
+
+
+def _moment(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Query or rebuild the reconciliation rollups.")
+    parser.add_argument("command", choices=("summary", "series", "report", "rebuild"))
+    parser.add_argument("--start", type=_moment, required=True, help="ISO date or time, UTC unless given")
+    parser.add_argument("--end", type=_moment, required=True, help="exclusive")
+    parser.add_argument("--granularity", choices=("hour", "day"), default="hour", help="for series")
+    parser.add_argument("--workers", type=int, default=REBUILD_WORKERS, help="days rebuilt in parallel")
+    options = parser.parse_args()
+
+    if options.command == "rebuild":
+        result: object = rebuild(options.start, options.end, options.workers)
+    else:
+        with SessionLocal() as session:
+            if options.command == "summary":
+                result = summarize(session, options.start, options.end)
+            elif options.command == "series":
+                result = series(session, options.start, options.end, options.granularity)
+            else:
+                report = build_report(session, options.start, options.end)
+                session.commit()
+                result = {"id": str(report.id), "coverage_days": report.coverage_days, **report.summary}
+    print(json.dumps(result, indent=2, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Helpers shared by the payment gateway services."""
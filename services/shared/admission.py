@@ -0,0 +1,212 @@
+"""Admission control: an adaptive concurrency limit and per-key token buckets.
+
+``Admission.admit(key)`` runs before any expensive work and raises instead of
+queueing:
+
+- :class:`RateLimited` when ``key`` (the caller's user id) has spent its token
+  bucket: ``RATE_LIMIT_PER_SECOND`` refill, ``RATE_LIMIT_BURST`` capacity.
+  Buckets live in process memory, or in Redis when ``RATE_LIMIT_REDIS_URL`` is
+  set so replicas share one budget per user.
+- :class:`Overloaded` when the process already runs ``limit`` admitted
+  requests. The limit follows AIMD: it grows by one per request that finished
+  within ``ADMISSION_LATENCY_TARGET_MS`` while the limit was at least half
+  used, and is multiplied by ``ADMISSION_BACKOFF`` for each request that was
+  slower or failed with an overload error.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable
+
+from shared.metrics import ADMISSION_INFLIGHT, ADMISSION_LIMIT, ADMISSION_REJECTED, RATE_LIMIT_BACKEND_ERRORS
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() in {"1", "true", "yes"}
+INITIAL_LIMIT = float(os.getenv("ADMISSION_INITIAL_LIMIT", "64"))
+MIN_LIMIT = float(os.getenv("ADMISSION_MIN_LIMIT", "8"))
+MAX_LIMIT = float(os.getenv("ADMISSION_MAX_LIMIT", "512"))
+LATENCY_TARGET_MS = float(os.getenv("ADMISSION_LATENCY_TARGET_MS", "1000"))
+BACKOFF = float(os.getenv("ADMISSION_BACKOFF", "0.9"))
+OVERLOAD_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "1"))
+
+RATE_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "5"))
+BURST = float(os.getenv("RATE_LIMIT_BURST", "20"))
+REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "")
+MAX_LOCAL_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+_CONCURRENCY = ADMISSION_REJECTED.labels("concurrency")
+_RATE_LIMIT = ADMISSION_REJECTED.labels("rate_limit")
+
+
+class RateLimited(Exception):
+    def __init__(self, key: str, retry_after: float) -> None:
+        super().__init__(f"rate limit exceeded for {key}")
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+class Overloaded(Exception):
+    def __init__(self, limit: int, retry_after: int = OVERLOAD_RETRY_AFTER_SECONDS) -> None:
+        super().__init__(f"concurrency limit {limit} reached")
+        self.retry_after = retry_after
+
+
+class AIMDLimit:
+    """Concurrency limit driven by request latency; only touched from the event loop thread."""
+
+    def __init__(
+        self,
+        initial: float = INITIAL_LIMIT,
+        minimum: float = MIN_LIMIT,
+        maximum: float = MAX_LIMIT,
+        latency_target_ms: float = LATENCY_TARGET_MS,
+        backoff: float = BACKOFF,
+    ) -> None:
+        self.limit = min(max(initial, minimum), maximum)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target_ms / 1000
+        self.backoff = backoff
+        self.inflight = 0
+        ADMISSION_LIMIT.set(int(self.limit))
+
+    def try_acquire(self) -> bool:
+        if self.inflight >= int(self.limit):
+            return False
+        self.inflight += 1
+        ADMISSION_INFLIGHT.inc()
+        return True
+
+    def release(self, latency: float, dropped: bool) -> None:
+        # Utilisation is judged on the in-flight count this request saw, itself included.
+        inflight = self.inflight
+        self.inflight -= 1
+        ADMISSION_INFLIGHT.dec()
+        if dropped or latency > self.latency_target:
+            self.limit = max(self.minimum, self.limit * self.backoff)
+        elif inflight * 2 >= self.limit:
+            self.limit = min(self.maximum, self.limit + 1)
+        else:
+            return
+        ADMISSION_LIMIT.set(int(self.limit))
+
+
+class LocalTokenBuckets:
+    """Token buckets in process memory, least recently used keys evicted past ``max_keys``."""
+
+    def __init__(self, rate: float = RATE_PER_SECOND, burst: float = BURST, max_keys: int = MAX_LOCAL_KEYS) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    async def take(self, key: str) -> float:
+        """Spend one token; returns 0 when allowed, else seconds until one is available."""
+        now = time.monotonic()
+        tokens, stamp = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - stamp) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+    async def aclose(self) -> None:
+        return None
+
+
+# Refill and spend in one round trip. The Redis clock is used so replicas agree on elapsed time.
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local stamp = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - stamp) * rate)
+local wait = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+else
+  wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class RedisTokenBuckets:
+    """Token buckets shared by all replicas; falls back to local buckets while Redis is unreachable."""
+
+    def __init__(self, url: str, rate: float = RATE_PER_SECOND, burst: float = BURST, prefix: str = "ratelimit:") -> None:
+        import redis.asyncio as redis  # optional dependency, only needed with RATE_LIMIT_REDIS_URL
+
+        self._redis = redis.from_url(url, socket_timeout=0.05, socket_connect_timeout=0.25)
+        self._take = self._redis.register_script(_TAKE_SCRIPT)
+        self._errors = (redis.RedisError, OSError)
+        self.rate = rate
+        self.burst = burst
+        self.prefix = prefix
+        self._fallback = LocalTokenBuckets(rate, burst)
+
+    async def take(self, key: str) -> float:
+        try:
+            return float(await self._take(keys=[self.prefix + key], args=[self.rate, self.burst]))
+        except self._errors as exc:
+            RATE_LIMIT_BACKEND_ERRORS.inc()
+            logger.warning("[ADMISSION] Redis rate limiter unavailable, using local buckets: %s", exc)
+            return await self._fallback.take(key)
+
+    async def aclose(self) -> None:
+        await self._redis.aclose()
+
+
+class Admission:
+    def __init__(
+        self,
+        limit: AIMDLimit | None = None,
+        buckets: LocalTokenBuckets | RedisTokenBuckets | None = None,
+        is_overload: Callable[[BaseException], bool] = lambda _exc: True,
+        enabled: bool = ENABLED,
+    ) -> None:
+        self.limit = limit or AIMDLimit()
+        self.buckets = buckets or (RedisTokenBuckets(REDIS_URL) if REDIS_URL else LocalTokenBuckets())
+        # Decides whether a request's exception is a sign of overload (lowers the limit).
+        self.is_overload = is_overload
+        self.enabled = enabled
+
+    @asynccontextmanager
+    async def admit(self, key: str) -> AsyncIterator[None]:
+        if not self.enabled:
+            yield
+            return
+        wait = await self.buckets.take(key)
+        if wait > 0:
+            _RATE_LIMIT.inc()
+            raise RateLimited(key, wait)
+        if not self.limit.try_acquire():
+            _CONCURRENCY.inc()
+            raise Overloaded(int(self.limit.limit))
+        start = time.perf_counter()
+        dropped = False
+        try:
+            yield
+        except BaseException as exc:
+            dropped = self.is_overload(exc)
+            raise
+        finally:
+            self.limit.release(time.perf_counter() - start, dropped)
+
+    async def aclose(self) -> None:
+        await self.buckets.aclose()
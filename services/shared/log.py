@@ -0,0 +1,204 @@
+"""Logging setup for the services: off-thread output, JSON lines, sampling and redaction.
+
+``configure_logging`` replaces ``logging.basicConfig``. Request handlers only
+pay for the level check, the sampling filter and a queue put; formatting,
+PAN redaction and the write to stdout happen on a ``QueueListener`` thread.
+Log calls should pass arguments (``logger.info("order %s", order_id)``) so
+the message is only built for records that are actually emitted.
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+from datetime import datetime, timezone
+
+from shared.tracing import current_span
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()  # json | text
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_HEALTH_SAMPLE_RATE = float(os.getenv("LOG_HEALTH_SAMPLE_RATE", "0.01"))
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+
+TEXT_FORMAT = "[%(asctime)s] [%(name)s] [%(levelname)s] %(message)s"
+
+# Pass as ``extra=`` on high-frequency, low-value lines such as health checks.
+HEALTH_SAMPLE = {"sample_rate": LOG_HEALTH_SAMPLE_RATE}
+
+# Per-request client logs that add a line per outbound call at INFO.
+_NOISY_LOGGERS = ("httpx", "httpcore", "pika")
+# uvicorn installs its own synchronous stream handlers before importing the app.
+_UVICORN_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+_PAN_CANDIDATE = re.compile(r"(?<![\w-])\d(?:[ -]?\d){12,18}(?![\w-])")
+_LUHN_DOUBLED = {str(d): (2 * d) % 9 if d != 9 else 9 for d in range(10)}
+_JSON = json.JSONEncoder(default=str, ensure_ascii=False)
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+def _luhn_valid(digits: str) -> bool:
+    total = sum(map(int, digits[-1::-2])) + sum(map(_LUHN_DOUBLED.__getitem__, digits[-2::-2]))
+    return total % 10 == 0
+
+
+def _mask(match: re.Match) -> str:
+    digits = match.group().replace(" ", "").replace("-", "")
+    if not _luhn_valid(digits):
+        return match.group()
+    return "*" * (len(digits) - 4) + digits[-4:]
+
+
+def redact(message: str) -> str:
+    """Mask card numbers (13-19 digits, Luhn-valid) down to their last four."""
+    return _PAN_CANDIDATE.sub(_mask, message)
+
+
+class SamplingFilter(logging.Filter):
+    """Drops a fraction of DEBUG records and of records tagged with ``sample_rate``."""
+
+    def __init__(self, debug_rate: float = LOG_DEBUG_SAMPLE_RATE) -> None:
+        super().__init__()
+        self.debug_rate = debug_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = getattr(record, "sample_rate", None)
+        if rate is None and record.levelno == logging.DEBUG:
+            rate = self.debug_rate
+        return rate is None or rate >= 1.0 or random.random() < rate
+
+
+class ContextFilter(logging.Filter):
+    """Captures the active trace ids on the calling thread, before the record is queued."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        span = current_span()
+        if span is not None:
+            record.trace_id = f"{span.context.trace_id:032x}"
+            record.span_id = f"{span.context.span_id:016x}"
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Enqueues the raw record; drops it rather than block when the backlog is full.
+
+    The stock ``prepare`` formats the message on the calling thread. Here the
+    listener's formatter does that, so only records that get written are built.
+    ``SimpleQueue`` is lock-free in C; its size bound is approximate.
+    """
+
+    dropped = 0
+
+    def __init__(self, maxsize: int = LOG_QUEUE_SIZE) -> None:
+        super().__init__(queue.SimpleQueue())
+        self.maxsize = maxsize
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.queue.qsize() >= self.maxsize:
+            DroppingQueueHandler.dropped += 1
+            return
+        self.queue.put_nowait(record)
+
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self, service: str) -> None:
+        super().__init__()
+        self.service = service
+        self._second = -1
+        self._second_text = ""
+
+    def _timestamp(self, created: float) -> str:
+        # Records arrive in bursts within the same second; reuse the formatted prefix.
+        second = int(created)
+        if second != self._second:
+            self._second = second
+            self._second_text = datetime.fromtimestamp(second, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+        return f"{self._second_text}.{int((created - second) * 1000):03d}Z"
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self._timestamp(record.created),
+            "level": record.levelname,
+            "service": self.service,
+            "logger": record.name,
+            "message": redact(record.getMessage()),
+        }
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            entry["trace_id"] = trace_id
+            entry["span_id"] = record.span_id
+        if record.exc_info:
+            entry["exc_info"] = redact(self.formatException(record.exc_info))
+        return _JSON.encode(entry)
+
+
+class RedactingFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return redact(super().format(record))
+
+
+def configure_logging(service: str, level: str = LOG_LEVEL, fmt: str = LOG_FORMAT) -> None:
+    """Route the root logger through a bounded queue to a stdout writer thread."""
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter(service) if fmt == "json" else RedactingFormatter(TEXT_FORMAT))
+
+    handler = DroppingQueueHandler()
+    handler.addFilter(SamplingFilter())
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    for name in _NOISY_LOGGERS:
+        logging.getLogger(name).setLevel(max(logging.WARNING, root.level))
+    for name in _UVICORN_LOGGERS:
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers.clear()
+        uvicorn_logger.propagate = True
+
+    _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=False)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def _restart_after_fork() -> None:
+    # The writer thread does not survive fork (e.g. gunicorn with preload_app),
+    # and the inherited queue may be in the state it left it in. Records still
+    # queued were copied from the parent, which writes them itself.
+    global _listener
+    if _listener is None:
+        return
+    fresh: queue.SimpleQueue = queue.SimpleQueue()
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, DroppingQueueHandler):
+            handler.queue = fresh
+    _listener = logging.handlers.QueueListener(fresh, *_listener.handlers, respect_handler_level=False)
+    _listener.start()
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def shutdown_logging() -> None:
+    """Flush queued records; safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        listener, _listener = _listener, None
+        listener.stop()
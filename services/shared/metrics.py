@@ -0,0 +1,256 @@
+"""Prometheus instruments shared by the services and the ASGI glue to expose them.
+
+Label children are bound once at import time and timers are plain slotted
+objects, so an observation costs one ``perf_counter`` pair plus the histogram
+update (see benchmarks/metrics_overhead_bench.py).
+"""
+
+from __future__ import annotations
+
+import os
+from time import perf_counter
+from typing import Callable
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, make_asgi_app, multiprocess
+
+# Buckets tuned for in-process work (HSM ops, lock waits) up to slow dependencies.
+_LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+PAYMENT_STAGES = (
+    "order_fetch",
+    "fraud",
+    "replay_check",
+    "decrypt",
+    "psp",
+    "sign",
+    "db_commit",
+    "order_update",
+    "publish",
+)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by endpoint",
+    ["service", "method", "endpoint", "status"],
+    buckets=_LATENCY_BUCKETS,
+)
+PAYMENT_STAGE_SECONDS = Histogram(
+    "payment_stage_duration_seconds",
+    "Time spent in each payment orchestration stage",
+    ["stage"],
+    buckets=_LATENCY_BUCKETS,
+)
+HSM_LOCK_WAIT_SECONDS = Histogram(
+    "hsm_lock_wait_seconds",
+    "Time spent waiting for a pooled HSM session",
+    buckets=_LATENCY_BUCKETS,
+)
+HSM_OP_SECONDS = Histogram(
+    "hsm_operation_duration_seconds",
+    "PKCS#11 operation latency while holding the HSM session",
+    ["op"],
+    buckets=_LATENCY_BUCKETS,
+)
+HSM_EXECUTOR_PENDING = Gauge(
+    "hsm_executor_pending",
+    "HSM calls running or queued on the async executor",
+    multiprocess_mode="livesum",
+)
+HSM_REJECTED = Counter(
+    "hsm_rejected_total",
+    "HSM calls shed because the executor queue was full",
+    ["op"],
+)
+QUEUE_PUBLISH_SECONDS = Histogram(
+    "queue_publish_duration_seconds",
+    "Latency of publishing a message to RabbitMQ",
+    ["queue"],
+    buckets=_LATENCY_BUCKETS,
+)
+RECONCILIATION_STORE_SECONDS = Histogram(
+    "reconciliation_store_duration_seconds",
+    "Time to persist one receipt",
+    buckets=_LATENCY_BUCKETS,
+)
+RECONCILIATION_MESSAGES = Counter(
+    "reconciliation_messages_total",
+    "Receipts consumed by the reconciliation worker by outcome",
+    ["outcome"],
+)
+FRAUD_DECISIONS = Counter(
+    "fraud_decisions_total",
+    "Fraud decisions used by the orchestrator by source (engine, cache, fallback)",
+    ["source"],
+)
+FRAUD_FALLBACKS = Counter(
+    "fraud_fallbacks_total",
+    "Fraud checks answered by the local rules, by reason (timeout, error)",
+    ["reason"],
+)
+FRAUD_LINK_ENTITIES = Gauge(
+    "fraud_link_entities",
+    "Users, devices and IPs in the fraud engine's linking index",
+)
+FRAUD_LINK_SKIPPED_MERGES = Counter(
+    "fraud_link_skipped_merges_total",
+    "Links not merged because the combined cluster would exceed FRAUD_LINK_MAX_CLUSTER",
+)
+FRAUD_SHADOW_COMPARISONS = Counter(
+    "fraud_shadow_comparisons_total",
+    "Fraud engine decisions compared with the local rules (agree, disagree)",
+    ["result"],
+)
+PAYMENT_PIPELINE_RUNS = Counter(
+    "payment_pipeline_runs_total",
+    "Asynchronous payment intent runs by outcome (success, failed, retry, lease_lost)",
+    ["outcome"],
+)
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_total",
+    "Requests shed by admission control before any work, by reason (concurrency, rate_limit)",
+    ["reason"],
+)
+ADMISSION_LIMIT = Gauge(
+    "admission_concurrency_limit",
+    "Current adaptive concurrency limit",
+    multiprocess_mode="livesum",
+)
+ADMISSION_INFLIGHT = Gauge(
+    "admission_inflight",
+    "Admitted requests currently running",
+    multiprocess_mode="livesum",
+)
+RATE_LIMIT_BACKEND_ERRORS = Counter(
+    "rate_limit_backend_errors_total",
+    "Rate limit checks answered locally because Redis was unreachable",
+)
+ORDER_STATUS_EVENTS = Counter(
+    "order_status_events_total",
+    "Order status events handled by the order service consumer (applied, skipped, malformed)",
+    ["outcome"],
+)
+ORDER_STATUS_BATCH_SIZE = Histogram(
+    "order_status_batch_size",
+    "Orders written per batched status UPDATE",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+ORDER_STATUS_PUBLISH_FAILURES = Counter(
+    "order_status_publish_failures_total",
+    "Order status events the orchestrator could not hand to RabbitMQ",
+)
+PAYMENT_READ_CACHE = Counter(
+    "payment_read_cache_total",
+    "GET /payments/{order_id} lookups answered from the in-process receipt cache (hit, miss)",
+    ["result"],
+)
+DB_READ_ROUTES = Counter(
+    "db_read_routes_total",
+    "Read-only sessions handed out, by where they were routed (replica, primary)",
+    ["target"],
+)
+DB_REPLICA_LAG_SECONDS = Gauge(
+    "db_replica_lag_seconds",
+    "Replication lag last measured on a read replica",
+    ["replica"],
+    multiprocess_mode="livemax",
+)
+WEBHOOK_DELIVERIES = Counter(
+    "webhook_deliveries_total",
+    "Merchant webhook attempts by endpoint and outcome (delivered, retry, failed)",
+    ["endpoint", "outcome"],
+)
+WEBHOOK_DELIVERY_SECONDS = Histogram(
+    "webhook_delivery_duration_seconds",
+    "Latency of one webhook POST, including failed attempts",
+    ["endpoint"],
+    buckets=_LATENCY_BUCKETS,
+)
+WEBHOOK_QUEUED = Gauge(
+    "webhook_queued",
+    "Claimed deliveries waiting for a free sender slot, per endpoint",
+    ["endpoint"],
+)
+
+STAGE_OBSERVERS = {stage: PAYMENT_STAGE_SECONDS.labels(stage).observe for stage in PAYMENT_STAGES}
+HSM_OP_OBSERVERS = {
+    op: HSM_OP_SECONDS.labels(op).observe for op in ("sign", "encrypt", "decrypt", "public_key", "provision", "warm_up")
+}
+
+
+class Timer:
+    """Context manager that reports elapsed seconds to ``observe`` on exit."""
+
+    __slots__ = ("_observe", "_start")
+
+    def __init__(self, observe: Callable[[float], None]) -> None:
+        self._observe = observe
+        self._start = 0.0
+
+    def __enter__(self) -> "Timer":
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, *_exc: object) -> None:
+        self._observe(perf_counter() - self._start)
+
+
+def stage_timer(stage: str) -> Timer:
+    return Timer(STAGE_OBSERVERS[stage])
+
+
+def hsm_op_timer(op: str) -> Timer:
+    return Timer(HSM_OP_OBSERVERS[op])
+
+
+class PrometheusMiddleware:
+    """Pure ASGI middleware recording request latency per endpoint function.
+
+    The endpoint name is read from the scope after routing, which keeps label
+    cardinality bounded by the number of handlers rather than by raw paths.
+    """
+
+    def __init__(self, app: Callable, service: str) -> None:
+        self.app = app
+        self.service = service
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def _send(message: dict) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            endpoint = scope.get("endpoint")
+            if endpoint is not None:
+                HTTP_REQUEST_SECONDS.labels(
+                    self.service, scope["method"], endpoint.__name__, str(status_code)
+                ).observe(perf_counter() - start)
+
+
+def _metrics_app() -> Callable:
+    # Under several gunicorn workers each process writes to PROMETHEUS_MULTIPROC_DIR
+    # and any worker can serve the merged view. Callback gauges (set_function)
+    # would be missing from it, so the orchestrator's gauges are set explicitly.
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return make_asgi_app(registry=registry)
+    return make_asgi_app()
+
+
+def instrument_app(app, service: str) -> None:  # noqa: ANN001 - FastAPI app
+    """Expose ``/metrics`` and record per-endpoint request latency."""
+    app.add_middleware(PrometheusMiddleware, service=service)
+    app.mount("/metrics", _metrics_app())
@@ -0,0 +1,177 @@
+"""Monthly range partitions for the append-only tables: pre-creation and retention."""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+PRECREATE_MONTHS = int(os.getenv("PARTITION_PRECREATE_MONTHS", "3"))
+EXPIRE_MODE = os.getenv("PARTITION_EXPIRE_MODE", "archive").lower()
+ARCHIVE_SCHEMA = os.getenv("PARTITION_ARCHIVE_SCHEMA", "partition_archive")
+USED_TOKEN_RETENTION_DAYS = int(os.getenv("USED_TOKEN_RETENTION_DAYS", "90"))
+RECEIPT_RETENTION_DAYS = int(os.getenv("RECEIPT_RETENTION_DAYS", "400"))
+
+# Arbitrary constant so concurrent maintainers (worker replicas, cron) take turns.
+_MAINTENANCE_LOCK_KEY = 0x7061727469  # "parti"
+
+
+@dataclass(frozen=True)
+class PartitionPolicy:
+    table: str
+    retention_days: int
+
+
+POLICIES = (
+    PartitionPolicy("used_payment_tokens", USED_TOKEN_RETENTION_DAYS),
+    PartitionPolicy("reconciliation_receipts", RECEIPT_RETENTION_DAYS),
+)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def month_start(moment: datetime, offset: int = 0) -> datetime:
+    index = moment.year * 12 + moment.month - 1 + offset
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(table: str, start: datetime) -> str:
+    return f"{table}_p{start:%Y_%m}"
+
+
+def replay_window_start(issued_at: datetime | None = None, now: datetime | None = None) -> datetime:
+    """Earliest created_at a used-token row for a token can have.
+
+    A token cannot have been spent before it was issued, and rows older than the
+    retention horizon have been detached, so lookups bounded by this value only
+    touch the partitions the token's validity window overlaps.
+    """
+    horizon = (now or _utcnow()) - timedelta(days=USED_TOKEN_RETENTION_DAYS)
+    if issued_at is None:
+        return horizon
+    return max(issued_at, horizon)
+
+
+class PartitionManager:
+    """Creates partitions ahead of time and detaches those past retention."""
+
+    def __init__(self, engine: Engine, now: Callable[[], datetime] = _utcnow) -> None:
+        self._engine = engine
+        self._now = now
+
+    def existing(self, conn: Connection, table: str) -> dict[str, datetime]:
+        rows = conn.execute(
+            text(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid "
+                "JOIN pg_class p ON p.oid = i.inhparent "
+                "WHERE p.relname = :table"
+            ),
+            {"table": table},
+        ).scalars()
+        pattern = re.compile(rf"^{re.escape(table)}_p(\d{{4}})_(\d{{2}})$")
+        partitions: dict[str, datetime] = {}
+        for name in rows:
+            match = pattern.match(name)
+            if match:
+                partitions[name] = datetime(int(match[1]), int(match[2]), 1, tzinfo=timezone.utc)
+        return partitions
+
+    def _create(self, conn: Connection, table: str, start: datetime) -> str:
+        name = partition_name(table, start)
+        end = month_start(start, 1)
+        bounds = {"start": start, "end": end}
+        # Build the partition detached, pull any rows that fell into the default
+        # partition for this range, then attach; ATTACH would fail otherwise.
+        conn.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+        conn.execute(
+            text(
+                f"WITH moved AS (DELETE FROM {table}_default "
+                "WHERE created_at >= :start AND created_at < :end RETURNING *) "
+                f"INSERT INTO {name} SELECT * FROM moved"
+            ),
+            bounds,
+        )
+        conn.execute(
+            text(
+                f"ALTER TABLE {table} ATTACH PARTITION {name} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            )
+        )
+        return name
+
+    def ensure_ahead(self, conn: Connection, policy: PartitionPolicy, months: int = PRECREATE_MONTHS) -> list[str]:
+        existing = self.existing(conn, policy.table)
+        current = month_start(self._now())
+        created = []
+        for offset in range(months + 1):
+            start = month_start(current, offset)
+            if partition_name(policy.table, start) not in existing:
+                created.append(self._create(conn, policy.table, start))
+        return created
+
+    def expire(self, conn: Connection, policy: PartitionPolicy) -> list[str]:
+        cutoff = self._now() - timedelta(days=policy.retention_days)
+        expired = []
+        for name, start in sorted(self.existing(conn, policy.table).items(), key=lambda item: item[1]):
+            if month_start(start, 1) > cutoff:
+                continue
+            conn.execute(text(f"ALTER TABLE {policy.table} DETACH PARTITION {name}"))
+            if EXPIRE_MODE == "drop":
+                conn.execute(text(f"DROP TABLE {name}"))
+            else:
+                conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}"))
+                conn.execute(text(f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}"))
+            expired.append(name)
+        return expired
+
+    def run(self) -> dict[str, dict[str, list[str]]]:
+        summary: dict[str, dict[str, list[str]]] = {}
+        with self._engine.connect() as conn:
+            locked = conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": _MAINTENANCE_LOCK_KEY}).scalar()
+            conn.commit()
+            if not locked:
+                logger.info("[PARTITIONS] Another maintainer holds the lock, skipping")
+                return summary
+            try:
+                for policy in POLICIES:
+                    with conn.begin():
+                        created = self.ensure_ahead(conn, policy)
+                    with conn.begin():
+                        expired = self.expire(conn, policy)
+                    summary[policy.table] = {"created": created, "expired": expired}
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _MAINTENANCE_LOCK_KEY})
+                conn.commit()
+        return summary
+
+
+def main() -> None:
+    from shared.db import build_database_url, create_engine_from_env
+    from shared.sharding import sync_shard_engines
+
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s] [%(name)s] [%(levelname)s] %(message)s")
+    engine = create_engine_from_env(build_database_url(driver=None), name="partition_manager")
+    if not os.getenv("DATABASE_SHARDS"):
+        print(json.dumps(PartitionManager(engine).run(), indent=2))
+        return
+    # used_payment_tokens is partitioned on every shard primary as well.
+    summaries = {"DATABASE_URL": PartitionManager(engine).run()}
+    for shard, shard_engine in sync_shard_engines("partition_manager")[1].items():
+        summaries[f"shard {shard}"] = PartitionManager(shard_engine).run()
+    print(json.dumps(summaries, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Canonical receipt bytes, produced once and reused for signing, queueing and storage.
+
+Receipts are encoded in the RFC 8785 (JCS) form: object keys sorted, no
+insignificant whitespace, UTF-8 with only the mandatory JSON escapes. A
+receipt is a flat object of strings, integers, booleans and nulls with
+ASCII keys. For that subset the C ``json`` encoder with these settings emits
+exactly the JCS bytes, and :func:`encode` rejects anything outside it.
+
+The queue message wraps those bytes without re-encoding them::
+
+    {"receipt":<canonical receipt>,"signature":"<base64>"}
+
+The body is itself canonical. A consumer recovers the signed bytes by
+slicing rather than re-serialising, so it verifies exactly what was signed.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any
+
+# Largest integer I-JSON (RFC 7493) consumers can represent exactly.
+MAX_SAFE_INTEGER = 2**53 - 1
+
+_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), sort_keys=True, allow_nan=False)
+_SCALARS = (str, int, bool, type(None))
+_BODY_PREFIX = b'{"receipt":'
+_SIGNATURE_SEPARATOR = b',"signature":"'
+_BODY_SUFFIX = b'"}'
+
+
+def encode(receipt: dict[str, Any]) -> bytes:
+    """Canonical (JCS) UTF-8 bytes of a flat receipt."""
+    for key, value in receipt.items():
+        if not isinstance(key, str) or not key.isascii():
+            raise ValueError(f"receipt key {key!r} must be an ASCII string")
+        if not isinstance(value, _SCALARS):
+            raise ValueError(f"receipt field {key} has unsupported type {type(value).__name__}")
+        if isinstance(value, int) and not -MAX_SAFE_INTEGER <= value <= MAX_SAFE_INTEGER:
+            raise ValueError(f"receipt field {key} is outside the I-JSON integer range")
+    return _ENCODER.encode(receipt).encode("utf-8")
+
+
+def message_body(receipt: bytes, signature_b64: str) -> bytes:
+    """Queue body around already-encoded receipt bytes."""
+    return b"".join((_BODY_PREFIX, receipt, _SIGNATURE_SEPARATOR, signature_b64.encode("ascii"), _BODY_SUFFIX))
+
+
+def split_message(body: bytes) -> tuple[bytes, str] | None:
+    """Signed receipt bytes and signature from a :func:`message_body` body.
+
+    Returns ``None`` for bodies in any other layout, such as messages
+    published before canonical encoding, which must be parsed instead.
+    """
+    if not body.startswith(_BODY_PREFIX) or not body.endswith(_BODY_SUFFIX):
+        return None
+    # Base64 never contains the separator, so the last occurrence is the real one.
+    cut = body.rfind(_SIGNATURE_SEPARATOR)
+    if cut < len(_BODY_PREFIX):
+        return None
+    signature = body[cut + len(_SIGNATURE_SEPARATOR) : -len(_BODY_SUFFIX)]
+    return body[len(_BODY_PREFIX) : cut], signature.decode("ascii")
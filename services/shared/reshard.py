@@ -0,0 +1,223 @@
+"""Online resharding: move rows to the shard that owns them under a new shard list.
+
+    python -m shared.reshard plan   --from old.json --to new.json
+    python -m shared.reshard copy   --from old.json --to new.json
+    python -m shared.reshard verify --from old.json --to new.json
+    python -m shared.reshard purge  --from old.json --to new.json
+
+``--from`` and ``--to`` take a ``DATABASE_SHARDS`` list, either as a file or
+as inline JSON. Every shard in either list is scanned. A key (``user_id``, or
+``token_hash`` for used tokens) found on a shard that does not own it under
+``--to`` is moved to its owner:
+
+- ``plan`` counts the keys that would move, per source and target shard.
+- ``copy`` upserts their rows on the owner in batches. Orders and payment
+  intents are merged on ``id`` and keep the newer ``updated_at``, so the step
+  can be repeated while the services keep writing. PENDING intents are left
+  where the pipeline claimed them and are moved by a later run once final.
+- ``verify`` compares row counts and the newest ``updated_at`` per key.
+- ``purge`` deletes a key's rows from the source once they verify and none of
+  its intents is still PENDING there.
+
+While the new list is rolled out, the orchestrator runs with the old one as
+``DATABASE_SHARDS_PREVIOUS`` and checks used tokens on both owners, so the
+replay guard does not depend on ``copy`` having caught up.
+
+Used tokens are only moved inside the replay window; older ones expire with
+their partitions. ``used_v1_payment_tokens`` never expires and is moved in
+full. Intents without a ``user_id`` (written before it was recorded) are
+never moved.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Iterator
+
+from sqlalchemy import ColumnElement, MetaData, Table, and_, func, select, true
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Connection, Engine
+
+from shared.db import create_engine_from_env
+from shared.partitions import replay_window_start
+from shared.sharding import HashRing, ShardSpec, parse_shards
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+
+@dataclass(frozen=True)
+class ShardedTable:
+    name: str
+    key: str
+    # Mutable rows are merged on id by updated_at; append-only rows are copied once.
+    mutable: bool
+
+
+TABLES = (
+    ShardedTable("orders", "user_id", mutable=True),
+    ShardedTable("payment_intents", "user_id", mutable=True),
+    ShardedTable("used_payment_tokens", "token_hash", mutable=False),
+    ShardedTable("used_v1_payment_tokens", "token_hash", mutable=False),
+)
+
+
+def _load(value: str) -> list[ShardSpec]:
+    raw = value if value.lstrip().startswith("[") else open(value, encoding="utf-8").read()
+    return parse_shards(raw, driver=None)
+
+
+class Resharder:
+    def __init__(self, old: list[ShardSpec], new: list[ShardSpec], batch_size: int = BATCH_SIZE) -> None:
+        urls = {spec.name: spec.url for spec in old} | {spec.name: spec.url for spec in new}
+        self.engines: dict[str, Engine] = {
+            name: create_engine_from_env(url, name=f"reshard.{name}") for name, url in urls.items()
+        }
+        self.ring = HashRing(spec.name for spec in new)
+        self.batch_size = batch_size
+        self._tables: dict[tuple[str, str], Table] = {}
+
+    def _table(self, shard: str, name: str) -> Table:
+        if (shard, name) not in self._tables:
+            self._tables[(shard, name)] = Table(name, MetaData(), autoload_with=self.engines[shard])
+        return self._tables[(shard, name)]
+
+    def _scope(self, table: Table, spec: ShardedTable) -> ColumnElement[bool]:
+        if spec.name == "used_payment_tokens":
+            return table.c.created_at >= replay_window_start()
+        return true()
+
+    def moving(self, shard: str, spec: ShardedTable) -> Iterator[tuple[str, list[str]]]:
+        """Batches of (target shard, keys) on ``shard`` that ``--to`` places elsewhere."""
+        table = self._table(shard, spec.name)
+        key = table.c[spec.key]
+        after = ""
+        while True:
+            query = (
+                select(key)
+                .where(key > after, self._scope(table, spec))
+                .group_by(key)
+                .order_by(key)
+                .limit(self.batch_size)
+            )
+            with self.engines[shard].connect() as conn:
+                keys = list(conn.execute(query).scalars())
+            if not keys:
+                return
+            after = keys[-1]
+            targets: dict[str, list[str]] = defaultdict(list)
+            for value in keys:
+                owner = self.ring.lookup(value)
+                if owner != shard:
+                    targets[owner].append(value)
+            yield from targets.items()
+
+    def _rows(self, conn: Connection, table: Table, spec: ShardedTable, keys: list[str]) -> list[dict]:
+        query = select(table).where(table.c[spec.key].in_(keys), self._scope(table, spec))
+        if spec.name == "payment_intents":
+            query = query.where(table.c.status != "PENDING")
+        return [dict(row) for row in conn.execute(query).mappings()]
+
+    def _upsert(self, conn: Connection, table: Table, spec: ShardedTable, rows: list[dict]) -> None:
+        statement = insert(table).values(rows)
+        if spec.mutable:
+            statement = statement.on_conflict_do_update(
+                index_elements=["id"],
+                set_={column.name: statement.excluded[column.name] for column in table.columns if column.name != "id"},
+                where=table.c.updated_at < statement.excluded.updated_at,
+            )
+        else:
+            statement = statement.on_conflict_do_nothing()
+        conn.execute(statement)
+
+    def _summary(self, shard: str, spec: ShardedTable, keys: list[str]) -> dict[str, tuple[int, object]]:
+        table = self._table(shard, spec.name)
+        newest = func.max(table.c.updated_at) if spec.mutable else func.max(table.c.created_at)
+        query = (
+            select(table.c[spec.key], func.count(), newest)
+            .where(table.c[spec.key].in_(keys), self._scope(table, spec))
+            .group_by(table.c[spec.key])
+        )
+        with self.engines[shard].connect() as conn:
+            return {key: (count, latest) for key, count, latest in conn.execute(query)}
+
+    def _pending(self, shard: str, keys: list[str]) -> set[str]:
+        table = self._table(shard, "payment_intents")
+        query = select(table.c.user_id).where(table.c.user_id.in_(keys), table.c.status == "PENDING").distinct()
+        with self.engines[shard].connect() as conn:
+            return set(conn.execute(query).scalars())
+
+    def _verified(self, source: str, target: str, spec: ShardedTable, keys: list[str]) -> tuple[list[str], list[str]]:
+        source_rows = self._summary(source, spec, keys)
+        target_rows = self._summary(target, spec, keys)
+        matched, mismatched = [], []
+        for key in keys:
+            count, latest = source_rows.get(key, (0, None))
+            copied = target_rows.get(key, (0, None))
+            # The owner may already hold newer rows written after the switch.
+            if copied[0] >= count and (latest is None or (copied[1] is not None and copied[1] >= latest)):
+                matched.append(key)
+            else:
+                mismatched.append(key)
+        return matched, mismatched
+
+    def run(self, command: str) -> dict[str, dict[str, int]]:
+        summary: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        for shard in self.engines:
+            for spec in TABLES:
+                for target, keys in self.moving(shard, spec):
+                    counts = summary[f"{spec.name}: {shard} -> {target}"]
+                    counts["keys"] += len(keys)
+                    if command == "copy":
+                        counts["rows"] += self._copy(shard, target, spec, keys)
+                    elif command == "verify":
+                        counts["mismatched"] += len(self._verified(shard, target, spec, keys)[1])
+                    elif command == "purge":
+                        purged, skipped = self._purge(shard, target, spec, keys)
+                        counts["purged"] += purged
+                        counts["skipped"] += skipped
+        return {name: dict(counts) for name, counts in summary.items()}
+
+    def _copy(self, source: str, target: str, spec: ShardedTable, keys: list[str]) -> int:
+        with self.engines[source].connect() as conn:
+            rows = self._rows(conn, self._table(source, spec.name), spec, keys)
+        if rows:
+            with self.engines[target].begin() as conn:
+                self._upsert(conn, self._table(target, spec.name), spec, rows)
+        return len(rows)
+
+    def _purge(self, source: str, target: str, spec: ShardedTable, keys: list[str]) -> tuple[int, int]:
+        matched, _ = self._verified(source, target, spec, keys)
+        if spec.key == "user_id":
+            pending = self._pending(source, matched)
+            matched = [key for key in matched if key not in pending]
+        if matched:
+            table = self._table(source, spec.name)
+            with self.engines[source].begin() as conn:
+                conn.execute(table.delete().where(and_(table.c[spec.key].in_(matched), self._scope(table, spec))))
+        return len(matched), len(keys) - len(matched)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Move rows to their owning shard under a new DATABASE_SHARDS list.")
+    parser.add_argument("command", choices=("plan", "copy", "verify", "purge"))
+    parser.add_argument("--from", dest="old", required=True, help="current shard list (file or inline JSON)")
+    parser.add_argument("--to", dest="new", required=True, help="target shard list (file or inline JSON)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    options = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s] [%(name)s] [%(levelname)s] %(message)s")
+    resharder = Resharder(_load(options.old), _load(options.new), options.batch_size)
+    summary = resharder.run(options.command)
+    print(json.dumps(summary, indent=2, sort_keys=True))
+    if options.command == "verify" and any(counts.get("mismatched") for counts in summary.values()):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Startup check that the database schema has been migrated far enough."""
+
+from __future__ import annotations
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Bump together with every migration the services depend on.
+REQUIRED_REVISION = "0007"
+
+_VERSION_QUERY = text("SELECT version_num FROM alembic_version")
+
+
+class SchemaNotReady(RuntimeError):
+    """Raised when the database has not been migrated to REQUIRED_REVISION."""
+
+
+def _check(revisions: list[str]) -> str:
+    if not revisions:
+        raise SchemaNotReady("database has no alembic revision; run `alembic upgrade head`")
+    # Revision ids are zero-padded sequence numbers, so string order is migration order.
+    current = max(revisions)
+    if current < REQUIRED_REVISION:
+        raise SchemaNotReady(
+            f"database schema revision {current} is older than required {REQUIRED_REVISION}; "
+            "run `alembic upgrade head`"
+        )
+    return current
+
+
+async def verify_schema_async(engine: AsyncEngine) -> str:
+    async with engine.connect() as conn:
+        try:
+            revisions = list((await conn.execute(_VERSION_QUERY)).scalars())
+        except ProgrammingError as exc:
+            raise SchemaNotReady("alembic_version table missing; run `alembic upgrade head`") from exc
+    return _check(revisions)
+
+
+def verify_schema(engine: Engine) -> str:
+    with engine.connect() as conn:
+        try:
+            revisions = list(conn.execute(_VERSION_QUERY).scalars())
+        except ProgrammingError as exc:
+            raise SchemaNotReady("alembic_version table missing; run `alembic upgrade head`") from exc
+    return _check(revisions)
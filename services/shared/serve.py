@@ -0,0 +1,62 @@
+"""Start an internal service under the ASGI server that matches ``INTERNAL_TRANSPORT``.
+
+    python -m shared.serve main:app [--port 8000]
+
+``http1`` runs uvicorn as before. ``http2`` runs hypercorn, which accepts
+cleartext HTTP/2 with prior knowledge (h2c) from the orchestrator's client and
+plain HTTP/1.1 from everything else (health checks, Envoy, curl) on the same
+port.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import importlib
+import os
+
+from shared.transport import INTERNAL_TRANSPORT
+
+# httpcore caps itself at 100 streams per connection but can briefly run ahead of
+# the server's count when streams close; advertising more leaves room for that.
+H2_MAX_CONCURRENT_STREAMS = int(os.getenv("INTERNAL_HTTP2_SERVER_STREAMS", "256"))
+# Hypercorn closes a connection (GOAWAY) after this many requests; at the 1000
+# default a busy h2 connection is torn down every few seconds and in-flight
+# streams fail.
+H2_MAX_REQUESTS_PER_CONNECTION = int(os.getenv("INTERNAL_HTTP2_MAX_REQUESTS", "1000000"))
+
+
+def _load(target: str):  # noqa: ANN202 - any ASGI app
+    module, _, attribute = target.partition(":")
+    return getattr(importlib.import_module(module), attribute or "app")
+
+
+def _serve_hypercorn(target: str, host: str, port: int) -> None:
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [f"{host}:{port}"]
+    config.h2_max_concurrent_streams = H2_MAX_CONCURRENT_STREAMS
+    config.keep_alive_max_requests = H2_MAX_REQUESTS_PER_CONNECTION
+    asyncio.run(serve(_load(target), config))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("app")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--transport", default=INTERNAL_TRANSPORT, choices=("http1", "http2"))
+    args = parser.parse_args()
+
+    if args.transport == "http2":
+        _serve_hypercorn(args.app, args.host, args.port)
+    else:
+        import uvicorn
+
+        uvicorn.run(args.app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
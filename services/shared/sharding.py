@@ -0,0 +1,300 @@
+"""Horizontal sharding by user id, with lag-aware read replicas.
+
+``DATABASE_SHARDS`` lists the shards as JSON::
+
+    [{"name": "s0", "url": "postgresql://...@pg-s0/payment_gateway", "replicas": ["postgresql://...@pg-s0-r1/..."]},
+     {"name": "s1", "url": "postgresql://...@pg-s1/payment_gateway"}]
+
+When it is unset there is a single shard, ``default``, at ``DATABASE_URL``
+with the comma-separated ``DATABASE_REPLICA_URLS`` as replicas, so one
+database keeps working unchanged.
+
+Keys are placed on a consistent hash ring with ``DB_SHARD_VNODES`` points per
+shard: ``orders`` and ``payment_intents`` by ``user_id``, used payment tokens
+by token hash so the replay guard stays global. Adding a shard moves roughly
+1/N of the keys, which ``shared.reshard`` copies online.
+
+While a new shard list is rolled out, ``DATABASE_SHARDS_PREVIOUS`` holds the
+list it replaces. A key's previous owner is then reachable too, so used tokens
+can be checked and recorded on both before ``shared.reshard copy`` has moved
+them.
+
+Read-only sessions go to the replica with the least lag, provided it was
+measured within the last few ``DB_REPLICA_LAG_POLL_SECONDS`` and is at most
+``DB_REPLICA_MAX_LAG_SECONDS`` behind. Otherwise they go to the primary.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Iterable
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from shared.db import PoolSettings, build_database_url, create_async_engine_from_env, create_engine_from_env, with_driver
+from shared.metrics import DB_READ_ROUTES, DB_REPLICA_LAG_SECONDS
+from shared.schema import verify_schema_async
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SHARD = "default"
+VNODES = int(os.getenv("DB_SHARD_VNODES", "128"))
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "1"))
+REPLICA_LAG_POLL_SECONDS = float(os.getenv("DB_REPLICA_LAG_POLL_SECONDS", "1"))
+# A measurement older than this many poll intervals no longer vouches for the replica.
+_STALE_AFTER_POLLS = 3
+
+# Zero when the replica has replayed everything it received (an idle primary
+# does not look like lag); NULL when it has never replayed anything.
+_LAG_QUERY = text(
+    "SELECT CASE"
+    " WHEN NOT pg_is_in_recovery() THEN 0"
+    " WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+    " ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+_REPLICA_READS = DB_READ_ROUTES.labels("replica")
+_PRIMARY_READS = DB_READ_ROUTES.labels("primary")
+
+
+@dataclass(frozen=True)
+class ShardSpec:
+    name: str
+    url: str
+    replicas: tuple[str, ...] = ()
+
+
+def parse_shards(raw: str, driver: str | None = "asyncpg") -> list[ShardSpec]:
+    specs = [
+        ShardSpec(
+            name=str(item["name"]),
+            url=with_driver(item["url"], driver),
+            replicas=tuple(with_driver(url, driver) for url in item.get("replicas", ())),
+        )
+        for item in json.loads(raw)
+    ]
+    names = [spec.name for spec in specs]
+    if not specs or len(set(names)) != len(names):
+        raise ValueError("DATABASE_SHARDS must list at least one shard, with unique names")
+    return specs
+
+
+def load_shards(driver: str | None = "asyncpg") -> list[ShardSpec]:
+    raw = os.getenv("DATABASE_SHARDS", "").strip()
+    if raw:
+        return parse_shards(raw, driver)
+    replicas = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+    return [ShardSpec(DEFAULT_SHARD, build_database_url(driver), tuple(with_driver(url, driver) for url in replicas))]
+
+
+def load_previous_shards(driver: str | None = "asyncpg") -> list[ShardSpec]:
+    """The shard list being replaced by a reshard, or empty outside one."""
+    raw = os.getenv("DATABASE_SHARDS_PREVIOUS", "").strip()
+    return parse_shards(raw, driver) if raw else []
+
+
+def _point(value: str) -> int:
+    # Stable across processes and restarts, unlike hash().
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hash ring over shard names; adding a shard moves about 1/N of the keys to it."""
+
+    def __init__(self, names: Iterable[str], vnodes: int = VNODES) -> None:
+        self.names = sorted(set(names))
+        if not self.names:
+            raise ValueError("a hash ring needs at least one shard")
+        points = sorted((_point(f"{name}#{index}"), name) for name in self.names for index in range(vnodes))
+        self._points = [point for point, _ in points]
+        self._owners = [name for _, name in points]
+
+    def lookup(self, key: str) -> str:
+        if len(self.names) == 1:
+            return self.names[0]
+        index = bisect.bisect(self._points, _point(key)) % len(self._points)
+        return self._owners[index]
+
+
+def _pool_name(service: str, shard: str) -> str:
+    # The unsharded setup keeps its existing pool metric labels.
+    return service if shard == DEFAULT_SHARD else f"{service}.{shard}"
+
+
+class Replica:
+    def __init__(self, name: str, engine: AsyncEngine) -> None:
+        self.name = name
+        self.engine = engine
+        self.sessions = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+        self.lag: float | None = None
+        self.measured_at = 0.0
+        self._lag_gauge = DB_REPLICA_LAG_SECONDS.labels(name)
+
+    def usable(self, max_lag: float, now: float) -> bool:
+        return (
+            self.lag is not None
+            and self.lag <= max_lag
+            and now - self.measured_at <= _STALE_AFTER_POLLS * REPLICA_LAG_POLL_SECONDS
+        )
+
+    async def measure(self) -> None:
+        try:
+            async with self.engine.connect() as conn:
+                lag = (await conn.execute(_LAG_QUERY)).scalar()
+        except Exception as exc:  # noqa: BLE001 - an unreachable replica is just not used
+            self.lag = None
+            logger.warning("[SHARDING] Replica %s unreachable: %s", self.name, exc)
+            return
+        self.lag = None if lag is None else float(lag)
+        self.measured_at = time.monotonic()
+        if self.lag is not None:
+            self._lag_gauge.set(self.lag)
+
+
+class Shard:
+    def __init__(self, spec: ShardSpec, service: str, settings: PoolSettings | None = None) -> None:
+        pool_name = _pool_name(service, spec.name)
+        self.name = spec.name
+        self.engine = create_async_engine_from_env(spec.url, name=pool_name, settings=settings)
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False, class_=AsyncSession)
+        self.replicas = []
+        for index, url in enumerate(spec.replicas):
+            replica_name = f"{pool_name}.replica{index}"
+            self.replicas.append(Replica(replica_name, create_async_engine_from_env(url, name=replica_name, settings=settings)))
+
+    def replica(self, max_lag: float) -> Replica | None:
+        now = time.monotonic()
+        usable = [replica for replica in self.replicas if replica.usable(max_lag, now)]
+        return min(usable, key=lambda replica: replica.lag) if usable else None
+
+
+class ShardRouter:
+    """Maps keys to shard primaries and read-only work to fresh replicas."""
+
+    def __init__(
+        self,
+        service: str,
+        specs: list[ShardSpec] | None = None,
+        settings: PoolSettings | None = None,
+        max_lag: float = REPLICA_MAX_LAG_SECONDS,
+        vnodes: int = VNODES,
+        previous: list[ShardSpec] | None = None,
+    ) -> None:
+        specs = specs or load_shards()
+        previous = load_previous_shards() if previous is None else previous
+        self.shards = {spec.name: Shard(spec, service, settings) for spec in specs}
+        self.ring = HashRing(self.shards, vnodes)
+        # Shards the previous list drops stay open (and claimable) until it is unset.
+        for spec in previous:
+            if spec.name not in self.shards:
+                self.shards[spec.name] = Shard(spec, service, settings)
+        self.previous_ring = HashRing((spec.name for spec in previous), vnodes) if previous else None
+        self.max_lag = max_lag
+        self._lag_monitor: asyncio.Task | None = None
+
+    def shard_for(self, key: str) -> Shard:
+        return self.shards[self.ring.lookup(key)]
+
+    def owners(self, key: str) -> list[Shard]:
+        """The primary that owns ``key`` and, during a reshard, its previous owner if that differs."""
+        owner = self.shard_for(key)
+        if self.previous_ring is None:
+            return [owner]
+        previous = self.shards[self.previous_ring.lookup(key)]
+        return [owner] if previous is owner else [owner, previous]
+
+    def session(self, key: str) -> AsyncSession:
+        """Session on the primary that owns ``key``."""
+        return self.shard_for(key).sessions()
+
+    def read_session(self, key: str, max_lag: float | None = None) -> AsyncSession:
+        """Session for reads that tolerate ``max_lag`` seconds of staleness."""
+        shard = self.shard_for(key)
+        replica = shard.replica(self.max_lag if max_lag is None else max_lag)
+        if replica is None:
+            _PRIMARY_READS.inc()
+            return shard.sessions()
+        _REPLICA_READS.inc()
+        return replica.sessions()
+
+    async def verify_schema(self) -> str:
+        """Every primary must be migrated; returns the oldest revision among them."""
+        return min([await verify_schema_async(shard.engine) for shard in self.shards.values()])
+
+    def start(self) -> None:
+        replicas = [replica for shard in self.shards.values() for replica in shard.replicas]
+        if replicas and self._lag_monitor is None:
+            self._lag_monitor = asyncio.create_task(self._watch_lag(replicas))
+
+    async def _watch_lag(self, replicas: list[Replica]) -> None:
+        while True:
+            await asyncio.gather(*(replica.measure() for replica in replicas))
+            await asyncio.sleep(REPLICA_LAG_POLL_SECONDS)
+
+    async def aclose(self) -> None:
+        if self._lag_monitor is not None:
+            task, self._lag_monitor = self._lag_monitor, None
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        for shard in self.shards.values():
+            await shard.engine.dispose()
+            for replica in shard.replicas:
+                await replica.engine.dispose()
+
+
+class SessionSet:
+    """Sessions one request opened, at most one per shard and role; closed together."""
+
+    def __init__(self, router: ShardRouter) -> None:
+        self.router = router
+        self._open: dict[tuple[str, bool], AsyncSession] = {}
+
+    def primary(self, key: str) -> AsyncSession:
+        return self._primary_on(self.router.shard_for(key))
+
+    def _primary_on(self, shard: Shard) -> AsyncSession:
+        session = self._open.get((shard.name, False))
+        if session is None:
+            session = self._open[(shard.name, False)] = shard.sessions()
+        return session
+
+    def primaries(self, key: str) -> list[AsyncSession]:
+        """Primary sessions on every shard that may hold ``key``; see ``ShardRouter.owners``."""
+        return [self._primary_on(shard) for shard in self.router.owners(key)]
+
+    def read(self, key: str) -> AsyncSession:
+        """A replica session, or the primary session itself when no replica is fresh enough."""
+        shard = self.router.shard_for(key)
+        session = self._open.get((shard.name, True))
+        if session is None:
+            replica = shard.replica(self.router.max_lag)
+            if replica is None:
+                _PRIMARY_READS.inc()
+                return self.primary(key)
+            _REPLICA_READS.inc()
+            session = self._open[(shard.name, True)] = replica.sessions()
+        return session
+
+    async def close(self) -> None:
+        for session in self._open.values():
+            await session.close()
+        self._open.clear()
+
+
+def sync_shard_engines(service: str, settings: PoolSettings | None = None) -> tuple[HashRing, dict[str, Engine]]:
+    """Ring plus one psycopg2 engine per primary, for the synchronous workers."""
+    specs = load_shards(driver=None)
+    engines = {
+        spec.name: create_engine_from_env(spec.url, name=_pool_name(service, spec.name), settings=settings)
+        for spec in specs
+    }
+    return HashRing(engines), engines
@@ -0,0 +1,183 @@
+"""Receipt signing keys as JWKs, and a verifier that resolves them locally.
+
+The orchestrator publishes every signing key it still holds (the active one
+and retired ones) at ``/.well-known/jwks.json``. Each signed receipt carries
+the ``kid`` of the key that signed it. :class:`ReceiptVerifier` keeps the
+parsed public keys in a dict keyed by ``kid``. It refetches the key set only
+when it sees an unknown ``kid``, at most once per ``min_refresh_interval``.
+Verification therefore never touches the HSM and costs one dict lookup plus
+the public-key operation.
+
+Three signature algorithms are supported, named as in JWS (RFC 7518/8037):
+``RS256`` (RSASSA-PKCS1-v1_5, 256-byte signatures), ``ES256`` (ECDSA P-256,
+64-byte raw ``r || s`` as produced by PKCS#11) and ``EdDSA`` (Ed25519, 64 bytes).
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import logging
+import threading
+import time
+import urllib.request
+from typing import Any
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, padding, rsa
+from cryptography.hazmat.primitives.asymmetric.utils import encode_dss_signature
+
+logger = logging.getLogger(__name__)
+
+ACTIVE = "active"
+RETIRED = "retired"
+NEXT = "next"
+
+RS256 = "RS256"
+ES256 = "ES256"
+EDDSA = "EdDSA"
+ALGORITHMS = (RS256, ES256, EDDSA)
+
+PublicKey = rsa.RSAPublicKey | ec.EllipticCurvePublicKey | ed25519.Ed25519PublicKey
+
+_P256_COORDINATE_SIZE = 32
+
+
+def algorithm_name(value: str) -> str:
+    """Canonical JWS name for a configured algorithm, case-insensitively."""
+    for name in ALGORITHMS:
+        if value.upper() == name.upper():
+            return name
+    raise ValueError(f"unsupported signing algorithm {value!r}; expected one of {', '.join(ALGORITHMS)}")
+
+
+def _b64url_uint(value: int) -> str:
+    raw = value.to_bytes((value.bit_length() + 7) // 8 or 1, "big")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64url(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64url_decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _b64url_decode_uint(text: str) -> int:
+    return int.from_bytes(_b64url_decode(text), "big")
+
+
+def public_jwk(kid: str, public_key: PublicKey, status: str = ACTIVE) -> dict[str, str]:
+    """JWK (RFC 7517) for a receipt signing key."""
+    if isinstance(public_key, rsa.RSAPublicKey):
+        numbers = public_key.public_numbers()
+        fields = {"kty": "RSA", "alg": RS256, "n": _b64url_uint(numbers.n), "e": _b64url_uint(numbers.e)}
+    elif isinstance(public_key, ec.EllipticCurvePublicKey) and isinstance(public_key.curve, ec.SECP256R1):
+        numbers = public_key.public_numbers()
+        fields = {
+            "kty": "EC",
+            "alg": ES256,
+            "crv": "P-256",
+            "x": _b64url(numbers.x.to_bytes(_P256_COORDINATE_SIZE, "big")),
+            "y": _b64url(numbers.y.to_bytes(_P256_COORDINATE_SIZE, "big")),
+        }
+    elif isinstance(public_key, ed25519.Ed25519PublicKey):
+        raw = public_key.public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+        fields = {"kty": "OKP", "alg": EDDSA, "crv": "Ed25519", "x": _b64url(raw)}
+    else:
+        raise ValueError(f"unsupported signing key {type(public_key).__name__}")
+    return {"kid": kid, "use": "sig", **fields, "status": status}
+
+
+def public_key_from_jwk(jwk: dict[str, Any]) -> PublicKey:
+    kty, crv = jwk.get("kty"), jwk.get("crv")
+    if kty == "RSA":
+        return rsa.RSAPublicNumbers(_b64url_decode_uint(jwk["e"]), _b64url_decode_uint(jwk["n"])).public_key()
+    if kty == "EC" and crv == "P-256":
+        x, y = _b64url_decode_uint(jwk["x"]), _b64url_decode_uint(jwk["y"])
+        return ec.EllipticCurvePublicNumbers(x, y, ec.SECP256R1()).public_key()
+    if kty == "OKP" and crv == "Ed25519":
+        return ed25519.Ed25519PublicKey.from_public_bytes(_b64url_decode(jwk["x"]))
+    raise ValueError(f"unsupported key type {kty!r} {crv or ''}".rstrip())
+
+
+def verify_signature(public_key: PublicKey, message: bytes, signature: bytes) -> bool:
+    """Check a receipt signature with the scheme implied by the key type."""
+    try:
+        if isinstance(public_key, rsa.RSAPublicKey):
+            public_key.verify(signature, message, padding.PKCS1v15(), hashes.SHA256())
+        elif isinstance(public_key, ec.EllipticCurvePublicKey):
+            if len(signature) != 2 * _P256_COORDINATE_SIZE:
+                return False
+            # PKCS#11 returns r || s; cryptography expects the DER form.
+            r = int.from_bytes(signature[:_P256_COORDINATE_SIZE], "big")
+            s = int.from_bytes(signature[_P256_COORDINATE_SIZE:], "big")
+            public_key.verify(encode_dss_signature(r, s), message, ec.ECDSA(hashes.SHA256()))
+        else:
+            public_key.verify(signature, message)
+    except InvalidSignature:
+        return False
+    return True
+
+
+class SigningKeyUnavailable(LookupError):
+    """The key id is not cached and the JWKS could not be consulted just now."""
+
+
+class ReceiptVerifier:
+    """Verifies receipt signatures against a cached JWKS."""
+
+    def __init__(self, jwks_url: str, min_refresh_interval: float = 30.0, timeout: float = 5.0) -> None:
+        self.jwks_url = jwks_url
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self._keys: dict[str, PublicKey] = {}
+        self._fetched_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def load(self, jwks: dict[str, Any]) -> None:
+        keys = {}
+        for jwk in jwks.get("keys", []):
+            try:
+                keys[jwk["kid"]] = public_key_from_jwk(jwk)
+            except (KeyError, ValueError) as exc:
+                logger.warning("[SIGNING] Skipping unusable JWK %s: %s", jwk.get("kid"), exc)
+        # Replace the dict wholesale so lock-free readers never see it half-built.
+        self._keys = keys
+
+    def refresh(self) -> None:
+        with urllib.request.urlopen(self.jwks_url, timeout=self.timeout) as response:
+            self.load(json.load(response))
+        logger.info("[SIGNING] Loaded %s receipt signing keys from %s", len(self._keys), self.jwks_url)
+
+    def key(self, kid: str) -> PublicKey | None:
+        """The key for ``kid``, or None if a fresh JWKS does not list it.
+
+        Raises ``SigningKeyUnavailable`` when the JWKS fetch fails or a refresh
+        is held back by ``min_refresh_interval``: the kid may still be valid.
+        """
+        key = self._keys.get(kid)
+        if key is not None:
+            return key
+        with self._lock:
+            key = self._keys.get(kid)
+            if key is not None:
+                return key
+            if time.monotonic() - self._fetched_at < self.min_refresh_interval:
+                raise SigningKeyUnavailable(f"key {kid} unknown; JWKS refreshed less than {self.min_refresh_interval:g}s ago")
+            # Unknown kid: the signer may have rotated since the last fetch.
+            self._fetched_at = time.monotonic()
+            try:
+                self.refresh()
+            except OSError as exc:
+                logger.warning("[SIGNING] JWKS refresh failed: %s", exc)
+                raise SigningKeyUnavailable(f"key {kid} unknown; JWKS refresh failed: {exc}") from exc
+            return self._keys.get(kid)
+
+    def verify(self, message: bytes, signature: bytes, kid: str) -> bool:
+        key = self.key(kid)
+        if key is None:
+            return False
+        return verify_signature(key, message, signature)
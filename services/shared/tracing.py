@@ -0,0 +1,347 @@
+"""W3C trace-context propagation with a sampled span exporter.
+
+Follows the OpenTelemetry data model closely enough that spans can be loaded
+into a collector later, without pulling the SDK into every service:
+
+* ``traceparent`` headers are extracted by :class:`TracingMiddleware`, injected
+  into outgoing httpx requests by :class:`shared.transport.TracingTransport` and into AMQP
+  message headers by :func:`inject`.
+* Sampling is parent-based with a trace-id ratio at the root, so one decision
+  made at the edge holds for every hop of a payment.
+* Unsampled spans still carry ids for propagation but are never queued.
+
+Finished, sampled spans are batched by a daemon thread and written as JSON
+lines to ``TRACE_EXPORT_PATH`` or POSTed to ``TRACE_COLLECTOR_URL``.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, Mapping, MutableMapping
+
+logger = logging.getLogger(__name__)
+
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none").lower()  # none | file | http
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "/var/log/traces/{service}.jsonl")
+TRACE_COLLECTOR_URL = os.getenv("TRACE_COLLECTOR_URL", "http://trace_collector:4318/v1/spans")
+TRACE_SAMPLE_RATIO = float(os.getenv("TRACE_SAMPLE_RATIO", "0.1"))
+TRACE_BATCH_SIZE = int(os.getenv("TRACE_BATCH_SIZE", "512"))
+TRACE_FLUSH_INTERVAL = float(os.getenv("TRACE_FLUSH_INTERVAL", "1.0"))
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "8192"))
+
+TRACEPARENT = "traceparent"
+_FLAG_SAMPLED = 0x01
+_RATIO_BOUND = int(max(0.0, min(1.0, TRACE_SAMPLE_RATIO)) * (1 << 63))
+
+_current: ContextVar["Span | None"] = ContextVar("current_span", default=None)
+_service = "unknown"
+_exporter: "SpanExporter | None" = None
+
+
+class SpanContext:
+    """The propagated part of a span: ids and the sampling decision."""
+
+    __slots__ = ("trace_id", "span_id", "sampled")
+
+    def __init__(self, trace_id: int, span_id: int, sampled: bool) -> None:
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id:032x}-{self.span_id:016x}-{_FLAG_SAMPLED if self.sampled else 0:02x}"
+
+
+class Span:
+    __slots__ = ("context", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "status")
+
+    def __init__(self, name: str, kind: str, parent: SpanContext | None, attributes: dict | None) -> None:
+        if parent is None:
+            trace_id = random.getrandbits(128) or 1
+            # TraceIdRatioBased: compare the low 63 bits so every service agrees.
+            sampled = (trace_id & ((1 << 63) - 1)) < _RATIO_BOUND
+            self.parent_id = None
+        else:
+            trace_id, sampled = parent.trace_id, parent.sampled
+            self.parent_id = parent.span_id
+        self.context = SpanContext(trace_id, random.getrandbits(64) or 1, sampled)
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes or {}
+        self.status = "ok"
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_error(self, description: str) -> None:
+        self.status = "error"
+        self.attributes["error.message"] = description
+
+    def end(self) -> None:
+        if self.end_ns:
+            return
+        self.end_ns = time.time_ns()
+        if self.context.sampled and _exporter is not None:
+            _exporter.submit(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": f"{self.context.trace_id:032x}",
+            "span_id": f"{self.context.span_id:016x}",
+            "parent_span_id": f"{self.parent_id:016x}" if self.parent_id else None,
+            "name": self.name,
+            "kind": self.kind,
+            "service": _service,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class SpanExporter:
+    """Bounded queue drained by a daemon thread; spans are dropped when it is full."""
+
+    def __init__(self, write: Callable[[list[dict]], None]) -> None:
+        self._write = write
+        self.dropped = 0
+        self._start()
+
+    def _start(self) -> None:
+        self._queue: queue.Queue[Span] = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def _restart_after_fork(self) -> None:
+        # Only the forking thread survives, and the queue's lock may have been
+        # held by the old exporter; start over, leaving queued spans to the parent.
+        self.dropped = 0
+        self._start()
+
+    def submit(self, span: Span) -> None:
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self, first: Span) -> list[dict]:
+        batch = [first.to_dict()]
+        while len(batch) < TRACE_BATCH_SIZE:
+            try:
+                batch.append(self._queue.get_nowait().to_dict())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            try:
+                first = self._queue.get(timeout=TRACE_FLUSH_INTERVAL)
+            except queue.Empty:
+                continue
+            batch = self._drain(first)
+            try:
+                self._write(batch)
+            except Exception as exc:  # exporting must never break the service
+                logger.warning("[TRACING] Failed to export %s spans: %s", len(batch), exc)
+
+    def flush(self, timeout: float = 5.0) -> None:
+        deadline = time.monotonic() + timeout
+        while not self._queue.empty() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+
+def _file_writer(path: str) -> Callable[[list[dict]], None]:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    def write(batch: list[dict]) -> None:
+        with open(path, "a", encoding="utf-8") as handle:
+            handle.write("".join(json.dumps(span, separators=(",", ":")) + "\n" for span in batch))
+
+    return write
+
+
+def _http_writer(url: str) -> Callable[[list[dict]], None]:
+    def write(batch: list[dict]) -> None:
+        request = urllib.request.Request(
+            url,
+            data=json.dumps({"spans": batch}).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=5) as response:
+            response.read()
+
+    return write
+
+
+def configure(service: str) -> None:
+    """Name this process's spans and start the exporter selected by ``TRACE_EXPORTER``."""
+    global _service, _exporter
+    _service = service
+    if _exporter is not None or TRACE_EXPORTER == "none":
+        return
+    if TRACE_EXPORTER == "file":
+        path = TRACE_EXPORT_PATH.format(service=service)
+        _exporter = SpanExporter(_file_writer(path))
+        logger.info("[TRACING] Exporting sampled spans to %s (ratio=%s)", path, TRACE_SAMPLE_RATIO)
+    elif TRACE_EXPORTER == "http":
+        _exporter = SpanExporter(_http_writer(TRACE_COLLECTOR_URL))
+        logger.info("[TRACING] Exporting sampled spans to %s (ratio=%s)", TRACE_COLLECTOR_URL, TRACE_SAMPLE_RATIO)
+    else:
+        raise ValueError(f"unknown TRACE_EXPORTER {TRACE_EXPORTER!r}")
+
+
+def _restart_after_fork() -> None:
+    if _exporter is not None:
+        _exporter._restart_after_fork()
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def current_span() -> Span | None:
+    return _current.get()
+
+
+def extract(carrier: Mapping[str, Any] | None) -> SpanContext | None:
+    """Parse a ``traceparent`` value; malformed or missing headers start a new trace."""
+    if not carrier:
+        return None
+    value = carrier.get(TRACEPARENT)
+    if isinstance(value, bytes):
+        value = value.decode("latin-1")
+    if not isinstance(value, str) or len(value) != 55:
+        return None
+    parts = value.split("-")
+    if len(parts) != 4:
+        return None
+    version, trace_hex, span_hex, flags = parts
+    try:
+        trace_id, span_id, flag_bits = int(trace_hex, 16), int(span_hex, 16), int(flags, 16)
+    except ValueError:
+        return None
+    if version == "ff" or not trace_id or not span_id:
+        return None
+    return SpanContext(trace_id, span_id, bool(flag_bits & _FLAG_SAMPLED))
+
+
+def inject(carrier: MutableMapping[str, Any], span: Span | None = None) -> None:
+    span = span or _current.get()
+    if span is not None:
+        carrier[TRACEPARENT] = span.context.traceparent()
+
+
+@contextmanager
+def start_span(
+    name: str,
+    kind: str = "internal",
+    parent: SpanContext | None = None,
+    attributes: dict | None = None,
+) -> Iterator[Span]:
+    """Open a span as the current one; the parent defaults to the active span."""
+    if parent is None:
+        active = _current.get()
+        parent = active.context if active is not None else None
+    span = Span(name, kind, parent, attributes)
+    token = _current.set(span)
+    try:
+        yield span
+    except BaseException as exc:
+        span.set_error(type(exc).__name__)
+        raise
+    finally:
+        _current.reset(token)
+        span.end()
+
+
+class TracingMiddleware:
+    """Pure ASGI middleware opening a server span per HTTP request."""
+
+    def __init__(self, app: Callable, service: str) -> None:
+        self.app = app
+        configure(service)
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {k.decode("latin-1"): v for k, v in scope["headers"] if k == b"traceparent"}
+        with start_span(
+            f"{scope['method']} {scope['path']}",
+            kind="server",
+            parent=extract(headers),
+            attributes={"http.method": scope["method"], "http.target": scope["path"]},
+        ) as span:
+
+            async def _send(message: dict) -> None:
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.status = "error"
+                await send(message)
+
+            await self.app(scope, receive, _send)
+            endpoint = scope.get("endpoint")
+            if endpoint is not None:
+                # Route templates are not in the scope; use the handler name for grouping.
+                span.name = f"{scope['method']} {endpoint.__name__}"
+
+
+def trace_app(app, service: str) -> None:  # noqa: ANN001 - FastAPI app
+    """Continue incoming traces and record a server span per request."""
+    app.add_middleware(TracingMiddleware, service=service)
+
+
+def _load(paths: list[str]) -> dict[str, list[dict]]:
+    traces: dict[str, list[dict]] = {}
+    for path in paths:
+        with open(path, encoding="utf-8") as handle:
+            for line in handle:
+                if line.strip():
+                    span = json.loads(line)
+                    traces.setdefault(span["trace_id"], []).append(span)
+    return traces
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Print the slowest exported traces with a per-span breakdown."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Summarise exported spans by trace.")
+    parser.add_argument("paths", nargs="+", help="span files written by the file exporter")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    traces = _load(args.paths)
+    ranked = sorted(
+        traces.items(),
+        key=lambda item: max(s["end_time_unix_nano"] for s in item[1]) - min(s["start_time_unix_nano"] for s in item[1]),
+        reverse=True,
+    )
+    for trace_id, spans in ranked[: args.top]:
+        origin = min(s["start_time_unix_nano"] for s in spans)
+        total = (max(s["end_time_unix_nano"] for s in spans) - origin) / 1e6
+        print(f"trace {trace_id}  {total:.1f} ms  {len(spans)} spans")
+        for span in sorted(spans, key=lambda s: s["start_time_unix_nano"]):
+            offset = (span["start_time_unix_nano"] - origin) / 1e6
+            print(f"  +{offset:8.1f} ms {span['duration_ms']:8.1f} ms  {span['service']:22s} {span['name']}")
+
+
+if __name__ == "__main__":
+    main()
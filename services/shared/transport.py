@@ -0,0 +1,106 @@
+"""HTTP client settings for service-to-service calls.
+
+``INTERNAL_TRANSPORT`` selects the protocol the orchestrator uses for the
+order service and the fraud engine:
+
+- ``http1`` (default): HTTP/1.1 keep-alive. One request per connection at a
+  time, so concurrent payments need up to ``INTERNAL_HTTP1_MAX_CONNECTIONS``
+  sockets and wait for a free one beyond that.
+- ``http2``: cleartext HTTP/2 with prior knowledge (h2c). Requests are
+  multiplexed as streams over at most ``INTERNAL_HTTP2_MAX_CONNECTIONS``
+  connections per service. The services must then be started through
+  ``shared.serve``, which runs hypercorn.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Any, AsyncIterator
+
+import httpx
+
+from shared.tracing import TRACEPARENT, Span, current_span
+
+INTERNAL_TRANSPORT = os.getenv("INTERNAL_TRANSPORT", "http1").lower()
+HTTP1_MAX_CONNECTIONS = int(os.getenv("INTERNAL_HTTP1_MAX_CONNECTIONS", "100"))
+HTTP2_MAX_CONNECTIONS = int(os.getenv("INTERNAL_HTTP2_MAX_CONNECTIONS", "4"))
+
+if INTERNAL_TRANSPORT not in {"http1", "http2"}:
+    raise ValueError(f"INTERNAL_TRANSPORT must be http1 or http2, not {INTERNAL_TRANSPORT!r}")
+
+
+class _TracedStream(httpx.AsyncByteStream):
+    """Response body stream that ends its client span when the body is closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, span: Span) -> None:
+        self._stream = stream
+        self._span = span
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        try:
+            async for chunk in self._stream:
+                yield chunk
+        except BaseException as exc:
+            self._span.set_error(type(exc).__name__)
+            raise
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._span.end()
+
+
+class TracingTransport(httpx.AsyncBaseTransport):
+    """Emits a client span per request and injects ``traceparent``.
+
+    httpx has no error hook, so this wraps ``handle_async_request``: a timeout
+    or connection error ends the span with an error status instead of leaving
+    it open. Otherwise the span ends when the response body is closed.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport) -> None:
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        active = current_span()
+        span = Span(
+            f"{request.method} {request.url.host}",
+            "client",
+            active.context if active is not None else None,
+            {"http.method": request.method, "http.url": str(request.url.copy_with(query=None))},
+        )
+        request.headers[TRACEPARENT] = span.context.traceparent()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException as exc:
+            span.set_error(type(exc).__name__)
+            span.end()
+            raise
+        span.set_attribute("http.status_code", response.status_code)
+        if response.status_code >= 500:
+            span.status = "error"
+        if response.is_closed:
+            # The body was already read into memory (e.g. by a mock transport).
+            span.end()
+        else:
+            response.stream = _TracedStream(response.stream, span)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def internal_client(transport: str = INTERNAL_TRANSPORT, traced: bool = False, **kwargs: Any) -> httpx.AsyncClient:
+    """``httpx.AsyncClient`` for internal calls; extra kwargs are passed through.
+
+    ``traced`` wraps the connection pool in :class:`TracingTransport`.
+    """
+    if transport == "http2":
+        # http1=False makes httpx speak HTTP/2 on http:// URLs without an Upgrade round trip.
+        limits = httpx.Limits(max_connections=HTTP2_MAX_CONNECTIONS, max_keepalive_connections=HTTP2_MAX_CONNECTIONS)
+        pool = httpx.AsyncHTTPTransport(http1=False, http2=True, limits=limits)
+    else:
+        limits = httpx.Limits(max_connections=HTTP1_MAX_CONNECTIONS, max_keepalive_connections=HTTP1_MAX_CONNECTIONS)
+        pool = httpx.AsyncHTTPTransport(limits=limits)
+    return httpx.AsyncClient(transport=TracingTransport(pool) if traced else pool, **kwargs)
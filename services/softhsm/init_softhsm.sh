@@ -56,6 +56,18 @@ pkcs11-tool --module /usr/lib/softhsm/libsofthsm2.so \
 
 echo "[SoftHSM] AES key generated successfully!"
 
+# Generate HMAC key that authenticates v2 payment tokens (256-bit)
+echo "[SoftHSM] Generating HMAC key for payment tokens..."
+pkcs11-tool --module /usr/lib/softhsm/libsofthsm2.so \
+  --token-label "$LABEL" \
+  --pin "$USER_PIN" \
+  --keygen \
+  --key-type GENERIC:32 \
+  --label "payment-token-mac-key" \
+  --id 03
+
+echo "[SoftHSM] HMAC key generated successfully!"
+
 # List all objects in the token
 echo "[SoftHSM] Objects in token:"
 pkcs11-tool --module /usr/lib/softhsm/libsofthsm2.so \
@@ -0,0 +1,17 @@
+from __future__ import annotations
+
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+from shared.db import build_database_url, create_engine_from_env
+from shared.schema import verify_schema as _verify_schema
+
+DATABASE_URL = build_database_url(driver=None)
+
+engine = create_engine_from_env(DATABASE_URL, name="webhooks")
+SessionLocal = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False, future=True)
+
+Base = declarative_base()
+
+
+def verify_schema() -> str:
+    return _verify_schema(engine)
@@ -0,0 +1,307 @@
+"""Signed merchant webhook delivery with a concurrency cap per endpoint.
+
+Endpoints are configured in ``WEBHOOK_ENDPOINTS`` as JSON::
+
+    [{"name": "acme", "url": "https://hooks.acme.example/payments", "secret": "whsec_...", "concurrency": 8}]
+
+Each endpoint gets an :class:`EndpointDispatcher`. Its feeder claims due
+deliveries for that endpoint only into a queue of ``concurrency`` slots, and
+``concurrency`` sender tasks drain it. A slow or failing endpoint therefore
+fills its own queue and holds its own senders; the other endpoints keep
+claiming and sending at their own pace.
+
+Endpoints share one ``httpx.AsyncClient``. It negotiates HTTP/2 over TLS,
+so an endpoint's concurrent deliveries are streams on one connection. Its
+pool is sized to the sum of the caps, so an endpoint that only speaks
+HTTP/1.1 can hold a connection per slot without taking one from another.
+Endpoints that share an origin get separate connections (see :class:`Dispatcher`).
+
+Every POST carries the event id and an HMAC-SHA256 signature over the
+timestamp and the body, keyed with the endpoint's secret::
+
+    Webhook-Id: <event id>
+    Webhook-Signature: t=<unix seconds>,v1=<hex hmac of "<t>." + body>
+
+A 2xx response completes the delivery. Anything else is retried after an
+exponential backoff with full jitter, up to ``WEBHOOK_MAX_ATTEMPTS``.
+Delivery is at least once: receivers should deduplicate on ``Webhook-Id``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Protocol
+
+import httpx
+
+from shared.metrics import WEBHOOK_DELIVERIES, WEBHOOK_DELIVERY_SECONDS, WEBHOOK_QUEUED
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", "8"))
+TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_TIMEOUT_SECONDS", "10"))
+MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "8"))
+BACKOFF_BASE_SECONDS = float(os.getenv("WEBHOOK_BACKOFF_BASE_SECONDS", "5"))
+BACKOFF_MAX_SECONDS = float(os.getenv("WEBHOOK_BACKOFF_MAX_SECONDS", "3600"))
+# Claimed rows become due again after this long, so a crashed dispatcher's work is retried.
+LEASE_SECONDS = float(os.getenv("WEBHOOK_LEASE_SECONDS", "120"))
+POLL_SECONDS = float(os.getenv("WEBHOOK_POLL_SECONDS", "1"))
+
+SIGNATURE_HEADER = "Webhook-Signature"
+ID_HEADER = "Webhook-Id"
+# Longest error text kept on the delivery row.
+_ERROR_LIMIT = 500
+
+
+@dataclass(frozen=True)
+class Endpoint:
+    name: str
+    url: str
+    secret: str
+    concurrency: int = DEFAULT_CONCURRENCY
+    timeout: float = TIMEOUT_SECONDS
+
+
+@dataclass(frozen=True)
+class Delivery:
+    id: uuid.UUID
+    event_id: uuid.UUID
+    body: bytes
+    attempts: int
+
+
+class DeliveryStore(Protocol):
+    """Durable delivery state; the methods block and are called through ``asyncio.to_thread``."""
+
+    def claim(self, endpoint: str, limit: int, lease_seconds: float) -> list[Delivery]: ...
+
+    def delivered(self, delivery_id: uuid.UUID, attempts: int, status_code: int) -> None: ...
+
+    def retry(
+        self, delivery_id: uuid.UUID, attempts: int, delay: float, status_code: int | None, error: str
+    ) -> None: ...
+
+    def failed(self, delivery_id: uuid.UUID, attempts: int, status_code: int | None, error: str) -> None: ...
+
+
+def parse_endpoints(raw: str) -> list[Endpoint]:
+    if not raw.strip():
+        return []
+    endpoints = [
+        Endpoint(
+            name=str(item["name"]),
+            url=str(item["url"]),
+            secret=str(item["secret"]),
+            concurrency=int(item.get("concurrency", DEFAULT_CONCURRENCY)),
+            timeout=float(item.get("timeout", TIMEOUT_SECONDS)),
+        )
+        for item in json.loads(raw)
+    ]
+    names = [endpoint.name for endpoint in endpoints]
+    if len(set(names)) != len(names):
+        raise ValueError(f"duplicate webhook endpoint names in {names}")
+    for endpoint in endpoints:
+        if len(endpoint.name) > 64:
+            raise ValueError(f"webhook endpoint name {endpoint.name!r} is longer than 64 characters")
+        if endpoint.concurrency < 1:
+            raise ValueError(f"webhook endpoint {endpoint.name} needs a concurrency of at least 1")
+    return endpoints
+
+
+def sign(secret: str, timestamp: int, body: bytes) -> str:
+    """``Webhook-Signature`` value for ``body`` sent at ``timestamp``."""
+    digest = hmac.new(secret.encode("utf-8"), f"{timestamp}.".encode("ascii") + body, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+
+def verify(secret: str, header: str, body: bytes, tolerance: float = 300.0, now: float | None = None) -> bool:
+    """Receiver-side check of a ``Webhook-Signature`` header."""
+    try:
+        fields = dict(part.split("=", 1) for part in header.split(","))
+        timestamp = int(fields["t"])
+    except (KeyError, ValueError):
+        return False
+    if abs((time.time() if now is None else now) - timestamp) > tolerance:
+        return False
+    return hmac.compare_digest(sign(secret, timestamp, body), f"t={timestamp},v1={fields.get('v1', '')}")
+
+
+def backoff(attempts: int, base: float = BACKOFF_BASE_SECONDS, cap: float = BACKOFF_MAX_SECONDS) -> float:
+    """Delay before the next try after ``attempts`` failed ones: full jitter up to ``base * 2**(attempts-1)``."""
+    return random.uniform(0, min(cap, base * 2 ** (attempts - 1)))
+
+
+def webhook_client(total_concurrency: int, *, http1: bool = True) -> httpx.AsyncClient:
+    """Shared client for all endpoints. ``http1=False`` forces h2c on http:// URLs (local testing)."""
+    limits = httpx.Limits(max_connections=total_concurrency, max_keepalive_connections=total_concurrency)
+    return httpx.AsyncClient(http1=http1, http2=True, limits=limits, follow_redirects=False)
+
+
+class EndpointDispatcher:
+    """Claims and sends one endpoint's deliveries with at most ``concurrency`` in flight."""
+
+    def __init__(
+        self,
+        endpoint: Endpoint,
+        store: DeliveryStore,
+        client: httpx.AsyncClient,
+        *,
+        max_attempts: int = MAX_ATTEMPTS,
+        backoff_base: float = BACKOFF_BASE_SECONDS,
+        lease_seconds: float = LEASE_SECONDS,
+        poll_seconds: float = POLL_SECONDS,
+    ) -> None:
+        self.endpoint = endpoint
+        self.store = store
+        self.client = client
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self._queue: asyncio.Queue[Delivery] = asyncio.Queue(maxsize=endpoint.concurrency)
+        self._wake = asyncio.Event()
+        self._room = asyncio.Event()
+        self._observe = WEBHOOK_DELIVERY_SECONDS.labels(endpoint.name).observe
+        self._delivered = WEBHOOK_DELIVERIES.labels(endpoint.name, "delivered")
+        self._retried = WEBHOOK_DELIVERIES.labels(endpoint.name, "retry")
+        self._failed = WEBHOOK_DELIVERIES.labels(endpoint.name, "failed")
+        WEBHOOK_QUEUED.labels(endpoint.name).set_function(self._queue.qsize)
+
+    def wake(self) -> None:
+        """New deliveries were stored; claim now instead of at the next poll."""
+        self._wake.set()
+
+    async def run(self) -> None:
+        senders = [asyncio.create_task(self._send_loop()) for _ in range(self.endpoint.concurrency)]
+        try:
+            await self._feed()
+        finally:
+            for task in senders:
+                task.cancel()
+            await asyncio.gather(*senders, return_exceptions=True)
+
+    async def _feed(self) -> None:
+        while True:
+            # Cleared before measuring room, so a slot freed after this point sets it again.
+            self._room.clear()
+            room = self._queue.maxsize - self._queue.qsize()
+            claimed: list[Delivery] = []
+            if room:
+                try:
+                    claimed = await asyncio.to_thread(self.store.claim, self.endpoint.name, room, self.lease_seconds)
+                except Exception as exc:  # noqa: BLE001 - keep the feeder alive through database outages
+                    logger.error("[WEBHOOKS] Claim for %s failed: %s", self.endpoint.name, exc)
+            for delivery in claimed:
+                self._queue.put_nowait(delivery)
+            if room == 0 or (claimed and len(claimed) == room):
+                # More may be due; claim again as soon as a sender frees a slot.
+                await self._room.wait()
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def _send_loop(self) -> None:
+        while True:
+            delivery = await self._queue.get()
+            self._room.set()
+            try:
+                await self.deliver(delivery)
+            except Exception as exc:  # noqa: BLE001 - the lease expires and the row is claimed again
+                logger.error("[WEBHOOKS] Could not record delivery %s to %s: %s", delivery.id, self.endpoint.name, exc)
+
+    async def deliver(self, delivery: Delivery) -> None:
+        timestamp = int(time.time())
+        headers = {
+            "Content-Type": "application/json",
+            ID_HEADER: str(delivery.event_id),
+            SIGNATURE_HEADER: sign(self.endpoint.secret, timestamp, delivery.body),
+        }
+        status_code: int | None = None
+        start = time.perf_counter()
+        try:
+            response = await self.client.post(
+                self.endpoint.url, content=delivery.body, headers=headers, timeout=self.endpoint.timeout
+            )
+            status_code = response.status_code
+            error = "" if response.is_success else f"HTTP {status_code}"
+        except httpx.HTTPError as exc:
+            error = f"{type(exc).__name__}: {exc}"[:_ERROR_LIMIT]
+        self._observe(time.perf_counter() - start)
+
+        attempts = delivery.attempts + 1
+        if not error:
+            self._delivered.inc()
+            await asyncio.to_thread(self.store.delivered, delivery.id, attempts, status_code)
+        elif attempts >= self.max_attempts:
+            self._failed.inc()
+            logger.warning(
+                "[WEBHOOKS] Giving up on event %s for %s after %s attempts: %s",
+                delivery.event_id, self.endpoint.name, attempts, error,
+            )
+            await asyncio.to_thread(self.store.failed, delivery.id, attempts, status_code, error)
+        else:
+            self._retried.inc()
+            delay = backoff(attempts, self.backoff_base)
+            await asyncio.to_thread(self.store.retry, delivery.id, attempts, delay, status_code, error)
+
+
+class Dispatcher:
+    """Runs one :class:`EndpointDispatcher` per endpoint over a shared client.
+
+    The first endpoint on each origin uses the shared client. Further
+    endpoints on an origin already in use get a client of their own: streams
+    on one HTTP/2 connection are read through a single lock in httpcore, and
+    a slow endpoint's pending streams cut a fast one's throughput to a third
+    on the same connection (benchmarks/webhook_dispatch_bench.py).
+    """
+
+    def __init__(
+        self, endpoints: list[Endpoint], store: DeliveryStore, *, http1: bool = True, **options: float
+    ) -> None:
+        seen: set[tuple[str, str, int | None]] = set()
+        shared: list[Endpoint] = []
+        dedicated: list[Endpoint] = []
+        for endpoint in endpoints:
+            url = httpx.URL(endpoint.url)
+            origin = (url.scheme, url.host, url.port)
+            (dedicated if origin in seen else shared).append(endpoint)
+            seen.add(origin)
+        self.client = webhook_client(sum(endpoint.concurrency for endpoint in shared) or 1, http1=http1)
+        self._clients = [self.client]
+        self.endpoints: dict[str, EndpointDispatcher] = {}
+        for endpoint in endpoints:
+            client = self.client
+            if endpoint in dedicated:
+                client = webhook_client(endpoint.concurrency, http1=http1)
+                self._clients.append(client)
+            self.endpoints[endpoint.name] = EndpointDispatcher(endpoint, store, client, **options)
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    async def run(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        try:
+            await asyncio.gather(*(dispatcher.run() for dispatcher in self.endpoints.values()))
+        finally:
+            for client in self._clients:
+                await client.aclose()
+
+    def wake_threadsafe(self, names: list[str] | None = None) -> None:
+        """Called from the ingest thread after it commits new deliveries."""
+        if self._loop is None:
+            return
+        for name in names if names is not None else self.endpoints:
+            dispatcher = self.endpoints.get(name)
+            if dispatcher is not None:
+                self._loop.call_soon_threadsafe(dispatcher.wake)
@@ -0,0 +1,94 @@
+"""Delivery rows in ``webhook_deliveries``: enqueue per endpoint, claim with a lease, record results."""
+
+from __future__ import annotations
+
+import uuid
+from datetime import timedelta
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from database import SessionLocal
+from dispatcher import Delivery
+from models import DELIVERED, FAILED, PENDING, WebhookDelivery
+
+
+class PostgresDeliveryStore:
+    def enqueue(self, events: list[tuple[uuid.UUID, str, bytes]], endpoints: list[str]) -> int:
+        """Insert one row per event and endpoint in one statement; returns how many were new."""
+        rows = [
+            {"id": uuid.uuid4(), "endpoint": endpoint, "event_id": event_id, "event_type": event_type,
+             "body": body.decode("utf-8"), "next_attempt_at": func.now()}
+            for event_id, event_type, body in events
+            for endpoint in endpoints
+        ]
+        if not rows:
+            return 0
+        # A redelivered event message finds its rows already there.
+        statement = (
+            insert(WebhookDelivery)
+            .values(rows)
+            .on_conflict_do_nothing(constraint="uq_webhook_deliveries_endpoint_event")
+            .returning(WebhookDelivery.id)
+        )
+        with SessionLocal() as session:
+            inserted = len(session.execute(statement).all())
+            session.commit()
+        return inserted
+
+    def claim(self, endpoint: str, limit: int, lease_seconds: float) -> list[Delivery]:
+        due = (
+            select(WebhookDelivery.id)
+            .where(
+                WebhookDelivery.endpoint == endpoint,
+                WebhookDelivery.status == PENDING,
+                WebhookDelivery.next_attempt_at <= func.now(),
+            )
+            .order_by(WebhookDelivery.next_attempt_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        # Pushing next_attempt_at out is the lease: if this process dies, the rows come due again.
+        statement = (
+            update(WebhookDelivery)
+            .where(WebhookDelivery.id.in_(due))
+            .values(next_attempt_at=func.now() + timedelta(seconds=lease_seconds))
+            .returning(WebhookDelivery.id, WebhookDelivery.event_id, WebhookDelivery.body, WebhookDelivery.attempts)
+            .execution_options(synchronize_session=False)
+        )
+        with SessionLocal() as session:
+            rows = session.execute(statement).all()
+            session.commit()
+        return [Delivery(row.id, row.event_id, row.body.encode("utf-8"), row.attempts) for row in rows]
+
+    def delivered(self, delivery_id: uuid.UUID, attempts: int, status_code: int) -> None:
+        self._finish(
+            delivery_id, status=DELIVERED, attempts=attempts, last_status_code=status_code, last_error=None,
+            finished_at=func.now(),
+        )
+
+    def retry(
+        self, delivery_id: uuid.UUID, attempts: int, delay: float, status_code: int | None, error: str
+    ) -> None:
+        self._finish(
+            delivery_id, attempts=attempts, last_status_code=status_code, last_error=error,
+            next_attempt_at=func.now() + timedelta(seconds=delay),
+        )
+
+    def failed(self, delivery_id: uuid.UUID, attempts: int, status_code: int | None, error: str) -> None:
+        self._finish(
+            delivery_id, status=FAILED, attempts=attempts, last_status_code=status_code, last_error=error,
+            finished_at=func.now(),
+        )
+
+    def _finish(self, delivery_id: uuid.UUID, **values: object) -> None:
+        statement = (
+            update(WebhookDelivery)
+            .where(WebhookDelivery.id == delivery_id, WebhookDelivery.status == PENDING)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        with SessionLocal() as session:
+            session.execute(statement)
+            session.commit()